@@ -0,0 +1,134 @@
+"""Long-range history benchmark: a 21-day chart from raw rows vs from rollups.
+
+A temporary local store is filled with `--days` of one sample every
+`--interval` seconds, stored uncompressed (the worst case for the raw
+history), with the rollups built from the same samples as the backend does.
+Then /api/history is timed through the Flask test client for the same
+range three ways: raw rows, the series reconstructed every `step` seconds
+and rollups chosen by a point budget (`points`).
+
+    python benchmarks/history.py --days 21 --interval 4
+    python benchmarks/history.py --output new.json --baseline history-results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH = 10000
+
+
+def fill(store, rollups, start, days, interval):
+    flags = {'heater': False, 'fan': False, 'hum': False, 'motor': False}
+    samples = []
+    count = int(days * 86400 / interval)
+    for i in range(count):
+        t = start + i * interval
+        temperature = 37.5 + 0.4 * random.random()
+        humidity = 55 + 3 * random.random()
+        flags['heater'] = temperature < 37.7
+        samples.append({'timestamp': t, 'temperature': temperature, 'humidity': humidity, 'device': rollups.device})
+        rollups.add(t, temperature, humidity, flags)
+        if len(samples) == BATCH:
+            store.insert_many(samples)
+            samples = []
+    store.insert_many(samples)
+    rollups.flush()
+    return count
+
+
+def timed(client, query, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        response = client.get(query)
+        body = response.get_json()
+        times.append(time.perf_counter() - t0)
+    assert response.status_code == 200, body
+    return {'rows': body['count'], 'resolution': body.get('resolution'), 'bytes': len(response.data),
+            'ms': {'min': round(min(times) * 1000, 2), 'median': round(statistics.median(times) * 1000, 2),
+                   'max': round(max(times) * 1000, 2)}}
+
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(output, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for name, result in output['queries'].items():
+        old = baseline.get('queries', {}).get(name)
+        if old:
+            print(f"{name:8}: {old['ms']['median']} ms -> {result['ms']['median']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-range /api/history benchmark (raw rows vs rollups)')
+    parser.add_argument('--days', type=float, default=21)
+    parser.add_argument('--interval', type=float, default=4, help='seconds between samples')
+    parser.add_argument('--points', type=int, default=500, help='point budget of the rollup query')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='history-results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare with')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='history-bench-')
+    os.environ['INCUBATOR_DATA_DIR'] = data_dir
+    os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    sys.path.insert(0, SERVER_DIR)
+    from app import app
+    from utils.local_store import get_store
+    from utils.rollups import Rollups
+
+    # The bench device is not in the registry, so no open bucket is merged in: everything was flushed
+    device = 'bench'
+    end = time.time()
+    end -= end % 3600
+    start = end - args.days * 86400
+    t0 = time.perf_counter()
+    count = fill(get_store(), Rollups(device, get_store), start, args.days, args.interval)
+    print(f"\033[94m[BENCH] {count} samples stored and rolled up in {time.perf_counter() - t0:.1f} s\033[0m", flush=True)
+
+    client = app.test_client()
+    base = f'/api/history?device={device}&from={start}&to={end}'
+    step = (end - start) / args.points
+    queries = {
+        'raw': timed(client, base, args.runs),
+        'step': timed(client, f'{base}&step={step}', args.runs),
+        'rollups': timed(client, f'{base}&points={args.points}', args.runs),
+    }
+    for name, result in queries.items():
+        print(f"{name:8}: {result['ms']['median']:9.2f} ms  {result['rows']:6} rows  {result['bytes'] / 1024:8.0f} KiB")
+
+    output = {
+        'benchmark': 'history',
+        'version': version(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'days': args.days, 'interval': args.interval, 'points': args.points, 'runs': args.runs,
+                   'samples': count},
+        'queries': queries,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\033[92m[BENCH] Results written to {args.output}\033[0m")
+    if args.baseline:
+        compare(output, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
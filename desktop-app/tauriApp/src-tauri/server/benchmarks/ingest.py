@@ -0,0 +1,365 @@
+"""End-to-end ingestion benchmark.
+
+The backend runs in a child process with its real pipeline: serial port
+manager, frame parser, device publish, automatic controller, batched
+Supabase writer. This process plays everything around it:
+- a pseudo-terminal board that streams numbered samples at increasing rates
+  and records the actuator commands it receives;
+- a local stand-in for the Supabase REST API that records every inserted row.
+
+For each rate it reports sustained throughput, sample -> persisted row and
+reading -> actuator command latency (p50/p99/max), and the backend's CPU and
+memory. Results go to a JSON file; `--baseline` compares against an older one.
+
+    python benchmarks/ingest.py --rates 50,500,2000 --duration 10
+    python benchmarks/ingest.py --baseline old.json --output new.json
+"""
+import argparse
+import json
+import os
+import platform
+import pty
+import queue
+import resource
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from utils.frames import encode_sample
+
+TARGET_TEMP = 37.5
+TOGGLES_PER_SECOND = 4  # temperature crossings that make the controller switch the heater
+DRAIN_TIMEOUT = 30.0
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0, 'p50': None, 'p99': None, 'max': None}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'count': len(values), 'p50': round(pick(0.50) * 1000, 3), 'p99': round(pick(0.99) * 1000, 3),
+            'max': round(values[-1] * 1000, 3)}
+
+
+class RestStandIn:
+    """Just enough of PostgREST for the writer and the egg preset cache."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rows = []  # (received at, row)
+        self.inserts = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.startswith('/rest/v1/egg_info'):
+                    return self._reply(200, [{'egg_type': 'quail', 'target_temp': TARGET_TEMP, 'target_hum': 55}])
+                self._reply(200, [])
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'[]')
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                received = time.time()
+                rows = body if isinstance(body, list) else [body]
+                with stand_in._lock:
+                    stand_in.rows.extend((received, row) for row in rows)
+                    stand_in.inserts += 1
+                self._reply(201, [])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self):
+        with self._lock:
+            return len(self.rows)
+
+
+class Board:
+    """Pseudo-terminal board sending `temperature|humidity|sequence` samples."""
+
+    def __init__(self, binary=False):
+        self.binary = binary
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self.emitted = []   # wall time per sequence number
+        self.crossings = []  # (sequence, heater state the controller should pick)
+        self.commands = []  # (received at, command)
+        threading.Thread(target=self._read_commands, daemon=True).start()
+
+    def _read_commands(self):
+        while True:
+            select.select([self.master], [], [])
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            now = time.time()
+            for i in range(0, len(data) - 1, 2):
+                self.commands.append((now, data[i:i + 2].decode('ascii', errors='replace')))
+
+    def stream(self, rate, duration):
+        period = max(1, int(rate / TOGGLES_PER_SECOND))
+        started = time.perf_counter()
+        total = int(rate * duration)
+        seq = 0
+        while seq < total:
+            due = min(total, int((time.perf_counter() - started) * rate) + 1)
+            chunk = []
+            now = time.time()
+            while seq < due:
+                # Alternate well below / above the band so the heater has to switch
+                hot = (seq // period) % 2 == 1
+                if seq % period == 0:
+                    self.crossings.append((seq, not hot))
+                temperature = TARGET_TEMP + (1.5 if hot else -1.5)
+                if self.binary:
+                    chunk.append(encode_sample((temperature, 55.0, float(seq))))
+                else:
+                    chunk.append(b'%.2f|55.00|%d\n' % (temperature, seq))
+                self.emitted.append(now)
+                seq += 1
+            if chunk:
+                os.write(self.master, b''.join(chunk))
+            time.sleep(0.001)
+
+
+def command_latencies(board):
+    latencies = []
+    commands = [(t, c) for t, c in board.commands if c[0] == 'H']
+    j = 0
+    for i, (seq, heater_on) in enumerate(board.crossings):
+        emitted = board.emitted[seq]
+        until = board.emitted[board.crossings[i + 1][0]] if i + 1 < len(board.crossings) else float('inf')
+        wanted = 'H1' if heater_on else 'H0'
+        while j < len(commands) and commands[j][0] < emitted:
+            j += 1
+        k = j
+        while k < len(commands) and commands[k][0] < until:
+            if commands[k][1] == wanted:
+                latencies.append(commands[k][0] - emitted)
+                break
+            k += 1
+    return latencies
+
+
+def run_rate(rate, duration, binary, rest_latency, compression=True):
+    rest = RestStandIn(rest_latency)
+    board = Board(binary)
+    data_dir = tempfile.mkdtemp(prefix='bench-ingest-')
+    stamps_path = os.path.join(data_dir, 'stamps.json')
+    env = dict(os.environ, SUPABASE_URL=rest.url, INCUBATOR_DATA_DIR=data_dir, PYTHONPATH=SERVER_DIR,
+               BENCH_COMPRESSION='on' if compression else 'off')
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--worker', board.port, stamps_path],
+        cwd=SERVER_DIR, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    # The backend logs to stdout too: keep draining it so the child never blocks on a full pipe
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in child.stdout], daemon=True).start()
+    next_line = lambda prefix: next(line for line in iter(lambda: lines.get(timeout=DRAIN_TIMEOUT), None) if line.startswith(prefix))
+    try:
+        next_line('ready')
+    except queue.Empty:
+        child.kill()
+        raise RuntimeError('backend worker did not get ready')
+
+    started = time.time()
+    board.stream(rate, duration)
+    elapsed = time.time() - started
+    child.stdin.write('stop\n')
+    child.stdin.flush()
+    report = json.loads(next_line('{'))
+    child.wait(timeout=DRAIN_TIMEOUT)
+
+    with open(stamps_path) as f:
+        published = {created_at: seq for seq, created_at in json.load(f)}
+    to_publish = [datetime.fromisoformat(created_at).timestamp() - board.emitted[seq]
+                  for created_at, seq in published.items() if seq < len(board.emitted)]
+    persisted = []
+    for received, row in list(rest.rows):
+        seq = published.get(row.get('created_at'))
+        if seq is not None and seq < len(board.emitted):
+            persisted.append(received - board.emitted[seq])
+    emitted = len(board.emitted)
+    rest.server.shutdown()
+    os.close(board.master)
+    return {
+        'rate': rate,
+        'duration': round(elapsed, 3),
+        'emitted': emitted,
+        'published': len(published),
+        'persisted': rest.count(),
+        'spilled': report['writer']['spilled_rows'],
+        'inserts': rest.inserts,
+        'throughput': {
+            'emitted_per_s': round(emitted / elapsed, 1),
+            'published_per_s': round(len(published) / elapsed, 1),
+            'persisted_per_s': round(rest.count() / elapsed, 1),
+        },
+        'latency_ms': {
+            'serial_to_publish': percentiles(to_publish),
+            'controller_decision': report['decision_latency'],
+            'sample_to_persisted': percentiles(persisted),
+            'reading_to_command': percentiles(command_latencies(board)),
+        },
+        'cpu_percent': report['cpu_percent'],
+        'rss_mb': report['rss_mb'],
+        'max_rss_mb': report['max_rss_mb'],
+        'frames': report['frames'],
+        'compression': report['compression'],
+    }
+
+
+def worker(port, stamps_path):
+    """The backend under test; prints 'ready', runs until 'stop', then one JSON report."""
+    from utils.devices import registry
+    from utils.frames import channel_name
+    from utils.sensor_writer import get_writer
+    from utils.serial_port import find_port_manager
+    from utils.supervisor import supervisor
+    from utils.sensor_writer import to_row
+
+    seq_channel = channel_name(2)
+    stamps = []
+
+    def record(sample):
+        seq = sample.get(seq_channel)
+        if seq is not None:
+            stamps.append((int(seq), to_row(sample)['created_at']))
+
+    device = registry.get()
+    device.egg_type = 'quail'
+    settings = {'connectionType': 'serial', 'serialPort': port, 'baudRate': 115200}
+    if os.environ.get('BENCH_COMPRESSION') == 'off':
+        settings['compression'] = {'enabled': False}  # every sample is persisted
+    device.configure(settings)
+    device.add_listener(record)
+    supervisor.apply(device)
+    while not device.auto_running() or not device.connected:
+        time.sleep(0.05)
+    time.sleep(0.5)  # controller has loaded its targets
+
+    wall, cpu = time.time(), time.process_time()
+    print('ready', flush=True)
+    sys.stdin.readline()
+    cpu_percent = 100.0 * (time.process_time() - cpu) / (time.time() - wall)
+    rss = int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 2 ** 20 if os.path.exists('/proc/self/statm') else None
+
+    deadline = time.time() + DRAIN_TIMEOUT
+    writer = get_writer()
+    while writer.stats()['queue_depth'] and time.time() < deadline:
+        time.sleep(0.1)
+    manager = find_port_manager(port)
+    frames = manager.stats() if manager else None
+    auto = device.auto.stats() if device.auto else {}
+    supervisor.shutdown()  # flushes the writer's last batch
+
+    with open(stamps_path, 'w') as f:
+        json.dump(stamps, f)
+    print(json.dumps({
+        'cpu_percent': round(cpu_percent, 1),
+        'rss_mb': None if rss is None else round(rss, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'writer': writer.stats(),
+        'frames': frames,
+        'compression': {k: v for k, v in device.compression_stats().items() if k != 'channels'},
+        'decision_latency': {
+            'p50': None if auto.get('p50_latency') is None else round(auto['p50_latency'] * 1000, 3),
+            'max': None if auto.get('max_latency') is None else round(auto['max_latency'] * 1000, 3),
+        },
+    }), flush=True)
+
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r['rate']: r for r in json.load(f)['results']}
+    print(f"\n{'rate':>7} {'persisted/s':>20} {'persist p99 ms':>22} {'command p99 ms':>22} {'cpu %':>16}")
+    for r in results:
+        b = baseline.get(r['rate'])
+        if b is None:
+            continue
+        cell = lambda new, old: f'{old} -> {new}'
+        print(f"{r['rate']:>7} {cell(r['throughput']['persisted_per_s'], b['throughput']['persisted_per_s']):>20} "
+              f"{cell(r['latency_ms']['sample_to_persisted']['p99'], b['latency_ms']['sample_to_persisted']['p99']):>22} "
+              f"{cell(r['latency_ms']['reading_to_command']['p99'], b['latency_ms']['reading_to_command']['p99']):>22} "
+              f"{cell(r['cpu_percent'], b['cpu_percent']):>16}")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        return worker(sys.argv[2], sys.argv[3])
+
+    parser = argparse.ArgumentParser(description='End-to-end ingestion benchmark (serial -> controller / Supabase)')
+    parser.add_argument('--rates', default='10,100,1000', help='comma separated samples per second')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of streaming per rate')
+    parser.add_argument('--binary', action='store_true', help='stream binary frames instead of text lines')
+    parser.add_argument('--no-compression', action='store_true', help='persist every sample (raw write path)')
+    parser.add_argument('--rest-latency', type=float, default=0.0, help='seconds the Supabase stand-in takes per insert')
+    parser.add_argument('--output', default='ingest-results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare with')
+    args = parser.parse_args()
+
+    results = []
+    for rate in [float(r) for r in args.rates.split(',')]:
+        print(f"\033[94m[BENCH] {rate:g} samples/s for {args.duration:g} s\033[0m", flush=True)
+        result = run_rate(rate, args.duration, args.binary, args.rest_latency, not args.no_compression)
+        results.append(result)
+        print(f"  persisted {result['throughput']['persisted_per_s']}/s, "
+              f"persist p50/p99 {result['latency_ms']['sample_to_persisted']['p50']}/{result['latency_ms']['sample_to_persisted']['p99']} ms, "
+              f"command p50/p99 {result['latency_ms']['reading_to_command']['p50']}/{result['latency_ms']['reading_to_command']['p99']} ms, "
+              f"cpu {result['cpu_percent']} %", flush=True)
+
+    output = {
+        'benchmark': 'ingest',
+        'version': version(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'duration': args.duration, 'binary': args.binary, 'rest_latency': args.rest_latency,
+                   'compression': not args.no_compression},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\033[92m[BENCH] Results written to {args.output}\033[0m")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Cold-start benchmark: process spawn -> first successful /api/ready.
+
+Each run starts `app.py --server async` the way the desktop shell does and
+polls /api/ready until it answers 200, then reads the backend's own phase
+timeline from it. `--cold-cache` gives every run an empty bytecode cache
+(first launch after an install or update) and `--first-run` starts without
+an egg profile snapshot. The report also lists the
+slowest imports from `python -X importtime`.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --cold-cache --output new.json --baseline startup-results.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT = 30.0
+POLL_INTERVAL = 0.01
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def backend_env(cache_dir=None, first_run=False):
+    env = dict(os.environ)
+    env['INCUBATOR_DATA_DIR'] = tempfile.mkdtemp(prefix='startup-data-')
+    if not first_run:
+        # Any launch after the first has an egg profile snapshot to serve
+        with open(os.path.join(env['INCUBATOR_DATA_DIR'], 'egg_profiles.json'), 'w') as f:
+            json.dump({}, f)
+    # Unreachable on purpose: the measurement must not depend on the network
+    env.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    if cache_dir:
+        env['PYTHONPYCACHEPREFIX'] = cache_dir
+    return env
+
+
+def get_ready(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1.0)
+    try:
+        connection.request('GET', '/api/ready')
+        response = connection.getresponse()
+        body = response.read()
+        return json.loads(body) if response.status == 200 else None
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+
+def cold_start(cold_cache, first_run):
+    port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix='startup-pycache-') if cold_cache else None
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py', '--server', 'async', '--host', '127.0.0.1', '--port', str(port)],
+                               cwd=SERVER_DIR, env=backend_env(cache_dir, first_run),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < READY_TIMEOUT:
+            report = get_ready(port)
+            if report is not None:
+                return {'ready_s': round(time.perf_counter() - started, 4), 'phases': report['phases']}
+            if process.poll() is not None:
+                raise RuntimeError(f'backend exited with {process.returncode}')
+            time.sleep(POLL_INTERVAL)
+        raise RuntimeError(f'backend not ready after {READY_TIMEOUT} s')
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def import_profile(top):
+    """Slowest modules when importing app, by cumulative and by own time (milliseconds)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=SERVER_DIR,
+                            env=backend_env(), capture_output=True, text=True, timeout=120)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append({'module': name, 'depth': len(indent) // 2, 'self_ms': int(own) / 1000,
+                            'cumulative_ms': int(cumulative) / 1000})
+    total = next((m['cumulative_ms'] for m in modules if m['module'] == 'app'), None)
+    # Direct imports of app show where the time goes; deeper ones are the individual culprits
+    direct = sorted((m for m in modules if m['depth'] == 1), key=lambda m: -m['cumulative_ms'])
+    own = sorted(modules, key=lambda m: -m['self_ms'])
+    return {'total_ms': total, 'by_app_import': direct[:top], 'by_self_time': own[:top]}
+
+
+def summary(values):
+    return {'min': min(values), 'median': round(statistics.median(values), 4), 'max': max(values)}
+
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(output, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old, new = baseline['ready_s'], output['ready_s']
+    print(f"\nready (median): {old['median']} s -> {new['median']} s ({(new['median'] - old['median']) * 1000:+.0f} ms)")
+    if baseline.get('imports', {}).get('total_ms') and output['imports']['total_ms']:
+        print(f"import app:     {baseline['imports']['total_ms']:.0f} ms -> {output['imports']['total_ms']:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend cold-start benchmark (spawn -> /api/ready)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cold-cache', action='store_true', help='empty bytecode cache for every run')
+    parser.add_argument('--first-run', action='store_true', help='no egg profile snapshot yet (first launch)')
+    parser.add_argument('--top', type=int, default=10, help='imports listed in the profile')
+    parser.add_argument('--output', default='startup-results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare with')
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        run = cold_start(args.cold_cache, args.first_run)
+        runs.append(run)
+        print(f"\033[94m[BENCH] run {i + 1}: ready after {run['ready_s'] * 1000:.0f} ms "
+              f"(imports done at {run['phases'].get('imports', 0) * 1000:.0f} ms)\033[0m", flush=True)
+    imports = import_profile(args.top)
+    print(f"\nimport app: {imports['total_ms']:.0f} ms")
+    for m in imports['by_app_import']:
+        print(f"  {m['cumulative_ms']:8.1f} ms  {m['module']}")
+
+    output = {
+        'benchmark': 'startup',
+        'version': version(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'runs': args.runs, 'cold_cache': args.cold_cache, 'first_run': args.first_run},
+        'ready_s': summary([r['ready_s'] for r in runs]),
+        'runs': runs,
+        'imports': imports,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\033[92m[BENCH] Results written to {args.output}\033[0m")
+    if args.baseline:
+        compare(output, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
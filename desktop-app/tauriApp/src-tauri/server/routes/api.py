@@ -1,12 +1,221 @@
 
-from flask import Blueprint, jsonify
-from utils.serial_reader import get_latest_data
+import time
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request
+from utils.local_store import get_store, MAX_ROWS
+from utils.devices import DEFAULT_DEVICE, registry
+from utils.ring_buffer import columns_to_json
+from utils.egg_profiles import egg_profiles
+from utils import supervision_log
+from utils.compression import CHANNELS, MAX_GAP, reconstruct
+from utils.scheduler import scheduler
+from utils.state_store import state_store
+from utils.rollups import RESOLUTIONS, choose_resolution, merge, to_point
 
 api = Blueprint('api', __name__)
 
+
+def parse_time(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+MAX_WAIT = 30.0  # seconds /api/data/next holds a request
+
+
 @api.route('/api/data')
 def get_data():
-    data = get_latest_data()
-    if not data:
+    snapshot = state_store.latest(request.args.get('device') or DEFAULT_DEVICE)
+    if snapshot is None:
+        return jsonify({"error": "No data received yet"}), 204
+    return jsonify(snapshot.as_json())
+
+
+def wait_params(args):
+    # (after, device, timeout) of a /api/data/next request; raises ValueError
+    after = int(args.get('after', 0))
+    timeout = min(float(args.get('timeout', MAX_WAIT)), MAX_WAIT)
+    return after, args.get('device') or DEFAULT_DEVICE, timeout
+
+
+@api.route('/api/data/next')
+def get_next_data():
+    # Long poll: the first sample with a seq above `after`, or 204 once `timeout` passes
+    try:
+        after, device_id, timeout = wait_params(request.args)
+    except ValueError:
+        return jsonify({"error": "after must be an integer and timeout a number"}), 400
+    snapshot = state_store.wait(after, device_id, timeout)
+    if snapshot is None:
+        return jsonify({"error": "No newer data"}), 204
+    return jsonify(snapshot.as_json())
+
+
+@api.route('/api/data/latest')
+def get_latest():
+    device = registry.find(request.args.get('device') or DEFAULT_DEVICE)
+    latest = device.recent.latest() if device else None
+    if latest is None:
         return jsonify({"error": "No data received yet"}), 204
-    return jsonify(data)
+    return jsonify(latest)
+
+
+@api.route('/api/data/recent')
+def get_recent():
+    # Either the last n samples or the last `seconds` seconds, from the in-memory ring
+    device = registry.find(request.args.get('device') or DEFAULT_DEVICE)
+    if device is None:
+        return jsonify(columns_to_json(([], [], [])))
+    try:
+        if request.args.get('seconds'):
+            newest = device.recent.latest()
+            end = newest['timestamp'] if newest else 0.0
+            columns = device.recent.since(end - float(request.args['seconds']))
+        else:
+            columns = device.recent.last(int(request.args.get('n', 60)))
+    except ValueError:
+        return jsonify({"error": "n must be an integer and seconds a number"}), 400
+    return jsonify(columns_to_json(columns))
+
+
+@api.route('/api/analytics')
+def get_analytics():
+    device = registry.find(request.args.get('device') or DEFAULT_DEVICE)
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify(device.analytics.summary())
+
+
+@api.route('/api/eggProfiles')
+def get_egg_profiles():
+    profiles = egg_profiles.all()
+    if not profiles:
+        return egg_profiles_unavailable()
+    return jsonify({"profiles": profiles, "cache": egg_profiles.stats()})
+
+
+@api.route('/api/eggProfiles/<egg>')
+def get_egg_profile(egg):
+    profile = egg_profiles.get(egg)
+    if not profile:
+        if not egg_profiles.all():
+            return egg_profiles_unavailable()
+        return jsonify({"error": f"Unknown egg type {egg}"}), 404
+    return jsonify(profile)
+
+
+def egg_profiles_unavailable():
+    # No snapshot and Supabase has not answered yet: the refresh runs in the background, try again shortly
+    stats = egg_profiles.stats()
+    status = 'loading' if stats['loading'] else 'unavailable'
+    response = jsonify({"status": status, "profiles": [], "cache": stats})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+
+@api.route('/api/supervision')
+def get_supervision():
+    # Samples with actuator states from the binary supervision log
+    device_id = request.args.get('device') or DEFAULT_DEVICE
+    try:
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        limit = min(int(request.args.get('limit', MAX_ROWS)), MAX_ROWS)
+    except ValueError:
+        return jsonify({"error": "from/to must be epoch seconds or ISO dates, limit an integer"}), 400
+    device = registry.find(device_id)
+    if device is not None:
+        device.supervision.flush()
+    records = supervision_log.read(supervision_log.log_dir(device_id), start, end, limit)
+    return jsonify(supervision_log.to_json(records))
+
+
+def rollup_history(device_id, start, end, limit, resolution, points):
+    # `resolution` (seconds) as asked, or the finest that keeps the range within `points`
+    end = time.time() if end is None else end
+    start = end - 86400 if start is None else start
+    store = get_store()
+    if resolution is None:
+        raw_count = store.count(start, end, device_id, points + 1)
+        resolution = choose_resolution(end - start, points, raw_count)
+    if resolution == 0:
+        rows = store.query(start, end, limit, device_id)
+        return jsonify({"count": len(rows), "resolution": 0, "data": rows})
+    rows = store.query_rollups(resolution, start, end, limit, device_id)
+    device = registry.find(device_id)
+    if device is not None:
+        # The open bucket is still in memory; a stored partial one (before a restart) merges with it
+        for row in device.rollups.open_rows(resolution, start, end):
+            if rows and rows[-1]['bucket'] == row['bucket']:
+                rows[-1] = merge(rows[-1], row)
+            elif len(rows) < limit:
+                rows.append(row)
+    return jsonify({"count": len(rows), "resolution": resolution, "data": [to_point(row) for row in rows]})
+
+
+@api.route('/api/history')
+def get_history():
+    # Stored (compressed) points; with `step`, the series reconstructed every `step` seconds;
+    # with `points` or `resolution`, rollups (min/max/mean/count and duty cycles per bucket)
+    device_id = request.args.get('device') or DEFAULT_DEVICE
+    try:
+        start = parse_time(request.args.get('from'))
+        end = parse_time(request.args.get('to'))
+        limit = min(int(request.args.get('limit', MAX_ROWS)), MAX_ROWS)
+        step = float(request.args['step']) if request.args.get('step') else None
+        points = int(request.args['points']) if request.args.get('points') else None
+        resolution = int(request.args['resolution']) if request.args.get('resolution') else None
+    except ValueError:
+        return jsonify({"error": "from/to must be epoch seconds or ISO-8601 timestamps, step a number, points and resolution integers"}), 400
+    if resolution is not None and resolution not in (0,) + RESOLUTIONS:
+        return jsonify({"error": f"resolution must be 0 (raw) or one of {', '.join(map(str, RESOLUTIONS))}"}), 400
+    if points is not None and points <= 0:
+        return jsonify({"error": "points must be a positive integer"}), 400
+    if step is None and (points is not None or resolution is not None):
+        return rollup_history(device_id, start, end, limit, resolution, points)
+    if step is None:
+        rows = get_store().query(start, end, limit, device_id)
+        return jsonify({"count": len(rows), "data": rows})
+    if step <= 0:
+        return jsonify({"error": "step must be a positive number of seconds"}), 400
+    device = registry.find(device_id)
+    compressor = device.compressor if device is not None else None
+    channels = compressor.channels if compressor else CHANNELS
+    # Stored points are at most max_gap apart: widen the query so both ends can be interpolated
+    margin = compressor.max_gap if compressor else MAX_GAP
+    rows = get_store().query(None if start is None else start - margin, None if end is None else end + margin, limit, device_id)
+    times = []
+    if rows:
+        first = rows[0]['timestamp'] if start is None else max(start, rows[0]['timestamp'])
+        last = rows[-1]['timestamp'] if end is None else min(end, rows[-1]['timestamp'])
+        count = min(MAX_ROWS, int((last - first) // step) + 1)
+        times = [first + i * step for i in range(count)]
+    return jsonify({"count": len(times), "stored": len(rows), "data": reconstruct(rows, times, channels)})
+
+
+@api.route('/api/compression')
+def get_compression():
+    device = registry.find(request.args.get('device') or DEFAULT_DEVICE)
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify(device.compression_stats())
+
+
+@api.route('/api/actuators')
+def get_actuators():
+    # Desired vs confirmed actuator state; `pending` is what is still on its way to the board
+    device = registry.find(request.args.get('device') or DEFAULT_DEVICE)
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify(device.actuators.stats())
+
+
+@api.route('/api/schedule')
+def get_schedule():
+    # Rotation and ventilation jobs with their next run (epoch seconds), all devices without ?device=
+    return jsonify({"jobs": scheduler.jobs(request.args.get('device')), "scheduler": scheduler.stats()})
@@ -0,0 +1,303 @@
+"""Hardware stand-in: a fake incubator for running the backend without a board.
+
+It exposes a pseudo-terminal serial port and an HTTP `/sensor` endpoint,
+accepts the M/H/F/C actuator commands on both, and streams either a
+replayed log (`incubator_log.csv` or a timestamp,temperature,humidity CSV)
+or a deterministic synthetic incubator at any rate.
+
+    python standin.py --replay ../../../../incubator_log.csv --speed 10
+    python standin.py --rate 500 --binary --http-port 0
+
+Point the app at the printed serial port, or at http://localhost:5001/sensor.
+The pseudo-terminal needs a POSIX system; on Windows use --serial off and
+the HTTP source (or a virtual COM pair).
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import random
+import re
+import select
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.frames import FRAME_ACK, encode_frame, encode_sample
+
+ACTUATORS = {b'M': 'motor', b'H': 'heater', b'F': 'fan', b'C': 'hum'}
+COMMAND = re.compile(rb'([MHFC])([01])')
+
+MAX_BATCH = 1000  # samples written to the port in one go when running behind
+
+
+class Incubator:
+    """Actuator state driven by the commands, plus the last emitted sample."""
+
+    def __init__(self):
+        self.actuators = {name: False for name in ACTUATORS.values()}
+        self.latest = None
+        self.commands = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def command(self, payload):
+        applied = []
+        for letter, on in COMMAND.findall(payload):
+            with self._lock:
+                self.actuators[ACTUATORS[letter]] = on == b'1'
+                self.commands += 1
+            applied.append(letter + on)
+        return applied
+
+    def emitted(self, sample):
+        with self._lock:
+            self.latest = sample
+            self.samples += 1
+
+    def state(self):
+        with self._lock:
+            return {'actuators': dict(self.actuators), 'latest': self.latest,
+                    'commands': self.commands, 'samples': self.samples}
+
+
+class SyntheticSource:
+    """Deterministic first-order incubator model; same seed, same stream.
+
+    Temperature relaxes towards the room and rises while the heater is on,
+    the fan cools and dries, the humidifier valve adds moisture.
+    """
+
+    def __init__(self, incubator, rate=1.0, seed=0, noise=0.03, start=(36.5, 55.0)):
+        self.incubator = incubator
+        self.rate = rate
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.temperature, self.humidity = start
+
+    def __iter__(self):
+        dt = 1.0 / self.rate
+        while True:
+            on = self.incubator.actuators
+            self.temperature += dt * ((25.0 - self.temperature) / 900.0 + 0.02 * on['heater'] - 0.01 * on['fan'])
+            self.humidity += dt * ((45.0 - self.humidity) / 1200.0 + 0.05 * on['hum'] - 0.03 * on['fan'])
+            self.humidity = min(100.0, max(0.0, self.humidity))
+            yield dt, {
+                'temperature': round(self.temperature + self.random.gauss(0.0, self.noise), 2),
+                'humidity': round(self.humidity + self.random.gauss(0.0, self.noise * 5), 2),
+            }
+
+
+class ReplaySource:
+    """Samples of a recorded log, paced by their timestamps (or `interval`) / `speed`."""
+
+    def __init__(self, path, speed=1.0, interval=4.0, loop=False):
+        self.speed = speed
+        self.interval = interval
+        self.loop = loop
+        self.rows = load_log(path)
+        if not self.rows:
+            raise ValueError(f'no samples in {path}')
+
+    def __iter__(self):
+        while True:
+            previous = None
+            for timestamp, sample in self.rows:
+                if timestamp is None or previous is None:
+                    delay = self.interval
+                else:
+                    delay = max(0.0, timestamp - previous)
+                previous = timestamp
+                yield delay / self.speed, sample
+            if not self.loop:
+                return
+
+
+def load_log(path):
+    """(timestamp or None, sample) rows from either log format."""
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        if 'temperature' in first and not first.startswith('SUPERVISION'):
+            for row in csv.DictReader(f):
+                timestamp = row.get('timestamp') or row.get('ts')
+                rows.append((float(timestamp) if timestamp else None,
+                             {'temperature': float(row['temperature']), 'humidity': float(row['humidity'])}))
+            return rows
+        # incubator_log.csv: KIND,payload ; only SUPERVISION rows carry readings
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0] != 'SUPERVISION':
+                continue
+            record = ast.literal_eval(row[1])
+            rows.append((None, {'temperature': record['temperature'], 'humidity': record['humidity']}))
+    return rows
+
+
+class SerialStandIn:
+    """The board side of a pseudo-terminal pair; the app opens `self.port`."""
+
+    def __init__(self, incubator, binary=False, ack=False):
+        import pty
+        import tty
+        self.incubator = incubator
+        self.binary = binary
+        self.ack = ack
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        # Like a real board, never wait for a slow reader: what doesn't fit is lost
+        os.set_blocking(self._master, False)
+        self.dropped_bytes = 0
+        self._write_lock = threading.Lock()
+        threading.Thread(target=self._read_commands, name='standin-serial', daemon=True).start()
+
+    def _read_commands(self):
+        pending = b''
+        while True:
+            select.select([self._master], [], [])
+            try:
+                pending += os.read(self._master, 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            applied = self.incubator.command(pending)
+            pending = pending[-1:] if pending[-1:] in ACTUATORS else b''
+            if self.ack:
+                for command in applied:
+                    self._write(encode_frame(FRAME_ACK, command) if self.binary else b'OK ' + command + b'\n')
+
+    def _write(self, data):
+        with self._write_lock:
+            try:
+                written = os.write(self._master, data)
+            except BlockingIOError:
+                written = 0
+            self.dropped_bytes += len(data) - written
+
+    def emit(self, samples):
+        if self.binary:
+            data = b''.join(encode_sample((s['temperature'], s['humidity'])) for s in samples)
+        else:
+            data = b''.join(b'%.2f|%.2f\n' % (s['temperature'], s['humidity']) for s in samples)
+        self._write(data)
+
+
+def make_http_handler(incubator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the sensors the poller pools connections for
+
+        def _json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith('/sensor'):
+                state = incubator.state()
+                if state['latest'] is None:
+                    return self._json(503, {'error': 'no sample yet'})
+                # The sample counter is the version: unchanged since the caller's copy -> 304
+                etag = f'"{state["samples"]}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    return self.end_headers()
+                return self._json(200, state['latest'], {'ETag': etag})
+            if self.path.startswith('/state'):
+                return self._json(200, incubator.state())
+            self._json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if not self.path.startswith('/command'):
+                return self._json(404, {'error': 'not found'})
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            try:
+                body = json.loads(body).get('command', '').encode('ascii')
+            except (ValueError, AttributeError):
+                pass
+            self._json(200, {'applied': [c.decode() for c in incubator.command(body)]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run(source, incubator, sinks, duration=None, stop=None):
+    """Emit the source's samples on time; a late emitter catches up in batches."""
+    stop = stop or threading.Event()
+    started = time.monotonic()
+    deadline = started
+    batch = []
+    for delay, sample in source:
+        deadline += delay
+        now = time.monotonic()
+        if deadline > now and batch:
+            for sink in sinks:
+                sink.emit(batch)
+            batch = []
+        if deadline > now and stop.wait(deadline - now):
+            break
+        if duration is not None and deadline - started > duration:
+            break
+        incubator.emitted(sample)
+        batch.append(sample)
+        if len(batch) >= MAX_BATCH:
+            for sink in sinks:
+                sink.emit(batch)
+            batch = []
+    if batch:
+        for sink in sinks:
+            sink.emit(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake incubator on a pseudo-terminal and on HTTP')
+    parser.add_argument('--replay', help='log to replay (incubator_log.csv or timestamp,temperature,humidity CSV)')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier')
+    parser.add_argument('--interval', type=float, default=4.0, help='seconds between replayed rows without timestamps')
+    parser.add_argument('--loop', action='store_true', help='restart the replay at the end')
+    parser.add_argument('--rate', type=float, default=1.0, help='synthetic samples per second')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--serial', choices=('on', 'off'), default='on')
+    parser.add_argument('--binary', action='store_true', help='send binary frames instead of text lines')
+    parser.add_argument('--ack', action='store_true', help='acknowledge every command')
+    parser.add_argument('--http-port', type=int, default=5001, help='0 disables the HTTP sensor')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds of samples')
+    args = parser.parse_args()
+
+    incubator = Incubator()
+    if args.replay:
+        source = ReplaySource(args.replay, args.speed, args.interval, args.loop)
+    else:
+        source = SyntheticSource(incubator, args.rate, args.seed)
+
+    sinks = []
+    if args.serial == 'on':
+        serial_standin = SerialStandIn(incubator, args.binary, args.ack)
+        sinks.append(serial_standin)
+        print(f"\033[92m[STANDIN] Serial port: {serial_standin.port}\033[0m")
+    if args.http_port:
+        server = ThreadingHTTPServer(('127.0.0.1', args.http_port), make_http_handler(incubator))
+        threading.Thread(target=server.serve_forever, name='standin-http', daemon=True).start()
+        print(f"\033[92m[STANDIN] HTTP sensor: http://localhost:{args.http_port}/sensor\033[0m")
+
+    try:
+        run(source, incubator, sinks, args.duration)
+    except KeyboardInterrupt:
+        pass
+    state = incubator.state()
+    print(f"\033[94m[STANDIN] {state['samples']} samples sent, {state['commands']} commands received\033[0m")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from utils.analytics import LONG_WINDOW, SHORT_WINDOW, ChannelAnalytics, RollingWindow, SensorAnalytics
+
+EPOCH = 1792314000.0
+
+
+@pytest.mark.parametrize('interval, rate_per_min', [(1.0, 0.6), (4.0, 0.06), (4.0, -0.3)])
+def test_slope_of_a_ramp_at_epoch_timestamps(interval, rate_per_min):
+    channel = ChannelAnalytics('temperature')
+    for i in range(int(2 * LONG_WINDOW / interval)):
+        t = EPOCH + i * interval
+        channel.update(t, 37.0 + rate_per_min / 60.0 * (t - EPOCH))
+        if i >= 3:
+            # Right from the first samples, not only after a resync
+            assert channel.short.slope() * 60.0 == pytest.approx(rate_per_min, rel=1e-6)
+    summary = channel.summary()
+    assert summary['short']['rate_per_min'] == pytest.approx(rate_per_min, rel=1e-6)
+    assert summary['long']['rate_per_min'] == pytest.approx(rate_per_min, rel=1e-6)
+
+
+def test_forecast_follows_the_ramp():
+    channel = ChannelAnalytics('temperature')
+    for i in range(60):
+        channel.update(EPOCH + i, 37.0 + 0.01 * i)
+    assert channel.forecast(120.0) == pytest.approx(37.0 + 0.01 * (59 + 120), abs=1e-6)
+
+
+def test_window_restarts_after_a_gap():
+    window = RollingWindow(SHORT_WINDOW)
+    for i in range(30):
+        window.push(EPOCH + i, 1.0 + i)
+    # Everything before the gap is evicted; the new samples alone give the slope
+    for i in range(10):
+        window.push(EPOCH + 1000 + i, 5.0 - 0.5 * i)
+    assert window.count == 10
+    assert window.slope() == pytest.approx(-0.5, rel=1e-9)
+    assert window.mean() == pytest.approx(5.0 - 0.5 * 4.5)
+
+
+def test_nan_sample_is_a_fault_not_a_statistic():
+    analytics = SensorAnalytics()
+    for i in range(200):
+        temperature = float('nan') if i == 100 else 37.0 + 0.01 * i
+        analytics.update({'timestamp': EPOCH + i, 'temperature': temperature, 'humidity': 55.0})
+    channel = analytics.channels['temperature']
+    assert channel.invalid == 1
+    assert channel.short.count == SHORT_WINDOW + 1
+    summary = analytics.summary()['temperature']
+    assert summary['short']['rate_per_min'] == pytest.approx(0.6, rel=1e-6)
+    assert summary['forecast'] == pytest.approx(37.0 + 0.01 * (199 + 120), abs=1e-6)
+    assert 'invalid' not in summary['faults']  # more than a short window ago
+    json.dumps(analytics.summary(), allow_nan=False)
+
+
+def test_rejected_push_leaves_the_window_untouched():
+    clean = RollingWindow(SHORT_WINDOW)
+    dirty = RollingWindow(SHORT_WINDOW)
+    for i in range(30):
+        clean.push(EPOCH + i, 37.0 + 0.01 * i)
+        dirty.push(EPOCH + i, 37.0 + 0.01 * i)
+        if i % 10 == 0:
+            assert dirty.push(EPOCH + i + 0.5, float('nan')) is False
+            assert dirty.push(float('inf'), 37.0) is False
+    assert dirty.count == clean.count
+    assert dirty.summary() == clean.summary()
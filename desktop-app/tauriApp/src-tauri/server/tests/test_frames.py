@@ -0,0 +1,28 @@
+from utils.frames import SYNC, FRAME_SAMPLE, MAX_PAYLOAD, FrameParser, encode_sample
+
+
+def test_oversize_length_is_not_a_checksum_error():
+    parser = FrameParser()
+    bad = SYNC + bytes((FRAME_SAMPLE, MAX_PAYLOAD + 1))
+    frames = parser.feed(bad + encode_sample([37.5, 55.0]))
+    assert frames == [('sample', {'temperature': 37.5, 'humidity': 55.0})]
+    stats = parser.stats()
+    assert stats['length_errors'] == 1
+    assert stats['checksum_errors'] == 0
+
+
+def test_bad_crc_is_a_checksum_error():
+    parser = FrameParser()
+    frame = bytearray(encode_sample([1.0, 2.0]))
+    frame[-1] ^= 0xFF
+    assert parser.feed(bytes(frame) + encode_sample([37.5, 55.0])) == [('sample', {'temperature': 37.5, 'humidity': 55.0})]
+    stats = parser.stats()
+    assert stats['checksum_errors'] == 1
+    assert stats['length_errors'] == 0
+
+
+def test_non_finite_values_are_parse_errors():
+    parser = FrameParser()
+    frames = parser.feed(b'nan|55.0\n37.5|inf\n' + encode_sample([float('nan'), 55.0]) + b'37.5|55.0\n')
+    assert frames == [('sample', {'temperature': 37.5, 'humidity': 55.0})]
+    assert parser.stats()['parse_errors'] == 3
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from utils.sensor_writer import SensorWriter, permanent_error
+
+
+class SupabaseError(Exception):
+    def __init__(self, code):
+        super().__init__(f'error {code}')
+        self.code = code
+
+
+class FakeTable:
+    """Inserts like Supabase would: a whole batch fails if one row is refused."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.inserted = []
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if any(row['temperature'] == 'bad' for row in rows):
+            raise SupabaseError('22P02')  # invalid text representation
+        self.inserted += rows
+
+
+@pytest.fixture
+def writer(tmp_path):
+    return SensorWriter(outbox=str(tmp_path / 'sensor_data.jsonl'))
+
+
+def rows(count, bad=()):
+    return [{'temperature': 'bad' if i in bad else 37.0 + i / 100, 'humidity': 55.0} for i in range(count)]
+
+
+def test_one_bad_row_is_isolated_from_its_batch(writer):
+    table = FakeTable()
+    writer._insert = table
+    batch = rows(50, bad={17})
+    assert writer._flush(batch)
+    assert len(table.inserted) == 49
+    assert table.calls <= 2 * 6 + 1  # halving: about two inserts per level
+    with open(writer.quarantine) as f:
+        quarantined = [json.loads(line) for line in f]
+    assert [q['row'] for q in quarantined] == [batch[17]]
+    stats = writer.stats()
+    assert stats['quarantined_rows'] == 1 and stats['outbox_rows'] == 0
+
+
+def test_transient_failure_keeps_rows_in_the_outbox(writer):
+    writer._insert = FakeTable(SupabaseError(503))
+    assert not writer._flush(rows(10))
+    assert writer.stats()['outbox_rows'] == 10
+    table = FakeTable()
+    writer._insert = table
+    writer._replay()
+    assert len(table.inserted) == 10
+    assert writer.stats()['outbox_rows'] == 0
+
+
+def test_overflow_is_spilled_by_the_writer_thread(tmp_path):
+    writer = SensorWriter(max_queue=2, outbox=str(tmp_path / 'sensor_data.jsonl'))
+    for i in range(5):
+        writer.submit({'timestamp': 1792314000.0 + i, 'temperature': 37.0, 'humidity': 55.0})
+    stats = writer.stats()
+    assert stats['queue_depth'] == 2 and stats['overflow_rows'] == 3 and stats['outbox_rows'] == 0
+    writer._spill_overflow()
+    assert writer.stats()['outbox_rows'] == 3
+
+
+@pytest.mark.parametrize('code, permanent', [
+    ('22P02', True), ('23505', True), ('42703', True), ('42501', False),
+    ('PGRST204', True), ('PGRST301', False), ('08006', False),
+    (400, True), (429, False), (503, False), (None, False),
+])
+def test_permanent_error(code, permanent):
+    assert permanent_error(SupabaseError(code)) is permanent
@@ -0,0 +1,256 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+CHANNELS = ('temperature', 'humidity')
+
+SHORT_WINDOW = 60.0       # seconds
+LONG_WINDOW = 1800.0      # seconds
+FORECAST_HORIZON = 120.0  # seconds
+WINDOW_CAPACITY = 4096    # samples kept per window
+
+# Fault thresholds per channel
+LIMITS = {
+    'temperature': {'stuck_range': 0.01, 'spike_sigma': 4.0, 'max_rate': 0.5, 'max_drift': 2.0},
+    'humidity': {'stuck_range': 0.05, 'spike_sigma': 4.0, 'max_rate': 5.0, 'max_drift': 15.0},
+}
+
+
+class RollingWindow:
+    """Time-bounded window with O(1) updates of its statistics.
+
+    Samples sit in preallocated NumPy columns. Running sums give mean,
+    variance and the least-squares slope; monotonic deques give min/max.
+    The sums are recomputed from the columns every `capacity` updates
+    (vectorized) so rounding error never accumulates.
+    """
+
+    def __init__(self, span, capacity=WINDOW_CAPACITY):
+        self.span = span
+        self.capacity = capacity
+        self._t = np.zeros(capacity)
+        self._x = np.zeros(capacity)
+        self._head = 0
+        self.count = 0
+        self._base = 0.0  # time origin (the oldest sample), keeps the time sums small
+        self._sx = self._sxx = self._st = self._stt = self._stx = 0.0
+        self._min = deque()
+        self._max = deque()
+        self._since_resync = 0
+
+    def push(self, t, x):
+        # NaN/inf would poison the running sums for as long as the window lasts
+        if not (math.isfinite(t) and math.isfinite(x)):
+            return False
+        evicted = False
+        while self.count and (t - self._t[self._head] > self.span or self.count == self.capacity):
+            self._evict()
+            evicted = True
+        if not self.count:
+            # Epoch-second times would cancel out in the slope: measure them from the first sample
+            self._base = float(t)
+            self._sx = self._sxx = self._st = self._stt = self._stx = 0.0
+        elif evicted:
+            self._rebase(float(self._t[self._head]))
+        i = (self._head + self.count) % self.capacity
+        self._t[i] = t
+        self._x[i] = x
+        self.count += 1
+        tr = t - self._base
+        self._sx += x
+        self._sxx += x * x
+        self._st += tr
+        self._stt += tr * tr
+        self._stx += tr * x
+
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((t, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((t, x))
+
+        self._since_resync += 1
+        if self._since_resync >= self.capacity or not math.isfinite(self._sxx + self._stt + self._stx):
+            # Rebuilt from the columns, never carried forward once a sum has gone bad
+            self._resync()
+        return True
+
+    def _evict(self):
+        t = self._t[self._head]
+        x = self._x[self._head]
+        tr = t - self._base
+        self._sx -= x
+        self._sxx -= x * x
+        self._st -= tr
+        self._stt -= tr * tr
+        self._stx -= tr * x
+        self._head = (self._head + 1) % self.capacity
+        self.count -= 1
+        if self._min and self._min[0][0] <= t:
+            self._min.popleft()
+        if self._max and self._max[0][0] <= t:
+            self._max.popleft()
+
+    def _rebase(self, base):
+        # Move the time origin; the sums shift exactly, no pass over the columns
+        d = base - self._base
+        n = self.count
+        self._stt += n * d * d - 2.0 * d * self._st
+        self._stx -= d * self._sx
+        self._st -= n * d
+        self._base = base
+
+    def _columns(self):
+        idx = (self._head + np.arange(self.count)) % self.capacity
+        return self._t[idx], self._x[idx]
+
+    def _resync(self):
+        t, x = self._columns()
+        self._base = float(t[0]) if self.count else 0.0
+        tr = t - self._base
+        self._sx = float(x.sum())
+        self._sxx = float(np.dot(x, x))
+        self._st = float(tr.sum())
+        self._stt = float(np.dot(tr, tr))
+        self._stx = float(np.dot(tr, x))
+        self._since_resync = 0
+
+    def mean(self):
+        return self._sx / self.count if self.count else None
+
+    def variance(self):
+        if self.count < 2:
+            return None
+        mean = self._sx / self.count
+        return max(0.0, self._sxx / self.count - mean * mean)
+
+    def minimum(self):
+        return self._min[0][1] if self._min else None
+
+    def maximum(self):
+        return self._max[0][1] if self._max else None
+
+    def duration(self):
+        if not self.count:
+            return 0.0
+        return float(self._t[(self._head + self.count - 1) % self.capacity] - self._t[self._head])
+
+    def slope(self):
+        """Least-squares rate of change, in units per second."""
+        n = self.count
+        if n < 3:
+            return None
+        denominator = n * self._stt - self._st * self._st
+        if denominator <= 1e-9:
+            return None
+        return (n * self._stx - self._st * self._sx) / denominator
+
+    def forecast(self, t):
+        slope = self.slope()
+        if slope is None:
+            return None
+        mean_t = self._st / self.count + self._base
+        return self.mean() + slope * (t - mean_t)
+
+    def summary(self):
+        variance = self.variance()
+        slope = self.slope()
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'variance': variance,
+            'std': None if variance is None else variance ** 0.5,
+            'min': self.minimum(),
+            'max': self.maximum(),
+            'rate_per_min': None if slope is None else slope * 60.0,
+        }
+
+
+class ChannelAnalytics:
+    def __init__(self, name):
+        self.name = name
+        self.limits = LIMITS[name]
+        self.short = RollingWindow(SHORT_WINDOW)
+        self.long = RollingWindow(LONG_WINDOW)
+        self.last = None
+        self.spikes = 0
+        self.last_spike = None
+        self.invalid = 0
+        self.last_invalid = None
+
+    def update(self, t, x):
+        if not (math.isfinite(t) and math.isfinite(x)):
+            # A failed sensor read (NaN/inf): reported as a fault, kept out of the windows
+            self.invalid += 1
+            self.last_invalid = t if math.isfinite(t) else self.last_invalid
+            return
+        # A spike is judged against the window before the sample joins it
+        std = self.short.variance()
+        if std is not None and self.short.count >= 10:
+            std = max(std ** 0.5, 0.05)
+            jump = self.last is not None and t > self.last[0] and abs(x - self.last[1]) / (t - self.last[0]) > self.limits['max_rate']
+            if abs(x - self.short.mean()) > self.limits['spike_sigma'] * std or jump:
+                self.spikes += 1
+                self.last_spike = t
+        self.short.push(t, x)
+        self.long.push(t, x)
+        self.last = (t, x)
+
+    def faults(self):
+        faults = []
+        # Stuck: a full long window with (almost) no change at all
+        if self.long.count >= 10 and self.long.duration() >= LONG_WINDOW * 0.5:
+            if self.long.maximum() - self.long.minimum() < self.limits['stuck_range']:
+                faults.append('stuck')
+        slope = self.long.slope()
+        if slope is not None and self.long.duration() >= LONG_WINDOW * 0.5:
+            if abs(slope) * 3600.0 > self.limits['max_drift']:
+                faults.append('drifting')
+        if self.last_spike is not None and self.last is not None and self.last[0] - self.last_spike <= SHORT_WINDOW:
+            faults.append('spike')
+        if self.last_invalid is not None and self.last is not None and self.last[0] - self.last_invalid <= SHORT_WINDOW:
+            faults.append('invalid')
+        return faults
+
+    def forecast(self, horizon=FORECAST_HORIZON):
+        if self.last is None:
+            return None
+        return self.short.forecast(self.last[0] + horizon)
+
+    def summary(self):
+        return {
+            'short': self.short.summary(),
+            'long': self.long.summary(),
+            'forecast': self.forecast(),
+            'forecast_horizon': FORECAST_HORIZON,
+            'spikes': self.spikes,
+            'invalid': self.invalid,
+            'faults': self.faults(),
+        }
+
+
+class SensorAnalytics:
+    """Rolling statistics, fault flags and a trend forecast, updated per sample."""
+
+    def __init__(self):
+        self.channels = {name: ChannelAnalytics(name) for name in CHANNELS}
+        self._lock = threading.Lock()
+
+    def update(self, sample):
+        t = sample.get('timestamp')
+        with self._lock:
+            for name, channel in self.channels.items():
+                value = sample.get(name)
+                if value is not None and t is not None:
+                    channel.update(t, float(value))
+
+    def forecast(self, horizon=FORECAST_HORIZON):
+        with self._lock:
+            return {name: channel.forecast(horizon) for name, channel in self.channels.items()}
+
+    def summary(self):
+        with self._lock:
+            return {name: channel.summary() for name, channel in self.channels.items()}
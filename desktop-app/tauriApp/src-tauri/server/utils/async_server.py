@@ -0,0 +1,155 @@
+"""Production server: the HTTP routes run on the shared event loop.
+
+Readers, controllers and the mode switcher already live on that loop, so
+requests, acquisition and control share one loop instead of the Werkzeug
+thread-per-request server. The live stream is served natively (an idle
+dashboard costs no thread); the other Flask views run in their own
+bounded request pool (not the acquisition executor) through a small WSGI
+bridge, so there is one definition of every route for both servers.
+
+    python app.py --server async
+"""
+import io
+import signal
+import sys
+import threading
+
+from aiohttp import web
+from multidict import CIMultiDict
+
+from utils import startup
+from utils.broadcast import broadcaster, initial_events
+from utils.devices import registry
+from utils.loop import run_coroutine, run_request
+from utils.state_store import state_store
+from routes.api import wait_params
+
+SHUTDOWN_TIMEOUT = 2.0  # open streams are cut after this on exit
+MAX_BODY = 1024 * 1024
+# Set by aiohttp itself, or meaningless once the body is collected
+SKIP_HEADERS = {'content-length', 'transfer-encoding', 'connection'}
+CORS = {'Access-Control-Allow-Origin': '*'}
+
+
+def _environ(request, body, host, port):
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': request.path,
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(port),
+        'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name in request.headers.keys():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            environ[key] = ','.join(request.headers.getall(name))
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started[0], started[1], body
+
+
+def wsgi_handler(wsgi_app, host, port):
+    async def handle(request):
+        body = await request.read()
+        environ = _environ(request, body, host, port)
+        status, headers, payload = await run_request(_call_wsgi, wsgi_app, environ)
+        code, _, reason = status.partition(' ')
+        response_headers = CIMultiDict((k, v) for k, v in headers if k.lower() not in SKIP_HEADERS)
+        return web.Response(status=int(code), reason=reason or None, headers=response_headers, body=payload)
+    return handle
+
+
+async def stream(request):
+    # Server-Sent Events, as /api/stream in app.py, without a thread per client
+    device_id = request.query.get('device')
+    device = registry.find(device_id) if device_id else None
+    if device_id and device is None:
+        return web.json_response({"error": "Unknown device"}, status=404, headers={'Access-Control-Allow-Origin': '*'})
+    devices = [device] if device else registry.all()
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Access-Control-Allow-Origin': '*',
+    })
+    await response.prepare(request)
+    events = broadcaster.astream(initial_events(devices), device_id)
+    try:
+        async for chunk in events:
+            await response.write(chunk.encode('utf-8'))
+    except ConnectionResetError:
+        pass  # the client went away
+    finally:
+        await events.aclose()
+    return response
+
+
+async def next_data(request):
+    # /api/data/next from routes/api.py, waiting on the loop instead of in an executor thread
+    try:
+        after, device_id, timeout = wait_params(request.query)
+    except ValueError:
+        return web.json_response({'error': 'after must be an integer and timeout a number'}, status=400, headers=CORS)
+    snapshot = await state_store.wait_async(after, device_id, timeout)
+    if snapshot is None:
+        return web.Response(status=204, headers=CORS)
+    return web.json_response(snapshot.as_json(), headers=CORS)
+
+
+def make_application(wsgi_app, host, port):
+    application = web.Application(client_max_size=MAX_BODY)
+    application.router.add_get('/api/stream', stream)
+    application.router.add_get('/api/data/next', next_data)
+    application.router.add_route('*', '/{tail:.*}', wsgi_handler(wsgi_app, host, port))
+    return application
+
+
+async def start(wsgi_app, host, port):
+    runner = web.AppRunner(make_application(wsgi_app, host, port), shutdown_timeout=SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
+
+def serve(wsgi_app, host='0.0.0.0', port=3000):
+    """Serve until interrupted; the routes join the acquisition loop."""
+    runner = run_coroutine(start(wsgi_app, host, port)).result()
+    print(f"\033[92m[INFO] Async server listening on http://{host}:{port}\033[0m")
+    startup.done('listening')
+    stop = threading.Event()
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    try:
+        while not stop.wait(1.0):  # short waits keep Ctrl+C responsive on Windows
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        run_coroutine(runner.cleanup()).result(timeout=SHUTDOWN_TIMEOUT + 5)
+        print("\033[94m[INFO] Async server stopped\033[0m")
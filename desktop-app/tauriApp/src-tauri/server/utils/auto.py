@@ -1,71 +1,182 @@
-from integration.supabase import supabase
-from utils.serial_reader import latest_data
-from utils.controller import active_fan , active_heater , active_motor , stop_fan , stop_heater , stop_motor , getFanStatus , getHeaterStatus ,getMotorStatus , setMotorStatus , humIncreasing , hum_increase , hum_decrease
+import asyncio
 import time
+from collections import deque
 
-def getEggTarget(egg) : 
-    response = supabase.table('egg_info').select('target_temp, target_hum').eq('egg_type', egg).execute()
-    rows = response.data or []
-    return rows[0] if rows else {}
-
-async def auto(egg , com , bd, stop_event=None) : 
-    global latest_data
-    targets = getEggTarget(egg)
-    print(f'auto mode for {egg} egg')
-    target_temp = targets.get('target_temp')
-    target_hum = targets.get('target_hum')
-    while True:
-        if stop_event is not None and stop_event.is_set():
-            break
-        current_temp = latest_data.get('temperature')
-        current_hum  = latest_data.get('humidity')
-        if current_temp is None or current_hum is None:
-            time.sleep(1)
-            continue
-        if target_temp is not None and current_temp > target_temp:
-            if not getFanStatus and getHeaterStatus:
-                active_fan(com , bd)
-                stop_heater(com , bd)
-                while latest_data.get('temperature') is not None and latest_data.get('temperature') > target_temp : 
-                    if stop_event is not None and stop_event.is_set():
-                        break
-                    time.sleep(1)
-            elif getFanStatus and not getHeaterStatus : 
-                active_fan(com , bd)
-                while latest_data.get('temperature') is not None and latest_data.get('temperature') > target_temp : 
-                    if stop_event is not None and stop_event.is_set():
-                        break
-                    time.sleep(1)
-        if target_temp is not None and current_temp < target_temp :
-            if getFanStatus and not getHeaterStatus :
-                stop_fan(com  , bd)
-                active_heater(com , bd)
-                while latest_data.get('temperature') is not None and latest_data.get('temperature') < target_temp :
-                    if stop_event is not None and stop_event.is_set():
-                        break
-                    time.sleep(1)
-            elif not getFanStatus and getHeaterStatus : 
-                active_heater(com , bd)
-                while latest_data.get('temperature') is not None and latest_data.get('temperature') < target_temp :
-                    if stop_event is not None and stop_event.is_set():
-                        break
-                    time.sleep(1)
-        if target_hum is not None and current_hum < target_hum :
-            if humIncreasing : 
-                pass 
-            else :
-                hum_increase(com , bd)
-        else : 
-            if humIncreasing : 
-                hum_decrease(com , bd)
-        time.sleep(1)
-
-            
-
-            
-
-    
-              
-
-
-    
\ No newline at end of file
+from utils.egg_profiles import egg_profiles
+from utils.control import build_engine , FixedRateScheduler
+from utils.metrics import controller_decision_seconds
+from utils.scheduler import plan, unplan
+from utils.state_store import state_store
+
+TICK_INTERVAL = 1.0
+TARGET_RETRY = 10.0  # seconds between target loads while the egg profile has none
+
+# Control engine per egg type; anything not listed uses 'default'
+CONTROL_PROFILES = {
+    'default' : {'engine' : 'pid'},
+    'quail' : {'engine' : 'hysteresis', 'temp_band' : 0.2},
+}
+
+def getEggTarget(egg) :
+    # Served from the in-memory preset cache (with an offline snapshot), not a query per start
+    profile = egg_profiles.get(egg)
+    return {'target_temp' : profile.get('target_temp'), 'target_hum' : profile.get('target_hum')}
+
+def getControlProfile(egg) :
+    return CONTROL_PROFILES.get(egg, CONTROL_PROFILES['default'])
+
+
+class AutoController:
+    """Automatic mode driven by new samples instead of a polling loop.
+
+    The controller waits on the state store for a snapshot newer than the
+    last one it decided on, so one decision runs per sample (the newest, if
+    it fell behind) and `stop()` wakes the loop at once. A fixed-rate tick
+    plays out the heater duty cycle between samples. `retarget()` (egg type
+    changed, presets refreshed) reloads the targets; without any, the load
+    is retried every TARGET_RETRY seconds.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.egg = device.egg_type
+        self.target_temp = None
+        self.target_hum = None
+        self.engine = None
+        self.scheduler = FixedRateScheduler(TICK_INTERVAL)
+        self.decisions = 0
+        self.latencies = deque(maxlen=500)  # sample acquisition -> decision applied, in seconds
+        self._decision_seconds = controller_decision_seconds.labels(device.id)
+
+        self._loop = None
+        self._stopped = None
+        self._stop_requested = False
+        self._control_lock = None
+        self._retarget = None
+        self._retry_at = 0.0
+
+    def stop(self):
+        self._stop_requested = True
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stopped.set)
+
+    def retarget(self):
+        # Any thread: the egg profile cache calls it from its refresh thread
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and self._retarget is not None:
+            loop.call_soon_threadsafe(self._retarget.set)
+
+    def has_targets(self):
+        return self.target_temp is not None
+
+    async def _load_targets(self):
+        egg = self.device.egg_type
+        try:
+            targets = await self._loop.run_in_executor(None, getEggTarget, egg)
+        except Exception as e:
+            print(f"\033[91mCould not load targets for {egg}: {e}\033[0m")
+            targets = {}
+        target_temp = targets.get('target_temp')
+        target_hum = targets.get('target_hum')
+        if target_temp is None:
+            self._retry_at = self._loop.time() + TARGET_RETRY
+        if self.engine is not None and (egg, target_temp, target_hum) == (self.egg, self.target_temp, self.target_hum):
+            return
+        async with self._control_lock:
+            self.egg = egg
+            self.target_temp = target_temp
+            self.target_hum = target_hum
+            self.engine = build_engine(getControlProfile(egg), target_temp, target_hum)
+        if target_temp is None:
+            print(f"\033[93mNo targets for {egg} on {self.device.id} yet, retrying every {TARGET_RETRY:.0f} s\033[0m")
+        print(f'auto mode for {self.egg} egg on {self.device.id} ({self.engine.name} control)')
+        # Rotation and ventilation bursts from the same egg profile
+        await self._loop.run_in_executor(None, plan, self.device)
+
+    async def run(self):
+        self._stopped = asyncio.Event()
+        self._control_lock = asyncio.Lock()
+        self._loop = asyncio.get_running_loop()
+        if self._stop_requested:
+            return
+
+        self._retarget = asyncio.Event()
+        egg_profiles.add_listener(self.retarget)
+        try:
+            await self._load_targets()
+            if self._stop_requested:
+                return
+            await self._decide_on_samples()
+        finally:
+            egg_profiles.remove_listener(self.retarget)
+            unplan(self.device)
+            print(f'auto mode for {self.egg} egg on {self.device.id} stopped')
+
+    async def _decide_on_samples(self):
+        seen = state_store.version  # decide on samples from now on
+        stop_wait = asyncio.ensure_future(self._stopped.wait())
+        ticker = asyncio.ensure_future(self.scheduler.run(self._control, self._stopped))
+        next_sample = retarget_wait = None
+        try:
+            while True:
+                if next_sample is None:
+                    next_sample = asyncio.ensure_future(state_store.wait_async(seen, self.device.id))
+                if retarget_wait is None:
+                    retarget_wait = asyncio.ensure_future(self._retarget.wait())
+                timeout = None if self.has_targets() else max(0.0, self._retry_at - self._loop.time())
+                await asyncio.wait({next_sample, stop_wait, retarget_wait}, timeout=timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if stop_wait.done():
+                    break
+                if retarget_wait.done() or (not self.has_targets() and self._loop.time() >= self._retry_at):
+                    self._retarget.clear()
+                    retarget_wait.cancel()
+                    retarget_wait = None
+                    await self._load_targets()
+                if next_sample.done():
+                    snapshot = next_sample.result()
+                    next_sample = None
+                    seen = snapshot.seq
+                    await self.decide(snapshot.data)
+        finally:
+            for future in (next_sample, retarget_wait, stop_wait, ticker):
+                if future is not None:
+                    future.cancel()
+
+    async def _control(self, now):
+        async with self._control_lock:
+            # Only the desired state is handed over: the device's reconciler sends what
+            # differs from the confirmed state, so a repeated decision costs nothing
+            desired = self.engine.step(now, self.device.actuators.state())
+            if desired:
+                self.device.actuators.request(desired, 'auto')
+
+    async def decide(self, sample):
+        if sample.get('temperature') is None or sample.get('humidity') is None:
+            return
+        # The short-term trend lets the engine switch off before overshooting
+        self.engine.observe(sample, self.device.analytics.forecast())
+        await self._control(self._loop.time())
+
+        self.decisions += 1
+        acquired = sample.get('timestamp')
+        if acquired is not None:
+            latency = time.time() - acquired
+            self.latencies.append(latency)
+            self._decision_seconds.observe(latency)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'device': self.device.id,
+            'egg': self.egg,
+            'target_temp': self.target_temp,
+            'target_hum': self.target_hum,
+            'decisions': self.decisions,
+            'last_latency': self.latencies[-1] if self.latencies else None,
+            'p50_latency': latencies[len(latencies) // 2] if latencies else None,
+            'max_latency': latencies[-1] if latencies else None,
+            'control': self.engine.stats() if self.engine else None,
+            'scheduler': self.scheduler.stats(),
+        }
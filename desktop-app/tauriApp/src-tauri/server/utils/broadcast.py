@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+
+HEARTBEAT_INTERVAL = 15.0
+
+
+class Subscriber:
+    """One client's mailbox.
+
+    Only the newest payload per key is kept, so a slow client skips stale
+    readings instead of buffering them without bound.
+    """
+
+    def __init__(self, device=None, loop=None):
+        self.device = device
+        self._pending = {}
+        self._cond = threading.Condition()
+        # Set for clients served on the event loop: offers wake them without a thread
+        self._loop = loop
+        self._wakeup = asyncio.Event() if loop is not None else None
+        self._signalled = False
+        self.coalesced = 0
+        self.closed = False
+
+    def _signal(self):
+        # Caller holds the condition; one wake-up per batch is enough
+        if self._loop is not None and not self._signalled:
+            self._signalled = True
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def offer(self, key, event, data):
+        if self.device is not None and isinstance(data, dict) and data.get('device') not in (None, self.device):
+            return
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+                del self._pending[key]  # re-insert so delivery follows update order
+            self._pending[key] = (event, data)
+            self._cond.notify()
+            self._signal()
+
+    def drain(self, timeout=None):
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    async def drain_async(self, timeout=None):
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup.clear()
+        with self._cond:
+            self._signalled = False
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+            self._signalled = False
+            self._signal()
+
+
+class Broadcaster:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, device=None, loop=None):
+        subscriber = Subscriber(device, loop)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, event, data, key=None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(key or event, event, data)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, initial=(), device=None):
+        """Server-Sent Events generator for one client, optionally for one device."""
+        subscriber = self.subscribe(device)
+        try:
+            for event, data in initial:
+                yield format_event(event, data)
+            while not subscriber.closed:
+                events = subscriber.drain(HEARTBEAT_INTERVAL)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for event, data in events:
+                    yield format_event(event, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def astream(self, initial=(), device=None):
+        """The same stream for the async server: waiting clients hold no thread."""
+        subscriber = self.subscribe(device, asyncio.get_running_loop())
+        try:
+            for event, data in initial:
+                yield format_event(event, data)
+            while not subscriber.closed:
+                events = await subscriber.drain_async(HEARTBEAT_INTERVAL)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for event, data in events:
+                    yield format_event(event, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def initial_events(devices):
+    """Current actuator states and latest readings, sent first to a new client."""
+    events = []
+    for device in devices:
+        events += [('actuator', {'device': device.id, 'name': name, 'active': active})
+                   for name, active in device.actuators.confirmed.items() if active is not None]
+        snapshot = device.snapshot()
+        if snapshot is not None:
+            events.append(('reading', snapshot.as_json()))
+    return events
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+broadcaster = Broadcaster()
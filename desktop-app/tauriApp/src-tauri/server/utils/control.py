@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+
+class Hysteresis:
+    """On/off output with a deadband of +/- `band` around `setpoint`.
+
+    With `cooling=False` the output turns on below the band (heater,
+    humidifier); with `cooling=True` it turns on above it (fan). A
+    `predicted` value lets an active output switch off before the measured
+    value leaves the band, instead of after it has overshot.
+    """
+
+    def __init__(self, setpoint, band, cooling=False):
+        self.setpoint = setpoint
+        self.band = band
+        self.cooling = cooling
+
+    def update(self, value, on, predicted=None):
+        if self.setpoint is None or value is None:
+            return on
+        low = self.setpoint - self.band
+        high = self.setpoint + self.band
+        if self.cooling:
+            if value > high:
+                return True
+            if value < low or (on and predicted is not None and predicted < low):
+                return False
+        else:
+            if value < low:
+                return True
+            if value > high or (on and predicted is not None and predicted > high):
+                return False
+        return on
+
+
+class PID:
+    def __init__(self, kp, ki, kd, setpoint, out_min=0.0, out_max=1.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.setpoint = setpoint
+        self.out_min = out_min
+        self.out_max = out_max
+        self.integral = 0.0
+        self.last_value = None
+
+    def reset(self):
+        self.integral = 0.0
+        self.last_value = None
+
+    def update(self, value, dt):
+        error = self.setpoint - value
+        derivative = 0.0
+        if self.last_value is not None and dt > 0:
+            # Derivative on measurement: no kick when the setpoint changes
+            derivative = -(value - self.last_value) / dt
+        self.last_value = value
+
+        integral = self.integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        if self.out_min < output < self.out_max:
+            # Only integrate while unsaturated (anti-windup)
+            self.integral = integral
+        return min(self.out_max, max(self.out_min, output))
+
+
+class TimeProportioning:
+    """Turns a 0..1 duty cycle into on/off over a fixed window (slow PWM).
+
+    The H1/H0 relay commands are only sent at window edges, so a duty cycle
+    costs at most two serial writes per `period`.
+    """
+
+    def __init__(self, period, min_switch=1.0):
+        self.period = period
+        self.min_switch = min_switch
+        self.window_start = None
+        self.duty = 0.0
+
+    def update(self, duty, now):
+        if self.window_start is None or now - self.window_start >= self.period:
+            # The duty cycle is latched once per window
+            self.window_start = now
+            self.duty = duty
+        on_time = self.duty * self.period
+        if on_time < self.min_switch:
+            return False
+        if self.period - on_time < self.min_switch:
+            return True
+        return now - self.window_start < on_time
+
+
+class HysteresisEngine:
+    name = 'hysteresis'
+
+    def __init__(self, target_temp, target_hum, temp_band=0.3, hum_band=3.0, fan_offset=0.8, fan_band=0.3):
+        self.heater = Hysteresis(target_temp, temp_band)
+        self.fan = Hysteresis(None if target_temp is None else target_temp + fan_offset, fan_band, cooling=True)
+        self.hum = Hysteresis(target_hum, hum_band)
+        self.temperature = None
+        self.humidity = None
+        self.forecast = {}
+
+    def observe(self, sample, forecast=None):
+        self.temperature = sample.get('temperature')
+        self.humidity = sample.get('humidity')
+        self.forecast = forecast or {}
+
+    def heater_output(self, now, state):
+        return self.heater.update(self.temperature, state.get('heater'), self.forecast.get('temperature'))
+
+    def step(self, now, state):
+        """Desired actuator state for `now`, given the current `state`."""
+        if self.temperature is None or self.humidity is None:
+            return {}
+        desired = {
+            'heater': self.heater_output(now, state),
+            'fan': self.fan.update(self.temperature, state.get('fan'), self.forecast.get('temperature')),
+            'hum': self.hum.update(self.humidity, state.get('hum'), self.forecast.get('humidity')),
+        }
+        if desired['fan']:
+            desired['heater'] = False
+        return desired
+
+    def stats(self):
+        return {'engine': self.name}
+
+
+class PIDEngine(HysteresisEngine):
+    name = 'pid'
+
+    def __init__(self, target_temp, target_hum, kp=0.6, ki=0.004, kd=2.0, period=20.0, **bands):
+        super().__init__(target_temp, target_hum, **bands)
+        self.pid = None if target_temp is None else PID(kp, ki, kd, target_temp)
+        self.pwm = TimeProportioning(period)
+        self.output = 0.0
+        self.last_update = None
+
+    def observe(self, sample, forecast=None):
+        super().observe(sample, forecast)
+        if self.pid is None or self.temperature is None:
+            return
+        # The PID only advances on new measurements, ticks just play out the duty cycle
+        acquired = sample.get('timestamp') or time.time()
+        dt = 0.0 if self.last_update is None else acquired - self.last_update
+        self.last_update = acquired
+        self.output = self.pid.update(self.temperature, dt)
+
+    def heater_output(self, now, state):
+        if self.pid is None or self.last_update is None:
+            return False
+        return self.pwm.update(self.output, now)
+
+    def stats(self):
+        return {'engine': self.name, 'output': self.output, 'duty': self.pwm.duty,
+                'integral': self.pid.integral if self.pid else None}
+
+
+ENGINES = {
+    HysteresisEngine.name: HysteresisEngine,
+    PIDEngine.name: PIDEngine,
+}
+
+
+def build_engine(profile, target_temp, target_hum):
+    options = dict(profile)
+    engine = ENGINES[options.pop('engine', PIDEngine.name)]
+    return engine(target_temp, target_hum, **options)
+
+
+class FixedRateScheduler:
+    """Ticks at a fixed rate against absolute deadlines and records drift.
+
+    Deadlines are `start + n * interval`, so lateness does not accumulate. If
+    a tick overruns by more than one interval the missed ticks are skipped.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.ticks = 0
+        self.skipped = 0
+        self.last_drift = 0.0
+        self.max_drift = 0.0
+        self._drift_total = 0.0
+
+    async def run(self, callback, stopped):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while not stopped.is_set():
+            drift = loop.time() - deadline
+            self.ticks += 1
+            self.last_drift = drift
+            self.max_drift = max(self.max_drift, drift)
+            self._drift_total += drift
+            await callback(loop.time())
+
+            deadline += self.interval
+            now = loop.time()
+            if now - deadline >= self.interval:
+                missed = int((now - deadline) // self.interval)
+                self.skipped += missed
+                deadline += missed * self.interval
+            try:
+                await asyncio.wait_for(stopped.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'last_drift': self.last_drift,
+            'max_drift': self.max_drift,
+            'mean_drift': self._drift_total / self.ticks if self.ticks else 0.0,
+        }
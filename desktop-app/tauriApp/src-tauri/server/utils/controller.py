@@ -1,105 +1,96 @@
-import serial
-motors_status = {
-    'motor' : True , 
-    'heater' : True , 
-    'fan' : True , 
-    'hum' : True ,
+from utils.serial_port import get_port_manager
+from utils.broadcast import broadcaster
+from utils.metrics import serial_command_failures, serial_command_seconds
+
+DEFAULT_DEVICE = 'default'
+
+COMMANDS = {
+    'motor' : (b'M1' , b'M0'),
+    'heater' : (b'H1' , b'H0'),
+    'fan' : (b'F1' , b'F0'),
+    'hum' : (b'C1' , b'C0'),
 }
-   
 
-def active_motor(com , baudrate):
-    try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'M1')
-        ser.close()
-        if not motors_status.get('motor') :
-            motors_status['motor'] = True
-        
-    except : 
-        print('error')
+def new_status():
+    # Confirmed state: off until the board has acknowledged a command
+    return {
+        'motor' : False , 
+        'heater' : False , 
+        'fan' : False , 
+        'hum' : False ,
+    }
 
-def stop_motor(com , baudrate):
+motors_status = new_status()  # confirmed status of the default incubator
+
+
+def set_status(component , value , status=None , device_id=DEFAULT_DEVICE):
+    status = motors_status if status is None else status
+    if status.get(component) != value :
+        status[component] = value
+        broadcaster.publish('actuator', {'device' : device_id , 'name' : component , 'active' : value},
+                            key=f'actuator:{device_id}:{component}')
+
+def send_command(com , baudrate , payload , expect_ack=None):
+    if not com or not baudrate :
+        print(f"\033[91mcommand {payload.decode()} not sent: no serial port / baud rate configured\033[0m")
+        return False
     try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'M0')
-        ser.close()
-        if  motors_status.get('motor') :
-            motors_status['motor'] = False
+        manager = get_port_manager(com , baudrate , expect_ack)
+        manager.start()
+        command = manager.send(payload)
     except Exception as e:
         print(f"error connecting to serial [error message : {e}]")
+        return False
+    name = payload.decode()
+    if command.latency is not None :
+        serial_command_seconds.labels(name).observe(command.latency)
+    if not command.ok :
+        serial_command_failures.labels(name).inc()
+        print(f"\033[91mcommand {name} failed on {com} [{command.error}]\033[0m")
+    return command.ok
+
+def actuate(com , baudrate , component , on , status=None , device_id=DEFAULT_DEVICE):
+    payload = COMMANDS[component][0 if on else 1]
+    if send_command(com , baudrate , payload) :
+        set_status(component , on , status , device_id)
+        return True
+    return False
+
+def active_motor(com , baudrate):
+    actuate(com , baudrate , 'motor' , True)
+
+def stop_motor(com , baudrate):
+    actuate(com , baudrate , 'motor' , False)
+
 def active_heater(com , baudrate):
-    try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'H1')
-        ser.close()
-        if not motors_status.get('heater') :
-            motors_status['heater'] = True
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
+    actuate(com , baudrate , 'heater' , True)
 
-    
 def stop_heater(com , baudrate):
-    try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'H0')
-        ser.close()
-        if  motors_status.get('heater') :
-            motors_status['heater'] = False
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
+    actuate(com , baudrate , 'heater' , False)
 
-    
 def active_fan(com , baudrate):
-    try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'F1')
-        ser.close()
-        if not motors_status.get('fan') :
-            motors_status['fan'] = True
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
-   
+    actuate(com , baudrate , 'fan' , True)
+
 def stop_fan(com , baudrate):
-    try : 
-        ser = serial.Serial (com , baudrate)
-        ser.write(b'F0')
-        ser.close()
-        if  motors_status.get('fan') :
-            motors_status['fan'] = False
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
-    
+    actuate(com , baudrate , 'fan' , False)
+
 def hum_increase(com , baudrate):
-    try : 
-        ser = serial.Serial(com , baudrate)
-        ser.write(b'C1')
-        ser.close()
-        if not motors_status.get('hum') :
-            motors_status['hum'] = True
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
-   
+    actuate(com , baudrate , 'hum' , True)
+
 def hum_decrease(com , baudrate):
-    try : 
-        ser = serial.Serial (com , baudrate)
-        ser.write(b'C0')
-        ser.close()
-        if  motors_status.get('hum') :
-            motors_status['hum'] = False
-    except Exception as e:
-        print(f"error connecting to serial [error message : {e}]")
+    actuate(com , baudrate , 'hum' , False)
+
 def humIncreasing ()  : 
     global motors_status
-    return motors_status.get['hum']
+    return motors_status.get('hum')
 def getMotorStatus() :
     global motors_status
-    return motors_status.get['motor']
+    return motors_status.get('motor')
 def getFanStatus () : 
     global motors_status 
-    return motors_status.get['fan']
+    return motors_status.get('fan')
 def getHeaterStatus() : 
     global motors_status 
-    return motors_status.get['heater']
+    return motors_status.get('heater')
 def setMotorStatus(component , action):
-    global motors_status
-    motors_status[component] = bool(action)
+    set_status(component , bool(action))
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+
+from integration.supabase import get_client
+from utils.paths import data_path
+
+TTL = 300.0  # seconds before presets are refreshed from Supabase
+RETRY_DELAY = 30.0  # seconds between attempts while Supabase is unreachable
+STARTUP_DELAY = 2.0  # with a snapshot to serve, the first refresh (and Supabase import) waits until the server is up
+
+
+class EggProfileCache:
+    """All egg presets from `egg_info`, loaded in one query and served from memory.
+
+    Every successful load is written to a local snapshot, which is what a
+    cold start serves until Supabase answers (or when it never does).
+    Lookups never wait for Supabase: with no snapshot they return nothing
+    until the background refresh lands. Listeners are called (without
+    arguments) whenever the presets change, so the controllers retarget.
+    """
+
+    def __init__(self, table='egg_info', ttl=TTL, snapshot=None):
+        self.table = table
+        self.ttl = ttl
+        self.snapshot = snapshot or data_path('egg_profiles.json')
+        self.profiles = {}
+        self.loaded_at = 0.0
+        self.source = None
+        self.last_error = None
+        self.failed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._listeners = []
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _changed(self):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"\033[91mEgg profile listener failed: {e}\033[0m")
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot):
+            return False
+        try:
+            with open(self.snapshot, 'r', encoding='utf-8') as f:
+                profiles = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"\033[93m[WARN] Ignoring unreadable egg profile snapshot: {e}\033[0m")
+            return False
+        with self._lock:
+            loaded = not self.profiles
+            if loaded:
+                self.profiles = profiles
+                self.source = 'snapshot'
+        if loaded:
+            self._changed()
+        return True
+
+    def refresh(self):
+        try:
+            response = get_client().table(self.table).select('*').execute()
+        except Exception as e:
+            self.last_error = str(e)
+            self.failed_at = time.time()
+            print(f"\033[91mCould not load egg profiles, serving cached ones: {e}\033[0m")
+            return False
+        profiles = {row['egg_type']: row for row in response.data or [] if row.get('egg_type')}
+        with self._lock:
+            changed = profiles != self.profiles
+            self.profiles = profiles
+            self.loaded_at = time.time()
+            self.source = 'supabase'
+            self.last_error = None
+        try:
+            tmp = self.snapshot + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(profiles, f)
+            os.replace(tmp, self.snapshot)
+        except OSError as e:
+            print(f"\033[93m[WARN] Could not write egg profile snapshot: {e}\033[0m")
+        if changed:
+            self._changed()
+        return True
+
+    def refresh_in_background(self, delay=0.0, finished=None):
+        # `finished()` runs after this refresh, whether Supabase answered or not
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                if delay:
+                    time.sleep(delay)
+                self.refresh()
+            finally:
+                self._refreshing = False
+                if finished is not None:
+                    finished()
+
+        threading.Thread(target=run, name='egg-profiles', daemon=True).start()
+
+    def invalidate(self):
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+        self.refresh_in_background()
+
+    def _check_fresh(self):
+        # Never blocks: callers get what is cached (maybe nothing yet) while the refresh runs
+        now = time.time()
+        if now - self.loaded_at > self.ttl and now - self.failed_at > RETRY_DELAY:
+            self.refresh_in_background()
+
+    def loading(self):
+        # Nothing to serve yet, but the first load has not failed (or is being retried)
+        return not self.profiles and (self._refreshing or self.last_error is None)
+
+    def get(self, egg):
+        self._check_fresh()
+        with self._lock:
+            return dict(self.profiles.get(egg) or {})
+
+    def all(self):
+        self._check_fresh()
+        with self._lock:
+            return list(self.profiles.values())
+
+    def stats(self):
+        return {
+            'count': len(self.profiles),
+            'source': self.source,
+            'loading': self.loading(),
+            'loaded_at': self.loaded_at or None,
+            'last_error': self.last_error,
+        }
+
+
+egg_profiles = EggProfileCache()
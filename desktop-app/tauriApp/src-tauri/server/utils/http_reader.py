@@ -0,0 +1,154 @@
+import asyncio
+import random
+import time
+
+from utils.loop import run_blocking
+
+POLL_INTERVAL = 4.0     # starting interval, seconds
+MIN_INTERVAL = 1.0      # while readings move quickly
+MAX_INTERVAL = 15.0     # while readings sit still
+MAX_BACKOFF = 60.0      # ceiling for retries of a failing endpoint
+REQUEST_TIMEOUT = 3.0   # per request, so one dead sensor can't hold up its own schedule
+
+# Change between two polls that counts as "moving" / "still"
+FAST_CHANGE = {'temperature': 0.2, 'humidity': 1.0}
+STILL_CHANGE = {'temperature': 0.02, 'humidity': 0.1}
+
+_session = None
+_endpoints = {}  # device id -> Endpoint
+
+
+async def get_session():
+    """One pooled session (keep-alive connections) for every HTTP sensor on the loop."""
+    global _session
+    if _session is None or _session.closed:
+        import aiohttp  # deferred: only HTTP sensors need it, and it slows startup
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=4, keepalive_timeout=30)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+class Endpoint:
+    """Polling state of one /sensor URL: validators, adaptive interval and backoff."""
+
+    def __init__(self, device, url, interval=POLL_INTERVAL, timeout=REQUEST_TIMEOUT):
+        import aiohttp
+        self.device = device
+        self.url = url
+        self.interval = interval
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.etag = None
+        self.last_modified = None
+        self.last_values = None
+        self.failures = 0
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_latency = None
+        self.next_poll = None
+
+    def _headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    async def poll(self, session):
+        """The new reading, or None when the sensor says it has not changed (304)."""
+        started = time.perf_counter()
+        async with session.get(self.url, headers=self._headers(), timeout=self.timeout) as response:
+            self.polls += 1
+            self.last_latency = time.perf_counter() - started
+            if response.status == 304:
+                self.not_modified += 1
+                return None
+            response.raise_for_status()
+            # Devices that send validators get conditional requests from now on
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            return await response.json(content_type=None)
+
+    def adapt(self, data):
+        """Speed up while readings change quickly, slow down while they sit still."""
+        if data is None:  # 304: nothing changed since the last poll
+            self.interval = min(MAX_INTERVAL, self.interval * 1.5)
+            return
+        values = {name: data.get(name) for name in FAST_CHANGE if isinstance(data.get(name), (int, float))}
+        previous, self.last_values = self.last_values, values
+        if not previous:
+            return
+        changes = {name: abs(values[name] - previous[name]) for name in values if name in previous}
+        if any(changes[name] >= FAST_CHANGE[name] for name in changes):
+            self.interval = max(MIN_INTERVAL, self.interval / 2)
+        elif all(changes[name] <= STILL_CHANGE[name] for name in changes):
+            self.interval = min(MAX_INTERVAL, self.interval * 1.5)
+
+    def backoff(self):
+        # Exponential with jitter so failing sensors don't retry in lockstep
+        delay = min(MAX_BACKOFF, self.interval * 2 ** self.failures)
+        return delay * random.uniform(0.8, 1.2)
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'interval': self.interval,
+            'polls': self.polls,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+            'consecutive_failures': self.failures,
+            'last_error': self.last_error,
+            'last_latency': self.last_latency,
+            'next_poll_in': None if self.next_poll is None else max(0.0, self.next_poll - time.monotonic()),
+        }
+
+
+async def fetch_loop(device):
+    """Poll one device's sensor until cancelled; every device runs one of these on the shared loop."""
+    endpoint = Endpoint(device, device.url)
+    _endpoints[device.id] = endpoint
+    try:
+        while True:
+            try:
+                data = await endpoint.poll(await get_session())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                endpoint.last_error = str(e) or type(e).__name__
+                if endpoint.failures == 1 or endpoint.failures % 10 == 0:
+                    print(f"\033[91mHTTP fetch error ({device.id}, {endpoint.failures} in a row): {endpoint.last_error}\033[0m")
+                delay = endpoint.backoff()
+            else:
+                endpoint.failures = 0
+                endpoint.last_error = None
+                device.connected = True
+                if data is not None:
+                    # SQLite, the supervision log, analytics and listeners: kept off the shared loop
+                    await run_blocking(device.publish_sample, data)
+                endpoint.adapt(data)
+                delay = endpoint.interval
+            endpoint.next_poll = time.monotonic() + delay
+            await asyncio.sleep(delay)
+    finally:
+        if _endpoints.get(device.id) is endpoint:
+            del _endpoints[device.id]
+
+
+def endpoint_stats(device_id):
+    endpoint = _endpoints.get(device_id)
+    return endpoint.stats() if endpoint else None
+
+
+def all_endpoint_stats():
+    return {device_id: endpoint.stats() for device_id, endpoint in list(_endpoints.items())}
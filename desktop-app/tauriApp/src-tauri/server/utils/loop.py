@@ -0,0 +1,56 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for blocking work started from the loop (serial commands, Supabase, controllers, mode changes)
+BLOCKING_WORKERS = int(os.environ.get('INCUBATOR_BLOCKING_WORKERS', '8'))
+# Flask views under the async server get their own pool: a manual route waiting up to
+# CONFIRM_TIMEOUT for the board must not starve acquisition and control
+REQUEST_WORKERS = int(os.environ.get('INCUBATOR_REQUEST_WORKERS', '16'))
+
+_loop = None
+_executor = None
+_request_executor = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """The background event loop shared by every device's async tasks."""
+    global _loop, _executor
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _executor = ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix='blocking')
+            # run_in_executor(None, ...) anywhere on the loop uses the bounded pool
+            _loop.set_default_executor(_executor)
+            thread = threading.Thread(target=_loop.run_forever, name='event-loop', daemon=True)
+            thread.start()
+        return _loop
+
+
+def get_executor():
+    get_loop()
+    return _executor
+
+
+def get_request_executor():
+    global _request_executor
+    with _lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(REQUEST_WORKERS, thread_name_prefix='request')
+        return _request_executor
+
+
+def run_coroutine(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+async def run_blocking(function, *args):
+    """Run a blocking call in the bounded pool without holding up the loop."""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), function, *args)
+
+
+async def run_request(function, *args):
+    """Run a Flask view in the request pool, apart from acquisition and control."""
+    return await asyncio.get_running_loop().run_in_executor(get_request_executor(), function, *args)
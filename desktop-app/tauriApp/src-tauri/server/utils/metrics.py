@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+
+# Seconds; covers sub-millisecond parsing up to slow cloud inserts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            lines.append(f'{self.name}_total{_label_text(self.label_names, values)} {_number(child.value)}')
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                labels = _label_text(self.label_names + ('le',), values + (_number(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _label_text(self.label_names, values)
+            lines.append(f'{self.name}_sum{labels} {_number(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Collected(_Metric):
+    """Values read when scraped: `collect()` returns {label values tuple: value}.
+
+    Used for state that already lives elsewhere (parser counters, thread
+    liveness), so the hot path pays nothing for it.
+    """
+
+    def __init__(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = self.header()
+        name = self.name + '_total' if self.kind == 'counter' else self.name
+        try:
+            values = self.collect() if self.collect else {}
+        except Exception as e:
+            print(f"\033[91mMetric {self.name} failed: {e}\033[0m")
+            values = {}
+        for label_values, value in values.items():
+            if value is None:
+                continue
+            lines.append(f'{name}{_label_text(self.label_names, label_values)} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collected(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        return self.register(Collected(name, documentation, labels, collect, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Registry()
+
+# Hot-path instruments, updated where the work happens
+samples_read = metrics.counter('incubator_samples', 'Samples published per device', ('device',))
+serial_command_seconds = metrics.histogram('incubator_serial_command_seconds', 'Actuator command latency, queued to written/acknowledged', ('command',))
+serial_command_failures = metrics.counter('incubator_serial_command_failures', 'Actuator commands that failed or timed out', ('command',))
+actuator_frames = metrics.counter('incubator_actuator_frames', 'Actuator frames sent per device (several commands each when changes coalesce)', ('device',))
+actuator_commands = metrics.counter('incubator_actuator_commands', 'Actuator commands confirmed per device', ('device',))
+supabase_insert_seconds = metrics.histogram('incubator_supabase_insert_seconds', 'Duration of one bulk insert into Supabase')
+supabase_insert_failures = metrics.counter('incubator_supabase_insert_failures', 'Bulk inserts into Supabase that failed')
+supabase_rows = metrics.counter('incubator_supabase_rows', 'Rows written to Supabase')
+supabase_quarantined_rows = metrics.counter('incubator_supabase_quarantined_rows', 'Rows Supabase refused, moved to the quarantine file')
+controller_decision_seconds = metrics.histogram('incubator_controller_decision_seconds', 'Sample acquisition to control decision applied', ('device',))
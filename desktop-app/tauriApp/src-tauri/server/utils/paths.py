@@ -0,0 +1,12 @@
+import os
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Local runtime files (outbox, local history, logs) live next to the server code
+DATA_DIR = os.environ.get('INCUBATOR_DATA_DIR', os.path.join(SERVER_DIR, 'data'))
+
+
+def data_path(*parts):
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
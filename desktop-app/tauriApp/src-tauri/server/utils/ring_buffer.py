@@ -0,0 +1,94 @@
+import threading
+from array import array
+
+DEFAULT_CAPACITY = 86400  # 24 h at 1 Hz
+
+
+class SampleRing:
+    """Fixed-capacity history of recent samples in preallocated columns.
+
+    Timestamps, temperatures and humidities live in three `array('d')`
+    columns allocated once, so appending never allocates and a query only
+    copies the slice it returns.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.temperatures = array('d', bytes(8 * capacity))
+        self.humidities = array('d', bytes(8 * capacity))
+        self._next = 0  # slot the next sample goes into
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, temperature, humidity):
+        nan = float('nan')
+        with self._lock:
+            i = self._next
+            self.timestamps[i] = timestamp
+            self.temperatures[i] = nan if temperature is None else temperature
+            self.humidities[i] = nan if humidity is None else humidity
+            self._next = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _physical(self, logical):
+        # Logical index 0 is the oldest sample still in the buffer
+        return (self._next - self._count + logical) % self.capacity
+
+    def _slice(self, start):
+        """Columns for logical indices start.._count, oldest first."""
+        first = self._physical(start)
+        size = self._count - start
+        end = first + size
+        columns = (self.timestamps, self.temperatures, self.humidities)
+        if end <= self.capacity:
+            return [column[first:end] for column in columns]
+        # Wrapped: two copies of exactly the requested samples
+        return [column[first:] + column[:end - self.capacity] for column in columns]
+
+    def latest(self):
+        with self._lock:
+            if not self._count:
+                return None
+            i = self._physical(self._count - 1)
+            return {
+                'timestamp': self.timestamps[i],
+                'temperature': _or_none(self.temperatures[i]),
+                'humidity': _or_none(self.humidities[i]),
+            }
+
+    def last(self, n):
+        with self._lock:
+            n = max(0, min(n, self._count))
+            return self._slice(self._count - n)
+
+    def since(self, timestamp):
+        with self._lock:
+            # Samples are appended in time order, so bisect over logical indices
+            low, high = 0, self._count
+            while low < high:
+                mid = (low + high) // 2
+                if self.timestamps[self._physical(mid)] < timestamp:
+                    low = mid + 1
+                else:
+                    high = mid
+            return self._slice(low)
+
+
+def _or_none(value):
+    # Missing values are stored as NaN, which is not valid JSON
+    return None if value != value else value
+
+
+def columns_to_json(columns):
+    timestamps, temperatures, humidities = columns
+    return {
+        'count': len(timestamps),
+        'timestamp': list(timestamps),
+        'temperature': [_or_none(v) for v in temperatures],
+        'humidity': [_or_none(v) for v in humidities],
+    }
@@ -0,0 +1,111 @@
+"""Latest sensor state of every incubator, as immutable versioned snapshots.
+
+Every published sample becomes a `Snapshot` with the next sequence number
+of the store. Readers never lock: the per-device table is replaced, not
+changed, on every publish, and a snapshot itself cannot be modified.
+Consumers that want the next reading wait for a sequence number newer than
+the one they last saw: `wait()` from a thread and `await wait_async()`
+from the event loop. They don't poll. Waiting returns the newest snapshot,
+so a slow consumer skips versions instead of queueing them.
+"""
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+
+class FrozenSample(dict):
+    """A sample dict that refuses changes (still a dict for JSON and readers)."""
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('snapshots are immutable; copy with dict(sample)')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
+
+
+class Snapshot(namedtuple('Snapshot', 'seq timestamp device data')):
+    __slots__ = ()
+
+    def as_json(self):
+        return dict(self.data, seq=self.seq)
+
+
+class StateStore:
+    def __init__(self):
+        self._latest = {}  # device id -> Snapshot; replaced on publish, never mutated
+        self._newest = None
+        self.version = 0
+        self._cond = threading.Condition()
+        self._waiters = {}  # device id (None: any device) -> set of (loop, future)
+
+    def publish(self, device_id, sample):
+        with self._cond:
+            self.version += 1
+            data = sample if isinstance(sample, FrozenSample) else FrozenSample(sample)
+            snapshot = Snapshot(self.version, sample.get('timestamp') or time.time(), device_id, data)
+            latest = dict(self._latest)
+            latest[device_id] = snapshot
+            self._latest = latest
+            self._newest = snapshot
+            waiters = self._waiters.pop(device_id, set()) | self._waiters.pop(None, set())
+            self._cond.notify_all()
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, future)
+        return snapshot
+
+    def latest(self, device_id):
+        """The device's newest snapshot, or None; no lock taken."""
+        return self._latest.get(device_id)
+
+    def latest_data(self, device_id):
+        snapshot = self._latest.get(device_id)
+        return snapshot.data if snapshot else {}
+
+    def _newer(self, after, device_id):
+        snapshot = self._newest if device_id is None else self._latest.get(device_id)
+        return snapshot if snapshot is not None and snapshot.seq > after else None
+
+    def wait(self, after=0, device_id=None, timeout=None):
+        """Newest snapshot with a sequence number above `after` (of one device or any); None on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._newer(after, device_id), timeout)
+            return self._newer(after, device_id)
+
+    async def wait_async(self, after=0, device_id=None, timeout=None):
+        """`wait()` for coroutines: the loop is woken by publish, no thread is held."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            with self._cond:
+                snapshot = self._newer(after, device_id)
+                if snapshot is not None:
+                    return snapshot
+                self._waiters.setdefault(device_id, set()).add((loop, future))
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return self._newer(after, device_id)
+            finally:
+                with self._cond:
+                    self._waiters.get(device_id, set()).discard((loop, future))
+
+    def stats(self):
+        with self._cond:
+            waiting = sum(len(waiters) for waiters in self._waiters.values())
+        return {
+            'version': self.version,
+            'devices': {device_id: {'seq': s.seq, 'timestamp': s.timestamp} for device_id, s in self._latest.items()},
+            'waiting': waiting,
+        }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+state_store = StateStore()
@@ -0,0 +1,353 @@
+import threading
+import time
+
+from utils.auto import AutoController
+from utils.http_reader import all_endpoint_stats, close_session, endpoint_stats, fetch_loop
+from utils.loop import run_coroutine
+from utils.sensor_writer import get_writer, stop_writer
+from utils.serial_port import all_port_managers, close_port_manager, find_port_manager
+from utils.metrics import metrics
+from utils.supervision_log import close_logs
+from utils.state_store import state_store
+import utils.serial_reader as serial_reader
+
+CHECK_INTERVAL = 5.0   # seconds between health checks
+CONTROLLER_STOP_TIMEOUT = 2.0
+MAX_RESTART_DELAY = 60.0  # ceiling of the backoff between restarts of a reader that keeps failing
+
+
+class _Tasks:
+    """What the supervisor runs for one device."""
+
+    def __init__(self, device):
+        self.device = device
+        self.source = None  # (connection type, port, baudrate, url) the reader was started with
+        self.reader = None  # http: future on the shared loop; serial: connect / simulation thread
+        self.reader_stop = None
+        self.reader_started_at = None
+        self.reader_restarts = 0
+        self.reader_error = None
+        self.reader_failures = 0  # restarts in a row without the reader getting connected
+        self.reader_retry_at = None  # when a dead reader is started again
+        self.auto_enabled = True  # automatic mode unless a manual switch said otherwise
+        self.controller_restarts = 0
+        self.lock = threading.RLock()
+
+
+def _source(device):
+    if device.connection_type == 'serial':
+        return ('serial', device.port, device.baudrate, None)
+    return ('http', None, None, device.url)
+
+
+class AcquisitionSupervisor:
+    """Owns the reader, writer and controller of every device.
+
+    Saving settings calls `apply()`, which is idempotent: a reader is only
+    restarted when its source actually changed, and each device has at most
+    one reader, one controller and one writer listener. A watchdog thread
+    restarts tasks that died on their own.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def _get(self, device):
+        with self._lock:
+            tasks = self._tasks.get(device.id)
+            if tasks is None:
+                tasks = _Tasks(device)
+                self._tasks[device.id] = tasks
+            return tasks
+
+    def apply(self, device):
+        tasks = self._get(device)
+        with tasks.lock:
+            get_writer()
+            # Samples kept by the compressor are queued for the batched writer
+            device.add_archive_listener(serial_reader.save_data_to_supabase)
+            source = _source(device)
+            if source != tasks.source or not self._reader_alive(tasks):
+                if tasks.source is not None:
+                    print(f"\033[94mRestarting reader for {device.id}: {tasks.source} -> {source}\033[0m")
+                    tasks.reader_restarts += 1
+                if source != tasks.source:
+                    tasks.reader_failures = 0
+                    tasks.reader_error = None
+                tasks.reader_retry_at = None
+                self._stop_reader(tasks)
+                self._start_reader(tasks, source)
+            if tasks.auto_enabled:
+                self._start_controller(tasks)
+        self._start_watchdog()
+
+    def mode(self, device):
+        """'automatic' or 'manual': what runs for the device, or will once its settings are saved."""
+        tasks = self._get(device)
+        with tasks.lock:
+            return 'automatic' if tasks.auto_enabled else 'manual'
+
+    def start_controller(self, device):
+        tasks = self._get(device)
+        with tasks.lock:
+            tasks.auto_enabled = True
+            self._start_controller(tasks)
+
+    def stop_controller(self, device):
+        tasks = self._get(device)
+        with tasks.lock:
+            tasks.auto_enabled = False
+            self._stop_controller(tasks)
+
+    def _start_reader(self, tasks, source):
+        device = tasks.device
+        kind, port, baudrate, url = source
+        tasks.source = source
+        tasks.reader_started_at = time.time()
+        tasks.reader_stop = threading.Event()
+        device.use_simulation = False
+        if kind == 'serial':
+            print(f"\033[92mStarting serial reader for {device.id} with port: {port}, baudrate: {baudrate}\033[0m")
+            # Opening the port resets the board: its outputs are unknown until commanded again
+            device.actuators.invalidate()
+            tasks.reader = serial_reader.start_serial_reader(port=port, baudrate=baudrate, device_id=device.id, stop=tasks.reader_stop)
+        else:
+            print(f"\033[94mStarting HTTP polling for {device.id}\033[0m")
+            # HTTP sources of all incubators share one event loop
+            tasks.reader = run_coroutine(fetch_loop(device))
+
+    def _stop_reader(self, tasks):
+        if tasks.source is None:
+            return
+        device = tasks.device
+        kind, port, _, _ = tasks.source
+        if tasks.reader_stop is not None:
+            tasks.reader_stop.set()
+        if kind == 'serial':
+            manager = find_port_manager(port)
+            if manager is not None:
+                manager.remove_sample_handler(serial_reader.sample_handler(device.id))
+                manager.remove_reconnect_handler(serial_reader.reconnect_handler(device.id))
+                if not manager.has_sample_handlers():
+                    close_port_manager(port)
+        elif tasks.reader is not None:
+            tasks.reader.cancel()
+        tasks.reader = None
+        tasks.source = None
+        device.connected = False
+
+    def _reader_alive(self, tasks):
+        if tasks.source is None:
+            return False
+        if tasks.source[0] == 'http':
+            return tasks.reader is not None and not tasks.reader.done()
+        if tasks.reader is not None and tasks.reader.is_alive():
+            return True  # still connecting or simulating
+        manager = find_port_manager(tasks.source[1])
+        return manager is not None and manager.is_running()
+
+    def _start_controller(self, tasks):
+        device = tasks.device
+        if device.auto_running():
+            return
+        device.auto = AutoController(device)
+        # Controllers of all incubators run as tasks on the shared event loop
+        device.auto_future = run_coroutine(device.auto.run())
+
+    def _stop_controller(self, tasks):
+        device = tasks.device
+        if device.auto:
+            device.auto.stop()
+        if device.auto_future:
+            try:
+                device.auto_future.result(timeout=CONTROLLER_STOP_TIMEOUT)
+            except Exception:
+                pass
+
+    def stop(self, device):
+        tasks = self._get(device)
+        with tasks.lock:
+            self._stop_controller(tasks)
+            self._stop_reader(tasks)
+            device.flush_archive()
+            device.rollups.flush()
+            device.remove_archive_listener(serial_reader.save_data_to_supabase)
+
+    def shutdown(self):
+        """Stop every controller and reader, then flush the writer."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        with self._lock:
+            tasks = list(self._tasks.values())
+        for t in tasks:
+            try:
+                self.stop(t.device)
+            except Exception as e:
+                print(f"\033[91mError while stopping {t.device.id}: {e}\033[0m")
+        try:
+            run_coroutine(close_session()).result(timeout=CONTROLLER_STOP_TIMEOUT)
+        except Exception:
+            pass
+        stop_writer()
+        close_logs()
+        print("\033[92m[INFO] Acquisition stopped\033[0m")
+
+    def _start_watchdog(self):
+        with self._lock:
+            if self._watchdog is not None and self._watchdog.is_alive():
+                return
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='supervisor', daemon=True)
+            self._watchdog.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            with self._lock:
+                tasks = list(self._tasks.values())
+            for t in tasks:
+                self.check(t)
+
+    def check(self, tasks):
+        with tasks.lock:
+            device = tasks.device
+            if tasks.source is not None and not self._reader_alive(tasks):
+                now = time.time()
+                if tasks.reader_retry_at is None:
+                    future = tasks.reader
+                    if tasks.source[0] == 'http' and future is not None and future.done() and not future.cancelled():
+                        tasks.reader_error = repr(future.exception())
+                    elif tasks.source[0] == 'serial':
+                        tasks.reader_error = device.reader_error or 'serial reader stopped'
+                    # Right away the first time, then backing off while it keeps failing
+                    delay = 0.0 if not tasks.reader_failures else min(MAX_RESTART_DELAY, self.check_interval * 2 ** (tasks.reader_failures - 1))
+                    tasks.reader_failures += 1
+                    tasks.reader_retry_at = now + delay
+                    print(f"\033[93m[WARN] Reader for {device.id} stopped ({tasks.reader_error}), restarting in {delay:.0f} s\033[0m")
+                if now >= tasks.reader_retry_at:
+                    source = tasks.source
+                    self._stop_reader(tasks)
+                    self._start_reader(tasks, source)
+                    tasks.reader_retry_at = None
+                    tasks.reader_restarts += 1
+            elif tasks.source is not None and device.connected:
+                tasks.reader_failures = 0
+                tasks.reader_error = None
+            if tasks.auto_enabled and tasks.source is not None and not device.auto_running():
+                if device.auto_future is not None:
+                    print(f"\033[93m[WARN] Controller for {device.id} stopped, restarting\033[0m")
+                    tasks.controller_restarts += 1
+                self._start_controller(tasks)
+            get_writer()  # restarts the writer thread if it died
+
+    def _frame_stats(self, tasks):
+        if tasks.source is None:
+            return None
+        if tasks.source[0] == 'http':
+            return endpoint_stats(tasks.device.id)
+        manager = find_port_manager(tasks.source[1])
+        return manager.stats() if manager is not None else None
+
+    def health(self, device=None):
+        with self._lock:
+            tasks = [t for t in self._tasks.values() if device is None or t.device is device]
+        devices = {}
+        for t in tasks:
+            with t.lock:
+                snapshot = t.device.snapshot()
+                latest = snapshot.timestamp if snapshot else None
+                devices[t.device.id] = {
+                    'reader': {
+                        'source': t.source[0] if t.source else None,
+                        'running': self._reader_alive(t),
+                        'connected': t.device.connected,
+                        'started_at': t.reader_started_at,
+                        'restarts': t.reader_restarts,
+                        'last_error': t.reader_error,
+                        'next_restart_in': None if t.reader_retry_at is None else max(0.0, t.reader_retry_at - time.time()),
+                        'last_sample_age': None if latest is None else time.time() - latest,
+                        'last_seq': snapshot.seq if snapshot else None,
+                        'frames': self._frame_stats(t),
+                    },
+                    'controller': {
+                        'enabled': t.auto_enabled,
+                        'running': t.device.auto_running(),
+                        'restarts': t.controller_restarts,
+                    },
+                }
+        writer = get_writer().stats()
+        return {
+            'devices': devices,
+            'writer': {'running': writer['running'], 'queue_depth': writer['queue_depth'], 'last_error': writer['last_error']},
+            'watchdog': self._watchdog is not None and self._watchdog.is_alive(),
+        }
+
+
+supervisor = AcquisitionSupervisor()
+
+
+def _frame_counter(key):
+    return lambda: {(m.port,): m.parser.stats()[key] for m in all_port_managers()}
+
+
+def _parse_failures():
+    failures = {}
+    for m in all_port_managers():
+        stats = m.parser.stats()
+        failures[(m.port,)] = stats['parse_errors'] + stats['checksum_errors'] + stats['length_errors']
+    return failures
+
+
+def _http_stat(key):
+    return lambda: {(device_id,): stats[key] for device_id, stats in all_endpoint_stats().items()}
+
+
+def _staleness():
+    now = time.time()
+    return {(device_id,): now - s['timestamp'] for device_id, s in state_store.stats()['devices'].items()}
+
+
+def _state_seq():
+    return {(device_id,): s['seq'] for device_id, s in state_store.stats()['devices'].items()}
+
+
+def _compression(key):
+    def collect():
+        with supervisor._lock:
+            devices = [t.device for t in supervisor._tasks.values()]
+        stats = {d.id: d.compressor.stats() for d in devices if d.compressor}
+        return {(device_id,): s[key] for device_id, s in stats.items()}
+    return collect
+
+
+def _task_liveness():
+    alive = {}
+    health = supervisor.health()
+    for device_id, tasks in health['devices'].items():
+        alive[(device_id, 'reader')] = int(tasks['reader']['running'])
+        alive[(device_id, 'controller')] = int(tasks['controller']['running'])
+    alive[('', 'writer')] = int(health['writer']['running'])
+    alive[('', 'watchdog')] = int(health['watchdog'])
+    return alive
+
+
+# Read at scrape time from state the tasks keep anyway
+metrics.collected('incubator_serial_text_frames', 'Text frames parsed per port', ('port',), _frame_counter('text_frames'), kind='counter')
+metrics.collected('incubator_serial_binary_frames', 'Binary frames parsed per port', ('port',), _frame_counter('binary_frames'), kind='counter')
+metrics.collected('incubator_parse_failures', 'Unparseable lines, bad checksums and bad lengths per port', ('port',), _parse_failures, kind='counter')
+metrics.collected('incubator_serial_checksum_errors', 'Binary frames dropped for a bad CRC per port', ('port',), _frame_counter('checksum_errors'), kind='counter')
+metrics.collected('incubator_serial_length_errors', 'Binary headers dropped for a length above MAX_PAYLOAD per port', ('port',), _frame_counter('length_errors'), kind='counter')
+metrics.collected('incubator_serial_resyncs', 'Times the parser skipped garbage to find the next frame', ('port',), _frame_counter('resyncs'), kind='counter')
+metrics.collected('incubator_http_polls', 'HTTP sensor polls per device', ('device',), _http_stat('polls'), kind='counter')
+metrics.collected('incubator_http_not_modified', 'HTTP sensor polls answered 304 Not Modified', ('device',), _http_stat('not_modified'), kind='counter')
+metrics.collected('incubator_http_errors', 'Failed HTTP sensor polls', ('device',), _http_stat('errors'), kind='counter')
+metrics.collected('incubator_http_poll_interval_seconds', 'Current adaptive poll interval per device', ('device',), _http_stat('interval'))
+metrics.collected('incubator_reader_staleness_seconds', 'Seconds since the last sample per device', ('device',), _staleness)
+metrics.collected('incubator_state_seq', 'Sequence number of the newest state snapshot per device', ('device',), _state_seq, kind='counter')
+metrics.collected('incubator_samples_stored', 'Samples kept by the compressor for history and Supabase', ('device',), _compression('stored'), kind='counter')
+metrics.collected('incubator_compression_ratio', 'Samples received per sample stored', ('device',), _compression('ratio'))
+metrics.collected('incubator_task_alive', 'Whether a supervised task is running (1) or not (0)', ('device', 'task'), _task_liveness)
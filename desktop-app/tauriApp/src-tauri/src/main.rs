@@ -1,17 +1,55 @@
+use std::io::{Read, Write};
+use std::net::{SocketAddr, TcpStream};
 use std::process::{Command, Child};
 use std::sync::{Arc, Mutex};
+use std::thread;
+use std::time::{Duration, Instant};
 use tauri::{RunEvent};
 
+const BACKEND_ADDR: &str = "127.0.0.1:3000";
+const READY_TIMEOUT: Duration = Duration::from_secs(20);
+
 fn spawn_flask() -> Child {
   
     Command::new("python")
         .arg("./server/app.py") // Adjust this path if needed
+        .args(["--server", "async"]) // routes share the acquisition event loop
         .spawn()
         .expect("failed to start Flask server")
 }
 
+// One GET /api/ready; true once the backend answers 200
+fn backend_ready(addr: &SocketAddr) -> bool {
+    let mut stream = match TcpStream::connect_timeout(addr, Duration::from_millis(200)) {
+        Ok(stream) => stream,
+        Err(_) => return false,
+    };
+    let _ = stream.set_read_timeout(Some(Duration::from_millis(500)));
+    if stream.write_all(b"GET /api/ready HTTP/1.0\r\nHost: localhost\r\n\r\n").is_err() {
+        return false;
+    }
+    // "HTTP/1.x 200"
+    let mut status = [0u8; 12];
+    stream.read_exact(&mut status).is_ok() && &status[9..12] == b"200"
+}
+
+// Keep the UI from calling the API before the backend listens
+fn wait_for_backend() {
+    let addr: SocketAddr = BACKEND_ADDR.parse().unwrap();
+    let started = Instant::now();
+    while started.elapsed() < READY_TIMEOUT {
+        if backend_ready(&addr) {
+            println!("backend ready after {} ms", started.elapsed().as_millis());
+            return;
+        }
+        thread::sleep(Duration::from_millis(50));
+    }
+    eprintln!("backend not ready after {} s, starting the UI anyway", READY_TIMEOUT.as_secs());
+}
+
 fn main() {
     let flask_process = Arc::new(Mutex::new(Some(spawn_flask())));
+    wait_for_backend();
     
     let flask_process_clone = flask_process.clone();
 
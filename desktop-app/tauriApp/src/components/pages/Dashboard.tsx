@@ -18,7 +18,7 @@ import useApi from '../../hooks/use-api.js'
 const Dashboard = () => {
   const { getCurrentEggType } = useEggType();
   const currentEggType = getCurrentEggType();
-  const {getAnalytics} = useApi();
+  const {subscribeLive, getHistory} = useApi();
   const [sensorData, setSensorData] = useState({
     temperature: 0,
     humidity: 0,
@@ -51,39 +51,67 @@ const Dashboard = () => {
   const [chartData, setChartData] = useState(() => generateInitialData("24h"));
 
   useEffect(() => {
-    const fetchData = async () => {
-      const data  = await getAnalytics();
-      if (data && data.length > 0) {
-        const latest = data[0] as { temperature: number; humidity: number };
-        setSensorData((prev) => ({
-          ...prev,
-          temperature: latest.temperature,
-          humidity: latest.humidity,
-        }));
-        // Push latest reading into chart for 24h range for a subtle live feel
-        setChartData((prev) => {
-          if (prev.length === 0) return prev;
-          const label = new Date().toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" });
-          const nextPoint = {
-            time: label,
-            temperature: latest.temperature + (Math.random() * 0.4 - 0.2),
-            humidity: latest.humidity + (Math.random() * 1.5 - 0.75),
-          };
-          const next = [...prev];
-          next.shift();
-          next.push(nextPoint);
-          return next;
-        });
-      }
+    const applyReading = (latest: { temperature: number; humidity: number }) => {
+      setSensorData((prev) => ({
+        ...prev,
+        temperature: latest.temperature,
+        humidity: latest.humidity,
+      }));
+      // Push latest reading into chart for a live feel
+      setChartData((prev) => {
+        if (prev.length === 0) return prev;
+        const label = new Date().toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" });
+        const next = [...prev];
+        next.shift();
+        next.push({ time: label, temperature: latest.temperature, humidity: latest.humidity });
+        return next;
+      });
     };
-    fetchData();
-    const interval = setInterval(fetchData, 5000);
-    return () => clearInterval(interval);
+    const actuatorKeys: Record<string, keyof typeof actuatorStates> = {
+      fan: "fan",
+      hum: "waterValve",
+      motor: "rotationMotor",
+      heater: "heater",
+    };
+
+    // The backend sends the current state on connect, then every new reading
+    const unsubscribe = subscribeLive({
+      onReading: applyReading,
+      onActuator: ({ name, active }: { name: string; active: boolean }) => {
+        const key = actuatorKeys[name];
+        if (key) setActuatorStates((prev) => ({ ...prev, [key]: active }));
+      },
+    });
+    return unsubscribe;
   }, []);
 
-  // Update chart when range changes
+  // Update chart when range changes, from the backend's local history when available
   useEffect(() => {
+    const rangeSeconds = chartRange === "24h" ? 86400 : chartRange === "7d" ? 7 * 86400 : 30 * 86400;
+    const points = chartRange === "24h" ? 24 : chartRange === "7d" ? 7 * 8 : 30;
+    const now = Date.now() / 1000;
+    let cancelled = false;
     setChartData(generateInitialData(chartRange));
+    getHistory(now - rangeSeconds, now, points)
+      .then((rows: { timestamp: number; temperature: number; humidity: number }[]) => {
+        if (cancelled || !rows || rows.length === 0) return;
+        const step = Math.max(1, Math.floor(rows.length / points));
+        setChartData(
+          rows
+            .filter((_, idx) => idx % step === 0)
+            .map((row) => ({
+              time: new Date(row.timestamp * 1000).toLocaleString([], chartRange === "24h"
+                ? { hour: "2-digit", minute: "2-digit" }
+                : { month: "short", day: "numeric", hour: "2-digit" }),
+              temperature: row.temperature,
+              humidity: row.humidity,
+            }))
+        );
+      })
+      .catch((error) => console.error("Error loading history:", error));
+    return () => {
+      cancelled = true;
+    };
   }, [chartRange]);
 
   // Simple trend helpers
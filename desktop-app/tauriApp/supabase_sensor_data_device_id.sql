@@ -0,0 +1,11 @@
+-- Column needed on sensor_data when the backend runs more than one incubator
+-- Run these commands in your Supabase SQL Editor
+
+-- Rows of the default incubator leave it empty, the others carry their device id
+ALTER TABLE public.sensor_data ADD COLUMN IF NOT EXISTS device_id text;
+
+-- History per incubator is read by device and time
+CREATE INDEX IF NOT EXISTS sensor_data_device_id_created_at_idx ON public.sensor_data (device_id, created_at);
+
+-- Verify the table structure
+SELECT * FROM public.sensor_data LIMIT 5;
@@ -1,84 +1,78 @@
-
-from flask import Flask, request, jsonify
+from utils import startup  # first, so the startup timeline includes every import
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from utils.serial_reader import save_data_to_supabase, get_latest_data, start_serial_reader
-from utils.controller import active_motor, stop_motor, active_heater, stop_heater, active_fan, stop_fan 
-from utils.auto import auto
+from utils.serial_reader import get_latest_data
+from utils.supervisor import supervisor
+from utils.sensor_writer import get_writer
+from utils.devices import registry, DEFAULT_DEVICE
+from utils.egg_profiles import egg_profiles, STARTUP_DELAY
+from utils.mode_switch import ModeSwitcher, MODES
+from routes.api import api
+from utils.broadcast import broadcaster, initial_events
+from utils.metrics import metrics
 import utils.serial_reader as serial_reader
-import threading
-import time
-import aiohttp
-import asyncio
+import argparse
+import atexit
+import os
+startup.mark('imports')
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-saved_settings = {}
-current_egg_type = None
-port = None
-baudrate = None
-connectionType = None
+app.register_blueprint(api)
 tst = True
 
-auto_thread = None
-auto_stop_event = None
-
-async def fetch_url():
-    async with aiohttp.ClientSession() as session:
-        async with session.get("http://localhost:5001/sensor") as response:
-            return await response.json()
-async def fetch_loop():
-    while True:
-        try:
-            data = await fetch_url()
-            print(f"\033[96mHTTP Data: {data}\033[0m")
-            save_data_to_supabase(data)
-        except Exception as e:
-            print(f"\033[91mHTTP fetch error: {e}\033[0m")
-        await asyncio.sleep(4)
-
-
-def background_serial_task():
-    global port, baudrate, connectionType, tst
-    handle_autoMode('start')
-    if connectionType == 'serial':
-       
-        print(f"\033[92mStarting serial reader with port: {port}, baudrate: {baudrate}\033[0m")
-        start_serial_reader(port=port, baudrate=baudrate)
-
-        while True:
-            try:
-                data = get_latest_data() 
-                print(data)  # For debugging
-                temp = data.get('temperature')
-                hum = data.get('humidity')
-                if temp is not None and hum is not None: 
-                    save_data_to_supabase(data)
-                else:
-                    time.sleep(4)  # Wait before trying again
-            except Exception as e:
-                print(f"\033[91mError while saving to Supabase: {e}\033[0m")
-
-            time.sleep(4)
-    else : 
-        print("\033[94mStarting background task for HTTP connection\033[0m")
-        asyncio.run(fetch_loop())
+# Ready once a server listens and egg presets can be served
+startup.wait_for('egg profiles', 'listening')
+
+# Egg presets: the local snapshot serves immediately, Supabase refreshes it in the background
+have_snapshot = egg_profiles.load_snapshot()
+if have_snapshot:
+    startup.done('egg profiles')
+    egg_profiles.refresh_in_background(delay=STARTUP_DELAY)
+else:
+    # Nothing to serve before the first refresh: it settles readiness, loaded or not
+    egg_profiles.refresh_in_background(finished=lambda: startup.done('egg profiles'))
+
+# The default incubator always exists; others appear when their settings are saved
+registry.get(DEFAULT_DEVICE)
+
+# Readers and controllers stop, and the writer flushes, when the server exits
+atexit.register(supervisor.shutdown)
 
-def handle_autoMode(action) :
-    global auto_thread, auto_stop_event
+def requested_device(body=None):
+    # Every route takes an optional device id; without one it targets the default incubator
+    if isinstance(body, dict):
+        device_id = body.get('device') or body.get('deviceId')
+        if device_id:
+            return str(device_id)
+    return request.args.get('device') or DEFAULT_DEVICE
+
+def background_serial_task(device):
+    # Idempotent: starts what is missing, restarts the reader only if its source changed
+    supervisor.apply(device)
+
+def handle_autoMode(action, device) :
     if action == "start":
-        if auto_thread and auto_thread.is_alive():
-            return
-        auto_stop_event = threading.Event()
-        auto_thread = threading.Thread(target=lambda: asyncio.run(auto(current_egg_type,port, baudrate, stop_event=auto_stop_event)) , daemon=True)
-        auto_thread.start()
+        supervisor.start_controller(device)
     else :
-        if auto_stop_event:
-            auto_stop_event.set()
-        if auto_thread:
-            auto_thread.join(timeout=2)
+        supervisor.stop_controller(device)
 
 def start_manual() : 
     pass
 
+def apply_mode(mode, device):
+    if mode == 'automatic' : 
+
+        print(f'\033[94mstarting auto mode on {device.id}\033[0m')
+        handle_autoMode("start", device)
+    
+    else : 
+        print(f'\033[92mstarting manual mode on {device.id}\033[0m')
+        handle_autoMode("stop", device)
+        start_manual()
+
+# Mode changes wait for the device in a worker, never in the request thread
+mode_switcher = ModeSwitcher(apply_mode, supervisor.mode)
+
 @app.route('/api/controlMode' , methods  = ['POST'])
 def controlMode():
     body = request.get_json(silent=True) or {}
@@ -86,100 +80,201 @@ def controlMode():
         data = body
     else:
         data = body.get('controlMode') or body.get('controleMode') or body
-    
-    while not serial_reader.connected : 
-        time.sleep(5)
-    print('connected')
-    
-    if data == 'automatic' : 
+    if data not in MODES:
+        return jsonify({"error": f"Unknown control mode: {data}"}), 400
+    device = registry.find(requested_device(body))
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    transition = mode_switcher.request(device, data)
+    status = 200 if transition.finished() else 202
+    return jsonify({"mode": data, "device": device.id, "transition": transition.describe()}), status
 
-        print('\033[94mstarting auto mode\033[0m')
-        handle_autoMode("start")
-    
-    else : 
-        print('\033[92mstarting manual mode\033[0m')
-        handle_autoMode("stop")
-        start_manual()
-    return jsonify({"mode": data or "unknown"}), 200
+@app.route('/api/controlMode' , methods  = ['GET'])
+def controlModeStatus():
+    device = registry.find(requested_device())
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify(mode_switcher.status(device)), 200
+
+@app.route('/api/controlMode/<transition_id>' , methods  = ['GET'])
+def controlModeTransition(transition_id):
+    transition = mode_switcher.get(transition_id)
+    if transition is None:
+        return jsonify({"error": "Unknown transition"}), 404
+    return jsonify(transition.describe()), 200
 
 @app.route('/api/settings', methods=['POST'])
 def save_settings():
-    global saved_settings , port , baudrate , connectionType
-    settings = request.get_json()
-    saved_settings = settings
-    port = settings.get('serialPort')
-    connectionType = settings.get('connectionType')
-    baudrate = settings.get('baudRate')
-    serial_thread = threading.Thread(target=background_serial_task, daemon=True)
-    serial_thread.start()
-    return jsonify({"message": "Settings saved successfully", "settings": saved_settings})
+    settings = request.get_json(silent=True)
+    if not isinstance(settings, dict):
+        return jsonify({"error": "settings must be a JSON object"}), 400
+    device = registry.get(requested_device(settings))
+    try:
+        device.configure(settings)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    background_serial_task(device)
+    return jsonify({"message": "Settings saved successfully", "settings": device.settings, "device": device.id})
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    # Cheap on purpose: the desktop shell polls it while the backend starts
+    report = startup.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@app.route('/api/devices', methods=['GET'])
+def list_devices():
+    return jsonify({"devices": [device.describe() for device in registry.all()]}), 200
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    # Server-Sent Events: current state first, then every reading and actuator change
+    device_id = request.args.get('device')
+    device = registry.find(device_id) if device_id else None
+    if device_id and device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    devices = [device] if device else registry.all()
+    initial = initial_events(devices)
+    return Response(broadcaster.stream(initial, device_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/auto', methods=['GET'])
+def auto_stats():
+    device = registry.find(requested_device())
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    stats = device.auto.stats() if device.auto else {}
+    return jsonify({"running": device.auto_running(), **stats}), 200
+
+@app.route('/api/health', methods=['GET'])
+def task_health():
+    device_id = request.args.get('device')
+    device = registry.find(device_id) if device_id else None
+    if device_id and device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify(supervisor.health(device)), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/writer', methods=['GET'])
+def writer_stats():
+    return jsonify(get_writer().stats()), 200
 
 @app.route('/api/status', methods=['GET'])
 def check_status():
-    global port, baudrate, tst
+    global tst
+    device = registry.find(requested_device())
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
     if tst:
         # Check if we're using simulation mode
-        from utils.serial_reader import use_simulation
-        if use_simulation:
-            return jsonify({"status": "Connected (Simulation Mode)", "mode": "simulation"})
+        if device.use_simulation:
+            return jsonify({"status": "Connected (Simulation Mode)", "mode": "simulation", "device": device.id})
         else:
-            return jsonify({"status": "Connected", "mode": "real", "port": port, "baudrate": baudrate})
+            return jsonify({"status": "Connected", "mode": "real", "port": device.port, "baudrate": device.baudrate, "device": device.id})
     else:
         return jsonify({"status": "Disconnected", "error": "Serial connection not established"})
 
-    
+
+def actuator_reply(device, confirmed):
+    # The route only sets the desired state; the reply says whether the board confirmed it in time
+    return {'device': device.id, 'confirmed': confirmed, 'actuators': device.actuators.stats()['confirmed']}
+
+
+def manual_action(device, component, action):
+    # 'active' / 'stop' from the manual page; any other action changes nothing
+    if action in ('active', 'stop'):
+        return device.actuate(component, action == 'active')
+    return None
+
 @app.route('/handle_motor_action', methods=['POST'])
 def motor_action():
     data = request.json
     action = data.get('action')
+    device = registry.find(requested_device(data))
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    try:
+        confirmed = manual_action(device, 'motor', action)
+    except ValueError as e:
+        return jsonify({"error": str(e), "device": device.id}), 400
     if action == 'active':
-        active_motor()
-        
         print("\033[93mMotor active\033[0m")
     elif action == 'stop':
-        stop_motor()
         print("\033[91mMotor stop\033[0m")
-    return jsonify({'message': 'Motor action handled'}), 200
+    return jsonify({'message': 'Motor action handled', **actuator_reply(device, confirmed)}), 200
 
 @app.route('/handle_heater_action', methods=['POST'])
 def heater_action():
     data = request.json
     action = data.get('action')
+    device = registry.find(requested_device(data))
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    try:
+        confirmed = manual_action(device, 'heater', action)
+    except ValueError as e:
+        return jsonify({"error": str(e), "device": device.id}), 400
     if action == 'active':
-        active_heater()
         print("\033[93mHeater active\033[0m")
     elif action == 'stop':
-        stop_heater()
         print("\033[91mHeater stop\033[0m")
-    return jsonify({'message': 'Heater action handled'}), 200
-
-current_egg_type = 'chicken'
+    return jsonify({'message': 'Heater action handled', **actuator_reply(device, confirmed)}), 200
 
 @app.route('/api/EggType' , methods=['POST'])
 def getEgg (): 
-    global current_egg_type
     data = request.get_json()
+    device = registry.find(requested_device(data))
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
     
-    current_egg_type = data.get('id')
-    print(f"\033[94mNew egg selected \033[92m{current_egg_type}\033[0m")
-    return jsonify({"message": "Egg type received", "egg": current_egg_type}), 200
+    device.egg_type = data.get('id')
+    egg_profiles.invalidate()
+    if device.auto and device.auto_running():
+        device.auto.retarget()  # setpoints, rotation and ventilation follow the new profile
+    print(f"\033[94mNew egg selected for {device.id} \033[92m{device.egg_type}\033[0m")
+    return jsonify({"message": "Egg type received", "egg": device.egg_type, "device": device.id}), 200
 
 @app.route('/api/EggType' , methods=['GET'])
 def readEgg ():
-    return jsonify({"egg": current_egg_type}), 200
+    device = registry.find(requested_device())
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    return jsonify({"egg": device.egg_type, "device": device.id}), 200
 
     
 @app.route('/handle_fan_action', methods=['POST'])
 def fan_action():
     data = request.json
     action = data.get('action')
+    device = registry.find(requested_device(data))
+    if device is None:
+        return jsonify({"error": "Unknown device"}), 404
+    try:
+        confirmed = manual_action(device, 'fan', action)
+    except ValueError as e:
+        return jsonify({"error": str(e), "device": device.id}), 400
     if action == 'active':
-        active_fan()
         print("\033[93mFan active\033[0m")
     elif action == 'stop':
-        stop_fan()
         print("\033[91mFan stop\033[0m")
-    return jsonify({'message': 'Fan action handled'}), 200
+    return jsonify({'message': 'Fan action handled', **actuator_reply(device, confirmed)}), 200
+
+startup.mark('routes')
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=3000)
+    parser = argparse.ArgumentParser(description='Incubator backend')
+    parser.add_argument('--server', choices=('dev', 'async'), default=os.environ.get('INCUBATOR_SERVER', 'dev'),
+                        help='dev: Flask debug server; async: routes on the acquisition event loop')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=3000)
+    args = parser.parse_args()
+    if args.server == 'async':
+        from utils.async_server import serve
+        serve(app, host=args.host, port=args.port)
+    else:
+        # The reloader would import the app twice and run every reader and controller twice
+        startup.done('listening')
+        app.run(debug=True, use_reloader=False, host=args.host, port=args.port)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+import utils.actuators as actuators
+from utils.actuators import ActuatorState
+
+
+class FakeDevice:
+    def __init__(self, device_id, connection_type='serial'):
+        self.id = device_id
+        self.connection_type = connection_type
+        self.port = '/dev/fake'
+        self.baudrate = 9600
+        self.expect_ack = None
+        self.motors_status = {}
+
+
+class FakePort:
+    """Stands in for send_command: records every frame, fails the first `failures`."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.frames = []
+        self.times = []
+        self.lock = threading.Lock()
+
+    def __call__(self, port, baudrate, payload, expect_ack=None):
+        with self.lock:
+            self.frames.append(payload)
+            self.times.append(time.monotonic())
+            if self.failures:
+                self.failures -= 1
+                return False
+            return True
+
+
+@pytest.fixture
+def port(monkeypatch):
+    fake = FakePort()
+    monkeypatch.setattr(actuators, 'send_command', fake)
+    monkeypatch.setattr(actuators, 'set_status', lambda *args: None)
+    return fake
+
+
+def make(name, **kwargs):
+    return ActuatorState(FakeDevice(name), **kwargs)
+
+
+def test_changes_share_one_frame_offs_first(port):
+    reconciler = make('coalesce')
+    reconciler.request({'heater': True}, 'auto')
+    reconciler.request({'fan': False}, 'manual')
+    assert reconciler.wait(['heater', 'fan'], timeout=2.0)
+    assert port.frames == [b'F0H1']
+    # Nothing differs from what the board confirmed: nothing is sent
+    reconciler.request({'heater': True, 'fan': False}, 'auto')
+    time.sleep(0.1)
+    assert port.frames == [b'F0H1']
+    assert reconciler.stats()['unchanged'] == 2
+
+
+def test_failed_frame_is_retried_with_backoff(port, monkeypatch):
+    monkeypatch.setattr(actuators, 'RETRY_DELAY', 0.05)
+    port.failures = 3
+    reconciler = make('retry')
+    reconciler.request({'heater': True})
+    assert reconciler.wait(['heater'], timeout=3.0)
+    assert port.frames == [b'H1'] * 4
+    gaps = [b - a for a, b in zip(port.times, port.times[1:])]
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1 and gaps[2] >= 0.2
+    stats = reconciler.stats()
+    assert stats['failures'] == 3 and stats['last_error'] is None
+
+
+def test_hold_pins_the_actuator_until_release(port):
+    reconciler = make('hold')
+    reconciler.request({'fan': False}, 'auto')
+    assert reconciler.wait(['fan'], timeout=2.0)
+    reconciler.hold('fan', True, 'ventilation')
+    assert reconciler.wait(['fan'], timeout=2.0)
+    # The controller keeps asking for the fan off during the burst: the hold wins
+    reconciler.request({'fan': False}, 'auto')
+    time.sleep(0.1)
+    assert reconciler.desired['fan'] is True
+    reconciler.release('fan')
+    assert reconciler.wait(['fan'], timeout=2.0)
+    assert port.frames == [b'F0', b'F1', b'F0']
+
+
+def test_release_without_requests_goes_back_to_off(port):
+    reconciler = make('burst')
+    reconciler.hold('motor', True, 'rotation')
+    assert reconciler.wait(['motor'], timeout=2.0)
+    reconciler.release('motor')
+    assert reconciler.wait(['motor'], timeout=2.0)
+    assert port.frames == [b'M1', b'M0']
+
+
+def test_invalidate_resends_the_desired_state(port):
+    reconciler = make('reconnect')
+    reconciler.request({'heater': True, 'hum': False})
+    assert reconciler.wait(['heater', 'hum'], timeout=2.0)
+    reconciler.invalidate()
+    assert reconciler.wait(['heater', 'hum'], timeout=2.0)
+    assert port.frames == [b'C0H1', b'C0H1']
+
+
+def test_nothing_is_sent_without_a_serial_port(port):
+    reconciler = ActuatorState(FakeDevice('http', connection_type='http'))
+    reconciler.request({'heater': True})
+    assert not reconciler.wait(['heater'], timeout=0.2)
+    assert port.frames == []
+    assert 'not connected over serial' in reconciler.stats()['last_error']
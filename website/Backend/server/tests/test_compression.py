@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from utils.compression import CHANNELS, SeriesCompressor, channel_config, reconstruct
+
+EPOCH = 1792314000.0
+
+
+def stream(seed, count=2000, interval=2.0):
+    # Random walk with steps, plateaus and the odd jump, like a heater cycling
+    rng = random.Random(seed)
+    temperature, humidity = 37.5, 55.0
+    samples = []
+    for i in range(count):
+        if rng.random() < 0.01:
+            temperature += rng.uniform(-1.0, 1.0)
+        temperature += rng.gauss(0.0, 0.03)
+        humidity += rng.gauss(0.0, 0.2)
+        samples.append({'timestamp': EPOCH + i * interval + rng.uniform(0.0, 0.5),
+                        'temperature': temperature, 'humidity': humidity})
+    return samples
+
+
+def compress(samples, channels=None, max_gap=300.0):
+    compressor = SeriesCompressor(channels, max_gap)
+    kept = []
+    for sample in samples:
+        kept += compressor.offer(sample)
+    kept += compressor.flush()
+    return compressor, kept
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_swinging_door_stays_within_max_error(seed):
+    samples = stream(seed)
+    compressor, kept = compress(samples)
+    assert compressor.received == len(samples)
+    assert len(kept) < len(samples) / 3
+    series = reconstruct(kept, [s['timestamp'] for s in samples])
+    for name, spec in CHANNELS.items():
+        for sample, value in zip(samples, series[name]):
+            assert abs(value - sample[name]) <= spec['max_error'] + 1e-9
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_deadband_holds_within_max_error(seed):
+    channels = channel_config({'channels': {name: {'method': 'deadband'} for name in CHANNELS}})['channels']
+    samples = stream(seed)
+    _, kept = compress(samples, channels)
+    series = reconstruct(kept, [s['timestamp'] for s in samples], channels)
+    for name, spec in channels.items():
+        for sample, value in zip(samples, series[name]):
+            assert abs(value - sample[name]) <= spec['max_error'] + 1e-9
+
+
+def test_a_flat_stream_is_kept_every_max_gap():
+    samples = [{'timestamp': EPOCH + i, 'temperature': 37.5, 'humidity': 55.0} for i in range(1000)]
+    _, kept = compress(samples, max_gap=100.0)
+    gaps = [b['timestamp'] - a['timestamp'] for a, b in zip(kept, kept[1:])]
+    assert max(gaps) <= 100.0
+    assert len(kept) <= 12
+
+
+@pytest.mark.parametrize('config', [
+    'off',
+    {'channels': []},
+    {'channels': {'pressure': {'max_error': 1}}},
+    {'channels': {'humidity': {'max_error': -1}}},
+    {'channels': {'humidity': {'max_error': 'x'}}},
+    {'max_gap': 0},
+    {'enabled': 'no'},
+])
+def test_malformed_settings_are_value_errors(config):
+    with pytest.raises(ValueError):
+        channel_config(config)
@@ -0,0 +1,208 @@
+import threading
+import time
+
+from utils.controller import COMMANDS, send_command, set_status
+from utils.metrics import actuator_commands, actuator_frames
+
+COALESCE_WINDOW = 0.05  # seconds a change waits for others to share its frame
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+CONFIRM_TIMEOUT = 3.0  # how long a manual request waits for the board
+
+
+class ActuatorState:
+    """Desired and confirmed state of one incubator's motor, heater, fan and humidifier.
+
+    Manual routes and the automatic controller only say what they want with
+    `request()`. A worker thread compares that with what the board last
+    confirmed and sends just the commands that differ; changes arriving
+    within `COALESCE_WINDOW` of each other go out as one frame (offs first,
+    e.g. b'H0F1'). A failed frame is retried with backoff until it goes
+    through or the desired state no longer differs.
+
+    A `hold()` (a timed rotation or ventilation burst) pins one actuator
+    whatever the others request; on `release()` it goes back to what they
+    asked for meanwhile.
+    """
+
+    def __init__(self, device, coalesce_window=COALESCE_WINDOW):
+        self.device = device
+        self.coalesce_window = coalesce_window
+        self.desired = {}
+        self.requested = {}  # what manual and automatic sources asked for, holds aside
+        self.holds = {}  # actuator -> (state, source) pinned until released
+        self.confirmed = {name: None for name in COMMANDS}  # None: unknown, the next request is always sent
+        self.sources = {}  # who set each desired state last ('manual', 'auto', ...)
+        self.cond = threading.Condition()
+        self.worker = None
+
+        self.requests = 0
+        self.unchanged = 0  # requests that left the desired state as it was, nothing to send
+        self.frames = 0
+        self.commands = 0
+        self.failures = 0
+        self.last_frame = None
+        self.last_error = None
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        self._changed_at = 0.0
+        self._frames = actuator_frames.labels(device.id)
+        self._commands = actuator_commands.labels(device.id)
+
+    def _diff(self):
+        # Offs before ons, so the fan and the heater never overlap
+        changes = [(name, on) for name, on in self.desired.items() if self.confirmed.get(name) != on]
+        return sorted(changes, key=lambda item: item[1])
+
+    def request(self, changes, source='manual'):
+        """Set the desired state of some actuators; returns at once."""
+        for name in changes:
+            if name not in COMMANDS:
+                raise ValueError(f'Unknown actuator: {name}')
+        with self.cond:
+            for name, on in changes.items():
+                on = bool(on)
+                self.requests += 1
+                self.requested[name] = on
+                if name in self.holds:
+                    continue
+                self.sources[name] = source
+                self._set_desired(name, on)
+            self._wake()
+
+    def hold(self, name, on, source='schedule'):
+        if name not in COMMANDS:
+            raise ValueError(f'Unknown actuator: {name}')
+        with self.cond:
+            self.holds[name] = (bool(on), source)
+            self.sources[name] = source
+            self._set_desired(name, bool(on))
+            self._wake()
+
+    def release(self, name):
+        with self.cond:
+            held = self.holds.pop(name, None)
+            if held is None:
+                return
+            # Back to what was requested during the hold; nothing requested means the opposite of the hold
+            self._set_desired(name, self.requested.get(name, not held[0]))
+            self._wake()
+
+    def release_all(self):
+        for name in list(self.holds):
+            self.release(name)
+
+    def _set_desired(self, name, on):
+        # Called with the condition held
+        if self.desired.get(name) == on:
+            self.unchanged += 1
+            return
+        self.desired[name] = on
+        self._changed_at = time.monotonic()
+        # A new desired state is worth trying now, not after the last failure's backoff
+        self._retry_at = 0.0
+
+    def unavailable(self):
+        """Why commands can't reach the board, or None when they can (serial, port and baud rate set)."""
+        device = self.device
+        if device.connection_type != 'serial':
+            return f'{device.id} is not connected over serial; its actuators cannot be commanded'
+        if not device.port or not device.baudrate:
+            return f'no serial port and baud rate saved for {device.id}'
+        return None
+
+    def state(self):
+        """What the controller should assume: its own requests (holds aside), else confirmed."""
+        with self.cond:
+            return {name: self.requested.get(name, self.desired.get(name, bool(self.confirmed.get(name))))
+                    for name in COMMANDS}
+
+    def wait(self, names, timeout=CONFIRM_TIMEOUT):
+        """Block until the board confirmed the desired state of `names`."""
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: all(self.confirmed.get(n) == self.desired.get(n) for n in names), timeout)
+
+    def invalidate(self):
+        # The board was (re)connected and may have reset its outputs: resend what we want
+        with self.cond:
+            self.confirmed = {name: None for name in COMMANDS}
+            self._retry_at = 0.0
+            self._wake()
+
+    def _wake(self):
+        # Called with the condition held
+        if not self._diff():
+            return
+        reason = self.unavailable()
+        if reason:
+            # Nothing to retry until the settings change (saving them invalidates and wakes again)
+            self.last_error = reason
+            return
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, name=f'actuators-{self.device.id}', daemon=True)
+            self.worker.start()
+        self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self._diff() or self.unavailable():
+                    self.worker = None
+                    return
+                # Let near-simultaneous changes (manual and automatic) share this frame
+                while True:
+                    remaining = max(self._changed_at + self.coalesce_window, self._retry_at) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                changes = self._diff()
+                if not changes:
+                    continue
+            self._send(changes)
+
+    def _send(self, changes):
+        device = self.device
+        payload = b''.join(COMMANDS[name][0 if on else 1] for name, on in changes)
+        ok = send_command(device.port, device.baudrate, payload, device.expect_ack)
+        with self.cond:
+            self.last_frame = payload.decode()
+            if ok:
+                self.frames += 1
+                self.commands += len(changes)
+                self._frames.inc()
+                self._commands.inc(len(changes))
+                self.last_error = None
+                self._retry_delay = 0.0
+                self._retry_at = 0.0
+                for name, on in changes:
+                    self.confirmed[name] = on
+            else:
+                self.failures += 1
+                self.last_error = f'{self.last_frame} failed on {device.port}'
+                self._retry_delay = min(max(self._retry_delay * 2, RETRY_DELAY), MAX_RETRY_DELAY)
+                self._retry_at = time.monotonic() + self._retry_delay
+            self.cond.notify_all()
+        if ok:
+            # Keeps the legacy status dict, the supervision log and the live stream in step
+            for name, on in changes:
+                set_status(name, on, device.motors_status, device.id)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'device': self.device.id,
+                'desired': dict(self.desired),
+                'confirmed': dict(self.confirmed),
+                'pending': {name: on for name, on in self._diff()},
+                'sources': dict(self.sources),
+                'held': {name: on for name, (on, _) in self.holds.items()},
+                'requests': self.requests,
+                'unchanged': self.unchanged,
+                'frames': self.frames,
+                'commands': self.commands,
+                'failures': self.failures,
+                'last_frame': self.last_frame,
+                'last_error': self.last_error,
+                'retry_in': max(0.0, self._retry_at - time.monotonic()) if self._retry_at else None,
+            }
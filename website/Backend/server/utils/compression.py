@@ -0,0 +1,231 @@
+"""Swinging-door / deadband compression of the sensor stream before it is stored.
+
+Every sample still reaches the controller, the live stream and the ring
+buffer; only the points kept here go to the local history and Supabase.
+Each channel has a method and a `max_error`:
+
+- swinging_door: a point is kept when no straight line from the last kept
+  point passes within `max_error` of every sample since. The kept value
+  is moved onto that corridor, so linear interpolation between kept
+  points is within `max_error` of every skipped sample.
+- deadband: a point is kept when it moves more than `max_error` from the
+  last kept value; reads hold the last kept value.
+
+A point is kept whenever any channel needs one, and at least every
+`max_gap` seconds, so an incubator sitting at setpoint still leaves a trace.
+"""
+import math
+import threading
+
+import numpy as np
+
+CHANNELS = {
+    'temperature': {'method': 'swinging_door', 'max_error': 0.1},  # degC
+    'humidity': {'method': 'swinging_door', 'max_error': 0.5},     # %RH
+}
+MAX_GAP = 300.0  # seconds
+METHODS = ('swinging_door', 'deadband')
+
+
+def _number(value):
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+        return None
+    return float(value)
+
+
+class SwingingDoor:
+    """Slopes from the last kept point that keep every later sample within `max_error`."""
+
+    def __init__(self, max_error):
+        self.max_error = max_error
+        self.restart(None, None)
+
+    def restart(self, t, v):
+        self.t0, self.v0 = t, v
+        self.lower, self.upper = -math.inf, math.inf
+
+    def _slopes(self, t, v):
+        dt = t - self.t0
+        return (v - self.max_error - self.v0) / dt, (v + self.max_error - self.v0) / dt
+
+    def admits(self, t, v):
+        if v is None or self.v0 is None:
+            return v is None and self.v0 is None
+        if t <= self.t0:
+            return abs(v - self.v0) <= self.max_error
+        lower, upper = self._slopes(t, v)
+        return max(self.lower, lower) <= min(self.upper, upper)
+
+    def add(self, t, v):
+        if v is None or self.v0 is None or t <= self.t0:
+            return
+        lower, upper = self._slopes(t, v)
+        self.lower = max(self.lower, lower)
+        self.upper = min(self.upper, upper)
+
+    def value_at(self, t, v):
+        # The newest added point, moved onto the corridor (never by more than max_error)
+        if v is None or self.v0 is None or t <= self.t0:
+            return v
+        slope = min(max((v - self.v0) / (t - self.t0), self.lower), self.upper)
+        return self.v0 + slope * (t - self.t0)
+
+
+class Deadband:
+    def __init__(self, max_error):
+        self.max_error = max_error
+        self.held = None
+
+    def restart(self, t, v):
+        self.held = v
+
+    def admits(self, t, v):
+        if v is None or self.held is None:
+            return v is None and self.held is None
+        return abs(v - self.held) <= self.max_error
+
+    def add(self, t, v):
+        pass
+
+    def value_at(self, t, v):
+        return v
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def channel_config(config=None):
+    """Validated {'enabled', 'max_gap', 'channels'} from a settings dict, defaults filled in.
+
+    Raises ValueError on anything malformed, so a bad settings save is a 400.
+    """
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ValueError('compression must be an object')
+    overrides = config.get('channels')
+    if overrides is None:
+        overrides = {}
+    if not isinstance(overrides, dict):
+        raise ValueError('compression channels must be an object of channel name -> settings')
+    channels = {name: dict(spec) for name, spec in CHANNELS.items()}
+    for name, spec in overrides.items():
+        if name not in CHANNELS:
+            raise ValueError(f"unknown compression channel {name!r}, expected one of {', '.join(CHANNELS)}")
+        if not isinstance(spec, dict):
+            raise ValueError(f'compression settings for {name} must be an object')
+        channels[name] = dict(channels[name], **spec)
+    for name, spec in channels.items():
+        if spec.get('method') not in METHODS:
+            raise ValueError(f"compression method for {name} must be one of {', '.join(METHODS)}")
+        if not _is_number(spec.get('max_error')) or spec['max_error'] < 0:
+            raise ValueError(f'compression max_error for {name} must be a number >= 0')
+    max_gap = config.get('max_gap', MAX_GAP)
+    if not _is_number(max_gap) or max_gap <= 0:
+        raise ValueError('compression max_gap must be a positive number of seconds')
+    enabled = config.get('enabled', True)
+    if not isinstance(enabled, bool):
+        raise ValueError('compression enabled must be true or false')
+    return {'enabled': enabled, 'max_gap': float(max_gap), 'channels': channels}
+
+
+class SeriesCompressor:
+    def __init__(self, channels=None, max_gap=MAX_GAP):
+        self.channels = channels or channel_config()['channels']
+        self.max_gap = max_gap
+        self._doors = {name: (SwingingDoor if spec['method'] == 'swinging_door' else Deadband)(spec['max_error'])
+                       for name, spec in self.channels.items()}
+        self._anchor = None  # time of the last kept point
+        self._pending = None  # (sample, t, values) of the newest sample, not kept yet
+        self._lock = threading.Lock()
+        self.received = 0
+        self.stored = 0
+
+    def offer(self, sample):
+        """The samples to store, oldest first, now that `sample` arrived (usually none)."""
+        t = sample['timestamp']
+        values = {name: _number(sample.get(name)) for name in self._doors}
+        kept = []
+        with self._lock:
+            self.received += 1
+            if self._anchor is None or t <= self._anchor:
+                self._keep(sample, t, values, kept)
+                return kept
+            # The newest sample can't join the current segment: close it at the previous one
+            if self._pending is not None and (t - self._anchor > self.max_gap or not self._admits(t, values)):
+                self._keep(*self._pending, kept)
+            if t - self._anchor >= self.max_gap or not self._admits(t, values):
+                self._keep(sample, t, values, kept)
+            else:
+                for name, door in self._doors.items():
+                    door.add(t, values[name])
+                self._pending = (sample, t, values)
+        return kept
+
+    def flush(self):
+        """Keep the newest sample too, e.g. before the reader stops."""
+        kept = []
+        with self._lock:
+            if self._pending is not None:
+                self._keep(*self._pending, kept)
+        return kept
+
+    def _admits(self, t, values):
+        return all(door.admits(t, values[name]) for name, door in self._doors.items())
+
+    def _keep(self, sample, t, values, kept):
+        row = dict(sample)
+        for name, door in self._doors.items():
+            door.add(t, values[name])
+            value = door.value_at(t, values[name])
+            if value is not None:
+                row[name] = value
+        for name, door in self._doors.items():
+            door.restart(t, _number(row.get(name)))
+        self._anchor = t
+        self._pending = None
+        self.stored += 1
+        kept.append(row)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'received': self.received,
+                'stored': self.stored,
+                'ratio': self.received / self.stored if self.stored else None,
+                'pending': self._pending is not None,
+                'max_gap': self.max_gap,
+                'channels': self.channels,
+            }
+
+
+def make_compressor(config=None):
+    config = channel_config(config)
+    if not config['enabled']:
+        return None
+    return SeriesCompressor(config['channels'], config['max_gap'])
+
+
+def reconstruct(rows, times, channels=None):
+    """Channel values at `times` from stored rows: interpolated between swinging-door
+    points, held after deadband points, None outside the stored range or next to a gap."""
+    channels = channels or CHANNELS
+    times = np.asarray(times, dtype=float)
+    series = {'timestamp': times.tolist()}
+    if not rows:
+        for name in channels:
+            series[name] = [None] * len(times)
+        return series
+    stamps = np.array([row['timestamp'] for row in rows], dtype=float)
+    outside = (times < stamps[0]) | (times > stamps[-1])
+    for name, spec in channels.items():
+        values = np.array([np.nan if _number(row.get(name)) is None else row[name] for row in rows], dtype=float)
+        if spec['method'] == 'deadband':
+            index = np.clip(np.searchsorted(stamps, times, side='right') - 1, 0, None)
+            result = values[index]
+        else:
+            result = np.interp(times, stamps, values)  # NaN next to a missing value stays NaN
+        result[outside] = np.nan
+        series[name] = [None if math.isnan(v) else v for v in result.tolist()]
+    return series
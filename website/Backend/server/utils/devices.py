@@ -0,0 +1,199 @@
+import threading
+import time
+
+from utils.broadcast import broadcaster
+from utils.controller import DEFAULT_DEVICE, motors_status, new_status
+from utils.actuators import ActuatorState
+from utils.local_store import get_store
+from utils.ring_buffer import SampleRing
+from utils.analytics import SensorAnalytics
+from utils.compression import make_compressor
+from utils.rollups import Rollups
+from utils.metrics import samples_read
+from utils.supervision_log import get_log
+from utils.state_store import FrozenSample, state_store
+
+DEFAULT_SENSOR_URL = 'http://localhost:5001/sensor'
+
+
+class Device:
+    """One incubator: its connection settings, latest sample, actuator state and egg profile."""
+
+    def __init__(self, device_id):
+        self.id = device_id
+        self.settings = {}
+        self.port = None
+        self.baudrate = None
+        self.connection_type = None
+        self.expect_ack = None  # wait for the board's acks; None: the port's default (INCUBATOR_EXPECT_ACK)
+        self.simulate_on_failure = False  # simulated samples when the serial port does not open
+        self.url = DEFAULT_SENSOR_URL
+        self.egg_type = 'chicken'
+
+        self.recent = SampleRing()
+        self.analytics = SensorAnalytics()
+        self.connected = False
+        self.use_simulation = False
+        self.reader_error = None  # why the reader last failed to start, for the supervisor
+        # The default incubator shares the legacy controller.motors_status dict
+        self.motors_status = motors_status if device_id == DEFAULT_DEVICE else new_status()
+        self.actuators = ActuatorState(self)  # desired vs confirmed; the only path to the actuators
+        self.listeners = []  # Called with every new sample, in the reader's thread
+        self.archive_listeners = []  # Called with the samples the compressor keeps (persistence)
+        self.compressor = make_compressor()
+        self.rollups = Rollups(device_id, get_store)  # 1 min / 15 min / 1 h buckets of every sample
+        self._samples_read = samples_read.labels(device_id)
+        self.supervision = get_log(device_id)  # binary record of every sample and actuator state
+
+        self.auto = None
+        self.auto_future = None
+
+    def configure(self, settings):
+        # Everything is validated first (ValueError): a rejected save changes nothing
+        expect_ack = settings.get('expectAck')
+        if expect_ack is not None and not isinstance(expect_ack, bool):
+            raise ValueError('expectAck must be true or false')
+        simulate = settings.get('simulateOnFailure', False)
+        if not isinstance(simulate, bool):
+            raise ValueError('simulateOnFailure must be true or false')
+        compressor = make_compressor(settings['compression']) if 'compression' in settings else self.compressor
+        self.settings = settings
+        self.expect_ack = expect_ack
+        self.simulate_on_failure = simulate
+        self.port = settings.get('serialPort')
+        self.baudrate = settings.get('baudRate')
+        self.connection_type = settings.get('connectionType')
+        self.url = settings.get('url') or DEFAULT_SENSOR_URL
+        if compressor is not self.compressor:
+            self.flush_archive()
+            self.compressor = compressor
+
+    @property
+    def latest_data(self):
+        # The newest snapshot's sample (read-only), or {} before the first one
+        return state_store.latest_data(self.id)
+
+    def snapshot(self):
+        return state_store.latest(self.id)
+
+    def publish_sample(self, data):
+        sample = dict(data)
+        sample.setdefault("timestamp", time.time())  # acquisition time
+        sample["device"] = self.id
+        sample = FrozenSample(sample)  # consumers share it, none can change it
+        self._samples_read.inc()
+        self.recent.append(sample["timestamp"], sample.get("temperature"), sample.get("humidity"))
+        self.analytics.update(sample)
+        # The supervision log keeps every sample; history and Supabase only what the compressor keeps
+        kept = self.compressor.offer(sample) if self.compressor else [sample]
+        try:
+            self.supervision.append(sample["timestamp"], sample.get("temperature"), sample.get("humidity"), self.motors_status)
+        except Exception as e:
+            print(f"\033[91mError while writing the supervision log: {e}\033[0m")
+        self.rollups.add(sample["timestamp"], sample.get("temperature"), sample.get("humidity"), self.motors_status)
+        # Published once analytics are up to date: waiting consumers (the controller) read both
+        snapshot = state_store.publish(self.id, sample)
+        broadcaster.publish('reading', snapshot.as_json(), key=f'reading:{self.id}')
+        for listener in list(self.listeners):
+            try:
+                listener(sample)
+            except Exception as e:
+                print(f"\033[91mSample listener error: {e}\033[0m")
+        if kept:
+            self._archive(kept)
+        return sample
+
+    def _archive(self, samples):
+        try:
+            get_store().insert_many(samples)
+        except Exception as e:
+            print(f"\033[91mError while saving to local history: {e}\033[0m")
+        for listener in list(self.archive_listeners):
+            for sample in samples:
+                try:
+                    listener(sample)
+                except Exception as e:
+                    print(f"\033[91mArchive listener error: {e}\033[0m")
+
+    def flush_archive(self):
+        # Store the compressor's pending sample, e.g. before the reader stops
+        if self.compressor:
+            kept = self.compressor.flush()
+            if kept:
+                self._archive(kept)
+
+    def compression_stats(self):
+        if self.compressor is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.compressor.stats()}
+
+    def add_listener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def add_archive_listener(self, listener):
+        if listener not in self.archive_listeners:
+            self.archive_listeners.append(listener)
+
+    def remove_archive_listener(self, listener):
+        if listener in self.archive_listeners:
+            self.archive_listeners.remove(listener)
+
+    def actuate(self, component, on, source='manual'):
+        # True once the board confirmed the state, False if it did not in time (it keeps retrying).
+        # Raises ValueError when the actuators can't be reached at all
+        reason = self.actuators.unavailable()
+        if reason:
+            raise ValueError(reason)
+        self.actuators.request({component: on}, source)
+        return self.actuators.wait([component])
+
+    def auto_running(self):
+        return self.auto_future is not None and not self.auto_future.done()
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'connectionType': self.connection_type,
+            'port': self.port,
+            'baudrate': self.baudrate,
+            'egg': self.egg_type,
+            'connected': self.connected,
+            'simulation': self.use_simulation,
+            'auto': self.auto_running(),
+            'actuators': dict(self.motors_status),
+            'latest': self.latest_data or None,
+        }
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def get(self, device_id=DEFAULT_DEVICE):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = Device(device_id)
+                self._devices[device_id] = device
+            return device
+
+    def find(self, device_id):
+        with self._lock:
+            return self._devices.get(device_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._devices.values())
+
+    def remove(self, device_id):
+        with self._lock:
+            return self._devices.pop(device_id, None)
+
+
+registry = DeviceRegistry()
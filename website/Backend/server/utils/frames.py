@@ -0,0 +1,196 @@
+import binascii
+import math
+import re
+import struct
+
+# Binary frame: SYNC (2) | type (1) | length (1) | payload | CRC-16/CCITT (2, big-endian)
+# The CRC covers type, length and payload. Text frames are the firmware's
+# "temperature|humidity[|...]\n" lines; both may arrive on the same port.
+SYNC = b'\xaa\x55'
+HEADER_SIZE = 4
+CRC_SIZE = 2
+MAX_PAYLOAD = 64
+MAX_LINE = 256  # a text line longer than this is garbage, not a slow sender
+
+FRAME_SAMPLE = 0x01  # payload: little-endian float32 per channel
+FRAME_ACK = 0x02     # payload: the ASCII command being acknowledged
+
+CHANNELS = ('temperature', 'humidity')
+
+# Trailing run of characters a text sample can contain
+_SAMPLE_TAIL = re.compile(rb'[-+0-9.|]+\Z')
+
+COMPACT_AT = 4096  # consumed bytes dropped from the buffer in one go
+
+
+def channel_name(index):
+    return CHANNELS[index] if index < len(CHANNELS) else f'channel_{index}'
+
+
+def encode_sample(values):
+    payload = struct.pack(f'<{len(values)}f', *values)
+    return encode_frame(FRAME_SAMPLE, payload)
+
+
+def encode_frame(frame_type, payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f'payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}')
+    body = bytes((frame_type, len(payload))) + payload
+    return SYNC + body + binascii.crc_hqx(body, 0xFFFF).to_bytes(2, 'big')
+
+
+def _parse_values(line):
+    try:
+        values = [float(v) for v in line.split(b'|')]
+    except ValueError:
+        return None
+    # 'nan' / 'inf' is what a failed DHT read prints: not a sample
+    if len(values) < 2 or not all(math.isfinite(v) for v in values):
+        return None
+    return values
+
+
+class FrameParser:
+    """Incremental parser for the text and binary sensor frames.
+
+    `feed()` takes whatever bytes the port had and returns the complete
+    frames as ('sample', dict) or ('ack', line) tuples. Partial frames stay
+    in one reusable buffer until the rest arrives. Garbage (a reset
+    mid-line, a bad checksum or length) is skipped up to the next newline or sync
+    marker and counted as a resync.
+    """
+
+    def __init__(self, ack_prefixes=('OK', 'ACK')):
+        self.ack_prefixes = tuple(p.encode('ascii') for p in ack_prefixes)
+        self._buf = bytearray()
+        self._pos = 0
+        self.bytes = 0
+        self.text_frames = 0
+        self.binary_frames = 0
+        self.acks = 0
+        self.parse_errors = 0
+        self.checksum_errors = 0
+        self.length_errors = 0
+        self.resyncs = 0
+        self.discarded_bytes = 0
+
+    def reset(self):
+        # After a reconnect the half-received frame can never complete
+        self._discard(len(self._buf) - self._pos)
+        self._buf.clear()
+        self._pos = 0
+
+    def _discard(self, n):
+        if n > 0:
+            self.discarded_bytes += n
+            self.resyncs += 1
+
+    def feed(self, chunk):
+        buf = self._buf
+        buf += chunk
+        self.bytes += len(chunk)
+        frames = []
+        pos = self._pos
+        end = len(buf)
+        sync = buf.find(SYNC, pos)
+        while pos < end:
+            if sync != -1 and sync < pos:
+                sync = buf.find(SYNC, pos)
+            if sync == pos:
+                if end - pos < HEADER_SIZE:
+                    break
+                length = buf[pos + 3]
+                size = HEADER_SIZE + length + CRC_SIZE
+                if length > MAX_PAYLOAD:
+                    # Corrupt header, no CRC was checked: not a checksum error
+                    self.length_errors += 1
+                    self._discard(2)
+                    pos += 2
+                    continue
+                if end - pos < size:
+                    break
+                body = buf[pos + 2:pos + HEADER_SIZE + length]
+                crc = int.from_bytes(buf[pos + size - CRC_SIZE:pos + size], 'big')
+                if binascii.crc_hqx(body, 0xFFFF) != crc:
+                    # Maybe a sync pattern inside garbage: rescan right after it
+                    self.checksum_errors += 1
+                    self._discard(2)
+                    pos += 2
+                    continue
+                frame = self._binary(body[0], body[2:])
+                if frame is not None:
+                    frames.append(frame)
+                pos += size
+                continue
+
+            newline = buf.find(b'\n', pos, sync if sync != -1 else end)
+            if newline == -1:
+                if sync != -1:
+                    # A binary frame starts before the line ended: the partial line is garbage
+                    self._discard(sync - pos)
+                    pos = sync
+                    continue
+                if end - pos > MAX_LINE:
+                    self._discard(end - pos)
+                    pos = end
+                break
+            frame = self._text(bytes(buf[pos:newline]).strip())
+            if frame is not None:
+                frames.append(frame)
+            pos = newline + 1
+
+        if pos >= COMPACT_AT or pos == end:
+            del buf[:pos]
+            pos = 0
+        self._pos = pos
+        return frames
+
+    def _text(self, line):
+        if not line:
+            return None
+        if line.startswith(self.ack_prefixes):
+            self.acks += 1
+            return ('ack', line.decode('ascii', errors='replace'))
+        values = _parse_values(line)
+        if values is None:
+            # Garbage glued in front of a line (e.g. after a board reset): keep the intact tail
+            tail = _SAMPLE_TAIL.search(line)
+            values = _parse_values(tail.group()) if tail else None
+            if values is not None:
+                self._discard(tail.start())
+        if values is None:
+            self.parse_errors += 1
+            self.resyncs += 1
+            if self.parse_errors == 1 or self.parse_errors % 100 == 0:
+                print(f"\033[93mInvalid data format from serial ({self.parse_errors} so far): {line[:40]!r}\033[0m")
+            return None
+        self.text_frames += 1
+        return ('sample', {channel_name(i): v for i, v in enumerate(values)})
+
+    def _binary(self, frame_type, payload):
+        if frame_type == FRAME_SAMPLE and payload and len(payload) % 4 == 0:
+            values = struct.unpack(f'<{len(payload) // 4}f', payload)
+            if not all(math.isfinite(v) for v in values):
+                self.parse_errors += 1
+                return None
+            self.binary_frames += 1
+            return ('sample', {channel_name(i): round(v, 4) for i, v in enumerate(values)})
+        if frame_type == FRAME_ACK:
+            self.acks += 1
+            return ('ack', 'OK ' + bytes(payload).decode('ascii', errors='replace'))
+        self.parse_errors += 1
+        return None
+
+    def stats(self):
+        return {
+            'bytes': self.bytes,
+            'text_frames': self.text_frames,
+            'binary_frames': self.binary_frames,
+            'acks': self.acks,
+            'parse_errors': self.parse_errors,
+            'checksum_errors': self.checksum_errors,
+            'length_errors': self.length_errors,
+            'resyncs': self.resyncs,
+            'discarded_bytes': self.discarded_bytes,
+            'buffered_bytes': len(self._buf) - self._pos,
+        }
@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+import time
+
+from utils.paths import data_path
+from utils.controller import DEFAULT_DEVICE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    ts REAL NOT NULL,
+    temperature REAL,
+    humidity REAL,
+    device TEXT NOT NULL DEFAULT 'default'
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_sensor_data_ts ON sensor_data (ts);
+CREATE INDEX IF NOT EXISTS idx_sensor_data_device_ts ON sensor_data (device, ts);
+"""
+
+# One row per device, resolution and bucket start; see utils/rollups.py
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    device TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket REAL NOT NULL,
+    count INTEGER NOT NULL,
+    covered REAL NOT NULL,
+    temperature_count INTEGER NOT NULL,
+    temperature_min REAL,
+    temperature_max REAL,
+    temperature_mean REAL,
+    humidity_count INTEGER NOT NULL,
+    humidity_min REAL,
+    humidity_max REAL,
+    humidity_mean REAL,
+    heater_on REAL NOT NULL,
+    fan_on REAL NOT NULL,
+    hum_on REAL NOT NULL,
+    motor_on REAL NOT NULL,
+    PRIMARY KEY (device, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_COLUMNS = ('device', 'resolution', 'bucket', 'count', 'covered',
+                  'temperature_count', 'temperature_min', 'temperature_max', 'temperature_mean',
+                  'humidity_count', 'humidity_min', 'humidity_max', 'humidity_mean',
+                  'heater_on', 'fan_on', 'hum_on', 'motor_on')
+
+
+def _merge_channel(name):
+    # A bucket written twice (partial before a restart, late samples) combines both halves
+    n, new_n = f'{name}_count', f'excluded.{name}_count'
+    return (f"{name}_mean = CASE WHEN {n} + {new_n} = 0 THEN NULL ELSE "
+            f"(COALESCE({name}_mean, 0) * {n} + COALESCE(excluded.{name}_mean, 0) * {new_n}) / ({n} + {new_n}) END, "
+            f"{name}_min = MIN(COALESCE({name}_min, excluded.{name}_min), COALESCE(excluded.{name}_min, {name}_min)), "
+            f"{name}_max = MAX(COALESCE({name}_max, excluded.{name}_max), COALESCE(excluded.{name}_max, {name}_max)), "
+            f"{n} = {n} + {new_n}")
+
+
+UPSERT_ROLLUP = (
+    f"INSERT INTO rollups ({', '.join(ROLLUP_COLUMNS)}) VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))}) "
+    "ON CONFLICT (device, resolution, bucket) DO UPDATE SET "
+    f"{_merge_channel('temperature')}, {_merge_channel('humidity')}, "
+    "count = count + excluded.count, covered = covered + excluded.covered, "
+    "heater_on = heater_on + excluded.heater_on, fan_on = fan_on + excluded.fan_on, "
+    "hum_on = hum_on + excluded.hum_on, motor_on = motor_on + excluded.motor_on"
+)
+
+MAX_ROWS = 100000
+
+
+class LocalStore:
+    """Embedded SQLite history of every sample, indexed by acquisition time.
+
+    The database runs in WAL mode so the reader thread can append while
+    request threads run range queries. Each thread gets its own connection.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path('history.db')
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sensor_data)')]
+        if 'device' not in columns:
+            conn.execute("ALTER TABLE sensor_data ADD COLUMN device TEXT NOT NULL DEFAULT 'default'")
+        conn.executescript(INDEXES)
+        conn.executescript(ROLLUP_SCHEMA)
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def insert(self, sample):
+        self.insert_many([sample])
+
+    def insert_many(self, samples):
+        rows = [
+            (s.get('timestamp') or time.time(), s.get('temperature'), s.get('humidity'), s.get('device') or DEFAULT_DEVICE)
+            for s in samples
+        ]
+        conn = self._connection()
+        with self._write_lock:
+            conn.executemany('INSERT INTO sensor_data (ts, temperature, humidity, device) VALUES (?, ?, ?, ?)', rows)
+            conn.commit()
+
+    def query(self, start=None, end=None, limit=MAX_ROWS, device=DEFAULT_DEVICE):
+        end = time.time() if end is None else end
+        start = end - 86400 if start is None else start
+        cursor = self._connection().execute(
+            'SELECT ts, temperature, humidity FROM sensor_data WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts LIMIT ?',
+            (device, start, end, limit),
+        )
+        return [
+            {'timestamp': ts, 'temperature': temperature, 'humidity': humidity}
+            for ts, temperature, humidity in cursor
+        ]
+
+    def count(self, start=None, end=None, device=DEFAULT_DEVICE, limit=-1):
+        # Stops counting at `limit`: enough to tell whether the rows fit a budget
+        end = time.time() if end is None else end
+        start = end - 86400 if start is None else start
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM sensor_data WHERE device = ? AND ts >= ? AND ts <= ? LIMIT ?)',
+            (device, start, end, limit),
+        ).fetchone()[0]
+
+    def upsert_rollups(self, rows):
+        conn = self._connection()
+        with self._write_lock:
+            conn.executemany(UPSERT_ROLLUP, [tuple(row[c] for c in ROLLUP_COLUMNS) for row in rows])
+            conn.commit()
+
+    def query_rollups(self, resolution, start=None, end=None, limit=MAX_ROWS, device=DEFAULT_DEVICE):
+        end = time.time() if end is None else end
+        start = end - 86400 if start is None else start
+        # Buckets that overlap [start, end], not only those starting inside it
+        cursor = self._connection().execute(
+            f'SELECT {", ".join(ROLLUP_COLUMNS)} FROM rollups WHERE device = ? AND resolution = ? '
+            'AND bucket > ? AND bucket <= ? ORDER BY bucket LIMIT ?',
+            (device, resolution, start - resolution, end, limit),
+        )
+        return [dict(zip(ROLLUP_COLUMNS, row)) for row in cursor]
+
+    def latest(self, device=DEFAULT_DEVICE):
+        row = self._connection().execute(
+            'SELECT ts, temperature, humidity FROM sensor_data WHERE device = ? ORDER BY ts DESC LIMIT 1',
+            (device,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': row[0], 'temperature': row[1], 'humidity': row[2]}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalStore()
+        return _store
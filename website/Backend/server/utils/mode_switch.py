@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from utils.broadcast import broadcaster
+from utils.loop import get_loop, run_blocking, run_coroutine
+
+MODES = ('automatic', 'manual')
+CONNECT_TIMEOUT = 300.0  # seconds a transition waits for its device to connect
+POLL_INTERVAL = 0.5
+MAX_TRANSITIONS = 200  # finished transitions kept for status lookups
+
+_ids = itertools.count(1)
+
+
+class Transition:
+    """One requested mode change: queued -> waiting -> applying -> done | failed | superseded."""
+
+    def __init__(self, device_id, mode):
+        self.id = f'{device_id}-{next(_ids)}'
+        self.device = device_id
+        self.mode = mode
+        self.state = 'queued'
+        self.error = None
+        self.requests = 1  # how many POSTs were coalesced into this transition
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def finished(self):
+        return self.state in ('done', 'failed', 'superseded')
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'device': self.device,
+            'mode': self.mode,
+            'state': self.state,
+            'error': self.error,
+            'requests': self.requests,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class _DeviceModes:
+    def __init__(self, device):
+        self.device = device
+        self.pending = None  # newest transition not applied yet
+        self.active = None  # transition the task is applying right now
+        self.lock = threading.Lock()
+        self.task = None  # future of the device's task on the shared loop
+        self.wake = None  # asyncio.Event of that task, set by new requests
+
+
+class ModeSwitcher:
+    """Applies control-mode changes off the request thread.
+
+    `request()` returns at once with a transition. A task per device on
+    the shared event loop waits for the device to connect and runs
+    `apply(mode, device)` in the bounded executor (it blocks on the
+    supervisor).
+    Requests that arrive while one is still queued replace it, so only the
+    newest mode is ever applied. The current mode is not kept here:
+    `current(device)` reads it from what actually runs (the supervisor).
+    """
+
+    def __init__(self, apply, current, connect_timeout=CONNECT_TIMEOUT):
+        self.apply = apply
+        self.current = current
+        self.connect_timeout = connect_timeout
+        self._devices = {}
+        self._transitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, device):
+        with self._lock:
+            state = self._devices.get(device.id)
+            if state is None:
+                state = _DeviceModes(device)
+                self._devices[device.id] = state
+            return state
+
+    def _remember(self, transition):
+        with self._lock:
+            self._transitions[transition.id] = transition
+            while len(self._transitions) > MAX_TRANSITIONS:
+                oldest = next(iter(self._transitions))
+                if not self._transitions[oldest].finished():
+                    break
+                self._transitions.popitem(last=False)
+
+    def _publish(self, transition):
+        broadcaster.publish('mode', transition.describe(), key=f'mode:{transition.device}')
+
+    def _finish(self, transition, state, error=None):
+        transition.state = state
+        transition.error = error
+        transition.finished_at = time.time()
+        self._publish(transition)
+
+    def request(self, device, mode):
+        state = self._state(device)
+        with state.lock:
+            pending = state.pending
+            if pending is not None and pending.mode == mode:
+                pending.requests += 1
+                return pending
+            if pending is not None:
+                state.pending = None
+                self._finish(pending, 'superseded')
+            active = state.active
+            if active is not None and active.mode == mode:
+                # Already on the way there: nothing to queue
+                active.requests += 1
+                return active
+            transition = Transition(device.id, mode)
+            self._remember(transition)
+            if active is None and self.current(device) == mode:
+                self._finish(transition, 'done')
+                return transition
+            state.pending = transition
+            self._publish(transition)
+            if state.task is None or state.task.done():
+                state.task = run_coroutine(self._run(state))
+            elif state.wake is not None:
+                get_loop().call_soon_threadsafe(state.wake.set)
+            return transition
+
+    async def _wait_connected(self, state, transition):
+        # device.connected is a plain flag: look again every POLL_INTERVAL or when a newer request arrives
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            # Cleared before looking: a request from here on wakes the wait below
+            state.wake.clear()
+            if state.device.connected or state.pending is not transition or loop.time() >= deadline:
+                return
+            try:
+                await asyncio.wait_for(state.wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, state):
+        state.wake = asyncio.Event()
+        device = state.device
+        while True:
+            with state.lock:
+                if state.pending is None:
+                    state.task = None
+                    return
+                transition = state.pending
+
+            if not device.connected:
+                transition.state = 'waiting'
+                self._publish(transition)
+                await self._wait_connected(state, transition)
+                with state.lock:
+                    if state.pending is not transition:
+                        continue  # superseded while waiting
+                    if not device.connected:
+                        state.pending = None
+                        self._finish(transition, 'failed', 'device did not connect')
+                        continue
+
+            with state.lock:
+                if state.pending is not transition:
+                    continue
+                state.pending = None
+                state.active = transition
+            transition.state = 'applying'
+            self._publish(transition)
+            try:
+                await run_blocking(self.apply, transition.mode, device)
+            except Exception as e:
+                print(f"\033[91mMode change to {transition.mode} failed on {device.id}: {e}\033[0m")
+                with state.lock:
+                    state.active = None
+                self._finish(transition, 'failed', str(e))
+                continue
+            with state.lock:
+                state.active = None
+            self._finish(transition, 'done')
+
+    def get(self, transition_id):
+        with self._lock:
+            return self._transitions.get(transition_id)
+
+    def status(self, device):
+        state = self._state(device)
+        with state.lock:
+            return {
+                'device': device.id,
+                'mode': self.current(device),
+                'auto_running': device.auto_running(),
+                'active': state.active.describe() if state.active else None,
+                'pending': state.pending.describe() if state.pending else None,
+            }
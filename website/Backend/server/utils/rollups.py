@@ -0,0 +1,158 @@
+"""1 min / 15 min / 1 h rollups of every sample, kept up to date as samples arrive.
+
+Each bucket holds min, max, mean and count of temperature and humidity and
+the duty cycle of every actuator (the share of the covered time it was on,
+from the confirmed state at each sample). Rollups see every sample, before
+compression. The open bucket of each resolution lives in memory and is
+written to the local store when the next one starts, so a long-range chart
+reads a few hundred rows instead of scanning the raw history.
+"""
+import threading
+
+RESOLUTIONS = (60, 900, 3600)  # seconds
+CHANNELS = ('temperature', 'humidity')
+ACTUATORS = ('heater', 'fan', 'hum', 'motor')
+MAX_INTERVAL = 60.0  # a longer gap between samples is an outage, not time the actuators spent on or off
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value else None
+
+
+class Bucket:
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.channels = {name: [0, None, None, 0.0] for name in CHANNELS}  # n, min, max, sum
+        self.covered = 0.0
+        self.on = dict.fromkeys(ACTUATORS, 0.0)
+
+    def add(self, values, dt, flags):
+        self.count += 1
+        for name, value in values.items():
+            if value is None:
+                continue
+            stats = self.channels[name]
+            stats[0] += 1
+            stats[1] = value if stats[1] is None else min(stats[1], value)
+            stats[2] = value if stats[2] is None else max(stats[2], value)
+            stats[3] += value
+        if dt:
+            self.covered += dt
+            for name in ACTUATORS:
+                if flags.get(name):
+                    self.on[name] += dt
+
+    def row(self, device, resolution):
+        row = {'device': device, 'resolution': resolution, 'bucket': self.start, 'count': self.count,
+               'covered': self.covered}
+        for name, (n, low, high, total) in self.channels.items():
+            row[f'{name}_count'] = n
+            row[f'{name}_min'] = low
+            row[f'{name}_max'] = high
+            row[f'{name}_mean'] = total / n if n else None
+        for name in ACTUATORS:
+            row[f'{name}_on'] = self.on[name]
+        return row
+
+
+class Rollups:
+    """The open buckets of one device; closed ones go to `store.upsert_rollups`."""
+
+    def __init__(self, device_id, store_factory, resolutions=RESOLUTIONS):
+        self.device = device_id
+        self.resolutions = resolutions
+        self._store_factory = store_factory
+        self._open = {}
+        self._last = None  # (time, actuator flags) of the previous sample
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def add(self, t, temperature, humidity, flags):
+        values = {'temperature': _number(temperature), 'humidity': _number(humidity)}
+        with self._lock:
+            dt = 0.0
+            previous = self._last
+            if previous is not None and 0 < t - previous[0] <= MAX_INTERVAL:
+                dt = t - previous[0]
+            # The time since the previous sample is counted with the state the actuators had during it
+            prior = previous[1] if previous is not None else {}
+            if previous is None or t >= previous[0]:
+                self._last = (t, dict(flags))
+            closed = []
+            for resolution in self.resolutions:
+                start = t - t % resolution
+                bucket = self._open.get(resolution)
+                if bucket is None or start > bucket.start:
+                    if bucket is not None:
+                        closed.append(bucket.row(self.device, resolution))
+                    bucket = self._open[resolution] = Bucket(start)
+                elif start < bucket.start:
+                    # Late sample for a bucket already written: merged into the stored row
+                    late = Bucket(start)
+                    late.add(values, 0.0, prior)
+                    closed.append(late.row(self.device, resolution))
+                    continue
+                bucket.add(values, dt, prior)
+        if closed:
+            self._write(closed)
+
+    def _write(self, rows):
+        try:
+            self._store_factory().upsert_rollups(rows)
+            self.written += len(rows)
+        except Exception as e:
+            print(f"\033[91mError while saving rollups: {e}\033[0m")
+
+    def flush(self):
+        # Write the open buckets (partial) so a restart merges into them instead of losing them
+        with self._lock:
+            rows = [bucket.row(self.device, resolution) for resolution, bucket in self._open.items()]
+            self._open = {}
+        if rows:
+            self._write(rows)
+
+    def open_rows(self, resolution, start=None, end=None):
+        with self._lock:
+            bucket = self._open.get(resolution)
+            if bucket is None or (start is not None and bucket.start + resolution <= start) or (end is not None and bucket.start > end):
+                return []
+            return [bucket.row(self.device, resolution)]
+
+
+def merge(a, b):
+    """Two rows of the same bucket combined, as the store's upsert does."""
+    merged = dict(a)
+    for name in CHANNELS:
+        n = a[f'{name}_count'] + b[f'{name}_count']
+        values = [(r[f'{name}_mean'], r[f'{name}_count']) for r in (a, b) if r[f'{name}_count']]
+        merged[f'{name}_count'] = n
+        merged[f'{name}_mean'] = sum(mean * count for mean, count in values) / n if n else None
+        merged[f'{name}_min'] = min((r[f'{name}_min'] for r in (a, b) if r[f'{name}_min'] is not None), default=None)
+        merged[f'{name}_max'] = max((r[f'{name}_max'] for r in (a, b) if r[f'{name}_max'] is not None), default=None)
+    for key in ('count', 'covered') + tuple(f'{name}_on' for name in ACTUATORS):
+        merged[key] = a[key] + b[key]
+    return merged
+
+
+def to_point(row):
+    """A stored rollup row as a chart point: means at the bucket start, plus min/max, count and duty cycles."""
+    point = {'timestamp': row['bucket'], 'count': row['count']}
+    for name in CHANNELS:
+        point[name] = row[f'{name}_mean']
+        point[f'{name}_min'] = row[f'{name}_min']
+        point[f'{name}_max'] = row[f'{name}_max']
+    covered = row['covered']
+    for name in ACTUATORS:
+        point[f'{name}_duty'] = row[f'{name}_on'] / covered if covered else None
+    return point
+
+
+def choose_resolution(span, points, raw_count):
+    """Raw rows if they fit the point budget, else the finest rollup that does (1 h at most)."""
+    if raw_count <= points:
+        return 0
+    for resolution in RESOLUTIONS:
+        if span / resolution <= points:
+            return resolution
+    return RESOLUTIONS[-1]
@@ -0,0 +1,249 @@
+"""Timed actuator jobs of every incubator: egg rotation and ventilation bursts.
+
+All jobs sit in one heap ordered by their next run (wall-clock time) and
+are run by a single task on the shared event loop, which sleeps until the
+earliest one is due. Periodic jobs keep the phase `first_run + n * interval`.
+After a clock jump or a suspend the overdue jobs run once and the missed
+runs are counted, not replayed. After a backwards jump every job moves
+back with the clock, so none waits longer than it had left.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from utils.egg_profiles import egg_profiles
+from utils.loop import get_loop, run_coroutine
+
+MAX_SLEEP = 30.0  # the loop's timers stop during a suspend; look at the wall clock at least this often
+JUMP_TOLERANCE = 5.0  # seconds the wall clock may drift from the monotonic one before it counts as a jump
+
+# Profile keys read for each job (minutes between runs, seconds the actuator stays on) and their defaults
+JOBS = {
+    'rotation': {'actuator': 'motor', 'interval_key': 'rotation_interval', 'duration_key': 'rotation_duration',
+                 'interval': 120, 'duration': 10},
+    # Only for egg profiles that set ventilation_interval; the duration may fall back to its default
+    'ventilation': {'actuator': 'fan', 'interval_key': 'ventilation_interval', 'duration_key': 'ventilation_duration',
+                    'interval': 60, 'duration': 30, 'optional': True},
+}
+
+_seq = itertools.count()
+
+
+class Job:
+    def __init__(self, device_id, name, action, next_run, interval=None):
+        self.id = f'{device_id}:{name}'
+        self.device = device_id
+        self.name = name
+        self.action = action
+        self.interval = interval  # seconds; None for a one-shot job
+        self.next_run = next_run
+        self.runs = 0
+        self.missed = 0
+        self.last_run = None
+        self.last_lateness = None
+        self.last_error = None
+        self.cancelled = False
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'device': self.device,
+            'name': self.name,
+            'interval': self.interval,
+            'next_run': self.next_run,
+            'last_run': self.last_run,
+            'runs': self.runs,
+            'missed': self.missed,
+            'last_lateness': self.last_lateness,
+            'last_error': self.last_error,
+        }
+
+
+class JobScheduler:
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wake = None
+        self._task = None
+        self._clock = None  # (wall, monotonic) when the loop last looked
+        self.jumps = 0
+
+    def start(self):
+        with self._lock:
+            if self._task is None or self._task.done():
+                self._task = run_coroutine(self._run())
+
+    def add(self, job):
+        with self._lock:
+            old = self._jobs.get(job.id)
+            if old is not None:
+                old.cancelled = True
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.next_run, next(_seq), job))
+        self.start()
+        self._notify()
+
+    def once(self, device_id, name, delay, action):
+        job = Job(device_id, name, action, time.time() + delay)
+        self.add(job)
+        return job
+
+    def every(self, device_id, name, interval, action, first_run=None):
+        job = Job(device_id, name, action, first_run or time.time() + interval, interval)
+        self.add(job)
+        return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.cancelled = True
+        return job
+
+    def cancel_device(self, device_id):
+        with self._lock:
+            ids = [job_id for job_id, job in self._jobs.items() if job.device == device_id]
+        for job_id in ids:
+            self.cancel(job_id)
+
+    def jobs(self, device_id=None):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if device_id is None or job.device == device_id]
+        return sorted((job.describe() for job in jobs), key=lambda job: job['next_run'])
+
+    def stats(self):
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'jobs': len(self._jobs),
+            'heap': len(self._heap),
+            'clock_jumps': self.jumps,
+        }
+
+    def _notify(self):
+        wake = self._wake
+        if wake is not None:
+            get_loop().call_soon_threadsafe(wake.set)
+
+    def _check_clock(self, now):
+        # Wall and monotonic clocks advance together unless the clock was set or the machine slept
+        mono = time.monotonic()
+        if self._clock is not None:
+            skew = (now - self._clock[0]) - (mono - self._clock[1])
+            if abs(skew) > JUMP_TOLERANCE:
+                self.jumps += 1
+                print(f"\033[93m[WARN] Clock jumped by {skew:+.0f} s, rescheduling timed jobs\033[0m")
+                if skew < 0:
+                    self._shift(skew)
+        self._clock = (now, mono)
+
+    def _shift(self, skew):
+        # Back in time: keep what every job had left to wait
+        with self._lock:
+            for job in self._jobs.values():
+                job.next_run += skew
+            self._heap = [(job.next_run, next(_seq), job) for job in self._jobs.values()]
+            heapq.heapify(self._heap)
+
+    def _due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                at, _, job = heapq.heappop(self._heap)
+                # Stale entries of cancelled or rescheduled jobs are dropped here
+                if job.cancelled or at != job.next_run:
+                    continue
+                due.append(job)
+        return due
+
+    def _reschedule(self, job, now):
+        with self._lock:
+            if job.cancelled:
+                return
+            if job.interval is None:
+                self._jobs.pop(job.id, None)
+                return
+            missed = int((now - job.next_run) // job.interval)
+            job.missed += missed
+            job.next_run += (missed + 1) * job.interval
+            heapq.heappush(self._heap, (job.next_run, next(_seq), job))
+
+    def _fire(self, job, now):
+        job.runs += 1
+        job.last_run = now
+        job.last_lateness = now - job.next_run
+        try:
+            job.action()
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            print(f"\033[91mScheduled job {job.id} failed: {e}\033[0m")
+        self._reschedule(job, now)
+
+    async def _run(self):
+        self._wake = asyncio.Event()
+        while True:
+            # Cleared first: a job added from here on wakes the wait below
+            self._wake.clear()
+            now = time.time()
+            self._check_clock(now)
+            for job in self._due(now):
+                self._fire(job, now)
+            with self._lock:
+                delay = self._heap[0][0] - time.time() if self._heap else MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wake.wait(), min(max(delay, 0.0), MAX_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+
+
+scheduler = JobScheduler()
+
+
+def _positive(profile, key, default):
+    value = profile.get(key)
+    return float(value) if isinstance(value, (int, float)) and value > 0 else float(default)
+
+
+def plan(device):
+    """(Re)create the rotation and ventilation jobs of `device` from its egg profile.
+
+    A job whose interval did not change keeps its next run, so saving the
+    same profile again does not shift the rotation phase. Optional jobs
+    (ventilation) only run for profiles that define their interval.
+    """
+    profile = egg_profiles.get(device.egg_type)
+    current = {job['name']: job for job in scheduler.jobs(device.id)}
+    for name, spec in JOBS.items():
+        if spec.get('optional') and _positive(profile, spec['interval_key'], 0) == 0:
+            if name in current:
+                # The new profile has none: stop the job and end a burst in progress
+                scheduler.cancel(f'{device.id}:{name}')
+                scheduler.cancel(f'{device.id}:{name}-end')
+                device.actuators.release(spec['actuator'])
+            continue
+        interval = _positive(profile, spec['interval_key'], spec['interval']) * 60
+        duration = min(_positive(profile, spec['duration_key'], spec['duration']), interval / 2)
+        previous = current.get(name)
+        if previous is not None and previous['interval'] == interval:
+            first_run = previous['next_run']
+        elif previous is not None and previous['last_run']:
+            first_run = max(previous['last_run'] + interval, time.time())
+        else:
+            first_run = None
+        scheduler.every(device.id, name, interval, _burst(device, name, spec['actuator'], duration), first_run)
+
+
+def _burst(device, name, actuator, duration):
+    def run():
+        device.actuators.hold(actuator, True, name)
+        scheduler.once(device.id, f'{name}-end', duration, lambda: device.actuators.release(actuator))
+    return run
+
+
+def unplan(device):
+    # Cancels the jobs and ends any burst in progress
+    scheduler.cancel_device(device.id)
+    device.actuators.release_all()
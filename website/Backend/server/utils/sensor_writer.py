@@ -0,0 +1,315 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from integration.supabase import get_client
+from utils.paths import data_path
+from utils.controller import DEFAULT_DEVICE
+from utils.metrics import supabase_insert_failures, supabase_insert_seconds, supabase_quarantined_rows, supabase_rows
+
+BATCH_SIZE = 50
+MAX_BATCH_AGE = 10.0
+MAX_QUEUE = 2000
+MAX_OVERFLOW = 10000  # rows waiting for the writer thread to spill them once the queue is full; beyond, dropped
+REPLAY_INTERVAL = 30.0
+# PostgreSQL error classes the table answers for a row it will never accept:
+# bad value (22), constraint violated (23), unknown column or type (42, except 42501 insufficient privilege)
+PERMANENT_SQLSTATE = ('22', '23', '42')
+RETRYABLE_STATUS = (401, 403, 408, 429)  # credentials, timeouts and rate limits get better on their own
+
+
+def to_row(sample):
+    acquired = sample.get('timestamp') or time.time()
+    row = {
+        'temperature': sample.get('temperature'),
+        'humidity': sample.get('humidity'),
+        'created_at': datetime.fromtimestamp(acquired, timezone.utc).isoformat(),
+    }
+    # Single-incubator setups keep the original sensor_data columns; others need
+    # sensor_data.device_id (supabase_sensor_data_device_id.sql)
+    device = sample.get('device')
+    if device and device != DEFAULT_DEVICE:
+        row['device_id'] = device
+    return row
+
+
+def permanent_error(error):
+    """Whether Supabase refused the rows themselves (retrying can't help), not the connection."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        # PostgREST answered with a non-JSON body: only the HTTP status is known
+        return 400 <= code < 500 and code not in RETRYABLE_STATUS
+    if not isinstance(code, str) or code == '42501':
+        return False
+    if code.startswith('PGRST'):
+        # PGRST1xx request and PGRST2xx schema errors; PGRST3xx are JWT (credentials) errors
+        return code[5:6] in ('1', '2')
+    return code[:2] in PERMANENT_SQLSTATE
+
+
+class SensorWriter:
+    """Background stage that persists samples to Supabase in bulk.
+
+    Samples are queued without blocking the reader and flushed as one insert
+    once `batch_size` rows are waiting or the oldest row is `max_age` seconds
+    old. Batches that cannot be written go to an on-disk outbox (JSON lines)
+    which is replayed once the cloud accepts inserts again. When the queue
+    is full, rows wait in a bounded overflow list that the writer thread
+    spills to the outbox: the submitting thread never touches the disk.
+
+    Rows are inserted one device at a time, so one incubator's rows never
+    fail another's. Rows the table refuses outright (bad value, missing
+    column: see `permanent_error`) are isolated by splitting the batch and
+    moved to a quarantine file instead of being retried forever.
+    """
+
+    def __init__(self, table='sensor_data', batch_size=BATCH_SIZE, max_age=MAX_BATCH_AGE,
+                 max_queue=MAX_QUEUE, outbox=None):
+        self.table = table
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.outbox = outbox or data_path('outbox', f'{table}.jsonl')
+        self.quarantine = os.path.splitext(self.outbox)[0] + '.quarantine.jsonl'
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._overflow = deque()
+        self._overflow_lock = threading.Lock()
+        self._outbox_lock = threading.Lock()
+        self._outbox_count = self._count_outbox()  # kept up to date, so stats() never reads the files
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_replay = 0.0
+
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.spilled_rows = 0
+        self.dropped_rows = 0
+        self.replayed_rows = 0
+        self.quarantined_rows = 0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'writer-{self.table}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)  # wake the thread instead of waiting out its timeout
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, sample):
+        row = to_row(sample)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Never block acquisition: the writer thread spills the overflow to the outbox
+            with self._overflow_lock:
+                if len(self._overflow) < MAX_OVERFLOW:
+                    self._overflow.append(row)
+                    return
+                self.dropped_rows += 1
+            if self.dropped_rows == 1 or self.dropped_rows % 1000 == 0:
+                print(f"\033[91mSupabase writer overflow full, {self.dropped_rows} rows dropped\033[0m")
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'overflow_rows': len(self._overflow),
+            'outbox_rows': self._outbox_count,
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes,
+            'spilled_rows': self.spilled_rows,
+            'dropped_rows': self.dropped_rows,
+            'replayed_rows': self.replayed_rows,
+            'quarantined_rows': self.quarantined_rows,
+            'quarantine': self.quarantine if self.quarantined_rows else None,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'last_error': self.last_error,
+            'running': self.is_alive(),
+        }
+
+    def _run(self):
+        batch = []
+        first_at = None
+        while not self._stop.is_set():
+            timeout = self.max_age if first_at is None else max(0.0, first_at + self.max_age - time.monotonic())
+            try:
+                row = self._queue.get(timeout=timeout)
+                if row is not None:
+                    batch.append(row)
+                    if first_at is None:
+                        first_at = time.monotonic()
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.batch_size or time.monotonic() - first_at >= self.max_age):
+                self._flush(batch)
+                batch = []
+                first_at = None
+            self._spill_overflow()
+            if time.monotonic() - self._last_replay >= REPLAY_INTERVAL:
+                self._replay()
+
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not None:
+                batch.append(row)
+        if batch:
+            self._flush(batch)
+        self._spill_overflow()
+
+    def _spill_overflow(self):
+        with self._overflow_lock:
+            rows = list(self._overflow)
+            self._overflow.clear()
+        if rows:
+            self._spill(rows)
+
+    def _insert(self, rows):
+        started = time.perf_counter()
+        get_client().table(self.table).insert(rows).execute()
+        latency = time.perf_counter() - started
+        supabase_insert_seconds.observe(latency)
+        supabase_rows.inc(len(rows))
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def _deliver(self, rows):
+        """Insert `rows` a device at a time; returns the rows a transient error left unwritten."""
+        groups = {}
+        for row in rows:
+            groups.setdefault(row.get('device_id'), []).append(row)
+        left = []
+        for group in groups.values():
+            # After a transient failure (offline) the other devices are not tried either
+            left += group if left else self._insert_isolating(group)
+        return left
+
+    def _insert_isolating(self, rows):
+        try:
+            self._insert(rows)
+            return []
+        except Exception as e:
+            supabase_insert_failures.inc()
+            self.last_error = str(e)
+            if not permanent_error(e):
+                return rows
+            if len(rows) == 1:
+                self._quarantine(rows, e)
+                return []
+        # Refused: halve the batch until the offending rows are alone
+        half = len(rows) // 2
+        left = self._insert_isolating(rows[:half])
+        return left + rows[half:] if left else self._insert_isolating(rows[half:])
+
+    def _flush(self, rows):
+        left = self._deliver(rows)
+        self.flushed_rows += len(rows) - len(left)
+        if left:
+            self.failed_flushes += 1
+            print(f"\033[91mError while saving to Supabase, {len(left)} rows kept in outbox: {self.last_error}\033[0m")
+            self._spill(left)
+            return False
+        self.last_error = None
+        return True
+
+    def _quarantine(self, rows, error):
+        with self._outbox_lock:
+            with open(self.quarantine, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps({'row': row, 'error': str(error)}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        self.quarantined_rows += len(rows)
+        supabase_quarantined_rows.inc(len(rows))
+        print(f"\033[91mSupabase refused {len(rows)} row(s), moved to {self.quarantine}: {error}\033[0m")
+
+    def _spill(self, rows):
+        with self._outbox_lock:
+            with open(self.outbox, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._outbox_count += len(rows)
+        self.spilled_rows += len(rows)
+
+    def _count_outbox(self):
+        # Once, at start: rows a previous run left in the outbox and the replay file
+        count = 0
+        for path in (self.outbox, self.outbox + '.replay'):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    count += sum(1 for line in f if line.strip())
+        return count
+
+    def _replay(self):
+        self._last_replay = time.monotonic()
+        pending = self.outbox + '.replay'
+        with self._outbox_lock:
+            if not os.path.exists(pending):
+                if not os.path.exists(self.outbox) or os.path.getsize(self.outbox) == 0:
+                    return
+                # New spills keep going to the outbox while this file is replayed
+                os.replace(self.outbox, pending)
+            with open(pending, 'r', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+
+        for i in range(0, len(rows), self.batch_size):
+            chunk = rows[i:i + self.batch_size]
+            left = self._deliver(chunk)
+            self.replayed_rows += len(chunk) - len(left)
+            with self._outbox_lock:
+                self._outbox_count -= len(chunk) - len(left)
+            if left:
+                # Still offline: keep what is left for the next attempt
+                with self._outbox_lock:
+                    with open(pending + '.tmp', 'w', encoding='utf-8') as f:
+                        for row in left + rows[i + self.batch_size:]:
+                            f.write(json.dumps(row) + '\n')
+                    os.replace(pending + '.tmp', pending)
+                return
+        with self._outbox_lock:
+            os.remove(pending)
+        if rows:
+            print(f"\033[92mReplayed {len(rows)} rows from the outbox\033[0m")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SensorWriter()
+        _writer.start()
+        return _writer
+
+
+def stop_writer():
+    # Flushes the writer if one was started; never starts one just to stop it
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.stop()
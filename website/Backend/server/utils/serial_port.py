@@ -0,0 +1,304 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import serial
+
+from utils.frames import FrameParser
+
+# Replies the firmware may send back for a command, e.g. "OK H0" or "ACK:H0"
+ACK_PREFIXES = ('OK', 'ACK')
+
+COMMAND_TIMEOUT = 1.0
+RECONNECT_DELAY = 2.0
+CLOSE_TIMEOUT = 2.0  # seconds close() waits for the reader and writer threads
+# Wait for the firmware's acknowledgement before a command counts as done; without it, done means written.
+# Per device with the `expectAck` setting, INCUBATOR_EXPECT_ACK=1 for every port without one
+EXPECT_ACK = os.environ.get('INCUBATOR_EXPECT_ACK', '').lower() in ('1', 'true', 'yes')
+
+
+class SerialCommand:
+    def __init__(self, payload):
+        self.payload = payload
+        self.done = threading.Event()
+        self.ok = False
+        self.error = None
+        self.queued_at = time.monotonic()
+        self.sent_at = None
+        self.acked_at = None
+        # A frame may carry several actuator commands (b'H0F1'); the firmware acks each one
+        self.unacked = {payload[i:i + 2].decode('ascii', errors='replace') for i in range(0, len(payload), 2)}
+        self._lock = threading.Lock()
+
+    def resolve(self, ok, error=None):
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self.ok = ok
+            self.error = error
+            self.acked_at = time.monotonic()
+            self.done.set()
+            return True
+
+    @property
+    def latency(self):
+        if self.acked_at is None:
+            return None
+        return self.acked_at - self.queued_at
+
+
+class SerialPortManager:
+    """Single owner of one serial port.
+
+    The port is opened once and kept open. A reader thread parses frames out
+    of whatever bytes arrived and hands every sample to the registered
+    handlers, and a writer thread drains the command queue so actuator
+    writes never reopen (and reset) the board. When the port is reopened
+    after an I/O error the reconnect handlers run: the board was reset, so
+    whatever was commanded before is gone.
+    """
+
+    def __init__(self, port, baudrate, expect_ack=EXPECT_ACK, ack_timeout=COMMAND_TIMEOUT):
+        self.port = port
+        self.baudrate = baudrate
+        self.expect_ack = expect_ack
+        self.ack_timeout = ack_timeout
+        self.connected = False
+
+        self._ser = None
+        self._open_lock = threading.Lock()
+        self._commands = queue.Queue()
+        self._awaiting_ack = deque()  # written commands waiting for their ack; shared by reader and writer
+        self._ack_lock = threading.Lock()
+        self._sample_handlers = []
+        self._reconnect_handlers = []
+        self._opens = 0
+        self.parser = FrameParser(ACK_PREFIXES)
+        self._stop = threading.Event()
+        self._reader = None
+        self._writer = None
+
+    def open(self):
+        reopened = False
+        with self._open_lock:
+            # Checked under the lock close() drops the port with: a closed manager never reopens it
+            if self._stop.is_set():
+                raise serial.SerialException(f'{self.port} is closed')
+            if self._ser is None or not self._ser.is_open:
+                self._ser = serial.Serial(self.port, self.baudrate, timeout=0.1, write_timeout=self.ack_timeout)
+                self.connected = True
+                self._opens += 1
+                reopened = self._opens > 1
+                print(f"\033[92m[INFO] Opened serial port: {self.port} @ {self.baudrate}\033[0m")
+            ser = self._ser
+        if reopened:
+            # Outside the lock: a handler may queue commands right away
+            for handler in list(self._reconnect_handlers):
+                try:
+                    handler()
+                except Exception as e:
+                    print(f"\033[91mSerial reconnect handler error: {e}\033[0m")
+        return ser
+
+    def start(self):
+        self._stop.clear()
+        self.open()
+        if self._reader is None or not self._reader.is_alive():
+            self._reader = threading.Thread(target=self._read_loop, name=f'serial-read-{self.port}', daemon=True)
+            self._reader.start()
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name=f'serial-write-{self.port}', daemon=True)
+            self._writer.start()
+
+    def close(self):
+        self._stop.set()
+        self._drop_connection()
+        for thread in (self._reader, self._writer):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(CLOSE_TIMEOUT)
+                if thread.is_alive():
+                    print(f"\033[93m[WARN] {thread.name} did not stop within {CLOSE_TIMEOUT:.0f} s\033[0m")
+        while True:
+            try:
+                self._commands.get_nowait().resolve(False, 'port closed')
+            except queue.Empty:
+                break
+
+    def add_sample_handler(self, handler):
+        if handler not in self._sample_handlers:
+            self._sample_handlers.append(handler)
+
+    def remove_sample_handler(self, handler):
+        if handler in self._sample_handlers:
+            self._sample_handlers.remove(handler)
+
+    def add_reconnect_handler(self, handler):
+        if handler not in self._reconnect_handlers:
+            self._reconnect_handlers.append(handler)
+
+    def remove_reconnect_handler(self, handler):
+        if handler in self._reconnect_handlers:
+            self._reconnect_handlers.remove(handler)
+
+    def has_sample_handlers(self):
+        return bool(self._sample_handlers)
+
+    def stats(self):
+        return {'port': self.port, 'connected': self.connected, 'expect_ack': self.expect_ack, 'reconnects': max(0, self._opens - 1), **self.parser.stats()}
+
+    def is_running(self):
+        return not self._stop.is_set() and self._reader is not None and self._reader.is_alive()
+
+    def submit(self, payload):
+        command = SerialCommand(payload)
+        if self._stop.is_set():
+            command.resolve(False, 'port closed')
+        else:
+            self._commands.put(command)
+        return command
+
+    def send(self, payload, timeout=None):
+        command = self.submit(payload)
+        if not command.done.wait(self.ack_timeout if timeout is None else timeout):
+            # A command that missed its deadline is not written late
+            command.resolve(False, 'timeout')
+        return command
+
+    def _drop_connection(self):
+        with self._open_lock:
+            if self._ser is not None:
+                try:
+                    self._ser.close()
+                except serial.SerialException:
+                    pass
+            self._ser = None
+            self.connected = False
+        with self._ack_lock:
+            while self._awaiting_ack:
+                self._awaiting_ack.popleft().resolve(False, 'connection lost')
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                ser = self.open()
+                # Everything already received in one call, or block briefly for the next byte
+                chunk = ser.read(ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._stop.is_set():
+                    break  # closed under our feet by close()
+                print(f"\033[93m[WARN] Serial read failed on {self.port}: {e}\033[0m")
+                self._drop_connection()
+                self.parser.reset()
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+            self._expire_acks()
+            if not chunk:
+                continue
+            for kind, value in self.parser.feed(chunk):
+                if kind == 'ack':
+                    self._match_ack(value)
+                else:
+                    self._dispatch(value)
+
+    def _dispatch(self, sample):
+        for handler in list(self._sample_handlers):
+            try:
+                handler(sample)
+            except Exception as e:
+                print(f"\033[91mSerial sample handler error: {e}\033[0m")
+
+    def _match_ack(self, line):
+        reply = line.replace(':', ' ').split()
+        payload = reply[1] if len(reply) > 1 else None
+        with self._ack_lock:
+            for command in list(self._awaiting_ack):
+                if command.done.is_set():
+                    self._awaiting_ack.remove(command)
+                    continue
+                if payload is None or payload == command.payload.decode('ascii'):
+                    command.unacked.clear()
+                elif payload in command.unacked:
+                    command.unacked.discard(payload)
+                else:
+                    continue
+                if not command.unacked:
+                    self._awaiting_ack.remove(command)
+                    command.resolve(True)
+                return True
+        return False
+
+    def _expire_acks(self):
+        now = time.monotonic()
+        with self._ack_lock:
+            while self._awaiting_ack and now - self._awaiting_ack[0].sent_at > self.ack_timeout:
+                self._awaiting_ack.popleft().resolve(False, 'no acknowledgement')
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            try:
+                command = self._commands.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if command.done.is_set():
+                continue
+            try:
+                ser = self.open()
+                ser.write(command.payload)
+                ser.flush()
+            except (serial.SerialException, OSError) as e:
+                if self._stop.is_set():
+                    command.resolve(False, 'port closed')
+                    break
+                print(f"\033[91mSerial write failed on {self.port}: {e}\033[0m")
+                command.resolve(False, str(e))
+                self._drop_connection()
+                continue
+            command.sent_at = time.monotonic()
+            if self.expect_ack:
+                with self._ack_lock:
+                    self._awaiting_ack.append(command)
+            else:
+                command.resolve(True)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_port_manager(port, baudrate, expect_ack=None):
+    # expect_ack None keeps the manager's current setting (EXPECT_ACK for a new one)
+    if not port or not baudrate:
+        raise ValueError(f'serial port and baud rate are required (got {port!r} @ {baudrate!r})')
+    stale = None
+    with _managers_lock:
+        manager = _managers.get(port)
+        if manager is not None and manager.baudrate != baudrate:
+            stale, manager = manager, None
+        if manager is None:
+            manager = SerialPortManager(port, baudrate)
+            _managers[port] = manager
+        if expect_ack is not None:
+            manager.expect_ack = bool(expect_ack)
+    if stale is not None:
+        # Joins its threads, whose handlers may need this lock; the new manager is not started yet
+        stale.close()
+    return manager
+
+
+def all_port_managers():
+    with _managers_lock:
+        return list(_managers.values())
+
+
+def find_port_manager(port):
+    with _managers_lock:
+        return _managers.get(port)
+
+
+def close_port_manager(port):
+    with _managers_lock:
+        manager = _managers.pop(port, None)
+    if manager is not None:
+        manager.close()
@@ -7,11 +7,13 @@ import serial
 import time
 
 
-from integration.supabase import supabase
-latest_data = {}  # Shared in-memory data
-use_simulation = False  # Will become True if serial connection fails
+from utils.serial_port import get_port_manager
+from utils.sensor_writer import get_writer
+from utils.devices import registry, DEFAULT_DEVICE
+from utils.state_store import state_store
 
-connected = False
+_sample_handlers = {}  # device id -> sample handler registered on its port
+_reconnect_handlers = {}  # device id -> reconnect handler registered on its port
 
 def simulate_data():
     
@@ -25,66 +27,79 @@ def simulate_data():
    
     return latest
 
-def read_serial(port='COM3', baudrate=9600):
-    global latest_data, use_simulation, connected
+def publish_sample(data, device_id=DEFAULT_DEVICE):
+    return registry.get(device_id).publish_sample(data)
+
+
+def add_sample_listener(listener, device_id=DEFAULT_DEVICE):
+    registry.get(device_id).add_listener(listener)
+
+
+def remove_sample_listener(listener, device_id=DEFAULT_DEVICE):
+    registry.get(device_id).remove_listener(listener)
+
+
+def sample_handler(device_id):
+    handler = _sample_handlers.get(device_id)
+    if handler is None:
+        # Frames are parsed (text or binary) by the port manager's FrameParser
+        def handler(sample):
+            publish_sample(sample, device_id)
+        _sample_handlers[device_id] = handler
+    return handler
+
+
+def reconnect_handler(device_id):
+    handler = _reconnect_handlers.get(device_id)
+    if handler is None:
+        # The port was reopened and the board reset its outputs: the desired state is sent again
+        def handler():
+            registry.get(device_id).actuators.invalidate()
+        _reconnect_handlers[device_id] = handler
+    return handler
+
+
+def read_serial(port='COM3', baudrate=9600, device_id=DEFAULT_DEVICE, stop=None):
+    device = registry.get(device_id)
+    stop = stop or threading.Event()
 
     try:
-        ser = serial.Serial(port, baudrate, timeout=2)
+        # The port manager keeps the port open and shares it with the actuator commands
+        manager = get_port_manager(port, baudrate, device.expect_ack)
+        manager.add_sample_handler(sample_handler(device_id))
+        manager.add_reconnect_handler(reconnect_handler(device_id))
+        manager.start()
        
         print(f"\033[92m[INFO] Connected to serial port: {port}\n\033[0m")
-        connected = True
-        while True:
-            line = ser.readline().decode('utf-8').strip()
-            try:
-                temperature, humidity = line.split("|")
-                latest_data = {
-                    "temperature": float(temperature),
-                    "humidity": float(humidity)
-                }
-            except ValueError:
-     
-                print("\033[93mInvalid data format from serial:\n\033[0m")
-
-
-    except serial.SerialException as e:
-      
+        device.connected = True
+
+    except (serial.SerialException, ValueError) as e:
+        # Runs in a supervised thread without a terminal: no prompt, the watchdog retries with backoff
+        device.reader_error = f'{port}: {e}'
         print(f"\033[93m[WARN] Serial connection failed: {e}\n\033[0m")
-        use_simulation = True
-        print("Serial connection failed. Do you want to switch to simulated data? (yes/no): ")
-        user_response = input().strip().lower()
-        while not  user_response : 
-            time.sleep(10)
-            user_response = input().strip().lower()
-        if user_response == "yes":
-            connected = True
-            print("[INFO] Switching to simulated data.\n")
-            while True:
-                latest_data = simulate_data()
-                time.sleep(4)
-        else:
-            print("[INFO] Exiting...\n")
-            user_response = 'no'
+        if not device.simulate_on_failure:
             return
+        device.use_simulation = True
+        device.connected = True
+        print(f"[INFO] Switching to simulated data for {device_id} (simulateOnFailure).\n")
+        while not stop.is_set():
+            publish_sample(simulate_data(), device_id)
+            stop.wait(4)
+        return
+    device.reader_error = None
 
 
-   
-
-
-def start_serial_reader(port='COM3', baudrate=9600):
+def start_serial_reader(port='COM3', baudrate=9600, device_id=DEFAULT_DEVICE, stop=None):
     
-    thread = threading.Thread(target=read_serial, kwargs={'port': port, 'baudrate': baudrate}, daemon=True)
+    thread = threading.Thread(target=read_serial, kwargs={'port': port, 'baudrate': baudrate, 'device_id': device_id, 'stop': stop}, daemon=True)
     thread.start()
+    return thread
     
 
 
-def get_latest_data():
-    global latest_data
-    return latest_data
+def get_latest_data(device_id=DEFAULT_DEVICE):
+    # The newest immutable snapshot's sample; never changes under the caller
+    return state_store.latest_data(device_id)
 def save_data_to_supabase(data):
-    supabase.table('sensor_data').insert({
-        'temperature': data.get('temperature'),
-        'humidity': data.get('humidity')
-    }).execute()
-
-
-
+    # Queued for the background writer; never blocks the caller on the network
+    get_writer().submit(data)
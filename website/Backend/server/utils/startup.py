@@ -0,0 +1,50 @@
+"""Startup timeline of the backend, served by /api/ready.
+
+Times are measured from the first import of this module, which app.py
+does before anything else; interpreter start-up itself is covered by
+benchmarks/startup.py. The backend is ready once every condition passed
+to `wait_for()` is `done()` (the server listens, the egg presets loaded).
+"""
+import time
+
+STARTED = time.time()
+
+_phases = []
+_ready_at = None
+_pending = set()
+
+
+def mark(phase):
+    _phases.append((phase, time.time()))
+
+
+def wait_for(*conditions):
+    _pending.update(conditions)
+
+
+def done(condition):
+    mark(condition)
+    _pending.discard(condition)
+    if not _pending and _ready_at is None:
+        ready()
+
+
+def ready():
+    global _ready_at
+    mark('ready')
+    _ready_at = _phases[-1][1]
+    print(f"\033[92m[INFO] Backend ready in {_ready_at - STARTED:.2f} s\033[0m")
+
+
+def is_ready():
+    return _ready_at is not None
+
+
+def report():
+    return {
+        'ready': is_ready(),
+        'waiting_for': sorted(_pending),
+        'started_at': STARTED,
+        'uptime': time.time() - STARTED,
+        'phases': {phase: round(at - STARTED, 4) for phase, at in _phases},
+    }
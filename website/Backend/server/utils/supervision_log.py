@@ -0,0 +1,255 @@
+"""Append-only binary supervision log: one fixed-width record per sample.
+
+A record is 16 bytes: acquisition time (float64, epoch seconds),
+temperature and humidity (int16, hundredths) and the actuator flags
+(uint8), padded to 16. A 21-day run at 1 Hz is under 30 MB.
+
+Each device writes to data/supervision/<device>/ in segments named after
+their first timestamp; a segment is closed and a new one started once it
+reaches `max_segment_bytes`. The reader memory-maps the segments that
+overlap a time range and bisects each one.
+
+    python -m utils.supervision_log import ../../../../incubator_log.csv --interval 4
+    python -m utils.supervision_log dump --from 2025-07-01T00:00 --limit 20
+"""
+import argparse
+import ast
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from utils.controller import DEFAULT_DEVICE
+from utils.paths import data_path
+
+MAGIC = b'INCLOG01'
+HEADER = struct.Struct('<8sHH4x')  # magic, version, record size
+RECORD = struct.Struct('<dhhB3x')  # timestamp, temperature, humidity (hundredths), flags
+RECORD_DTYPE = np.dtype([('timestamp', '<f8'), ('temperature', '<i2'), ('humidity', '<i2'), ('flags', 'u1'), ('pad', 'V3')])
+VERSION = 1
+MISSING = -32768  # int16 stand-in for a missing value
+
+FLAGS = ('motor', 'heater', 'fan', 'hum')  # bit 0..3
+MAX_SEGMENT_BYTES = 16 * 1024 * 1024
+FLUSH_INTERVAL = 1.0  # seconds between flushes, so readers see recent records
+
+
+def pack_flags(actuators):
+    flags = 0
+    for bit, name in enumerate(FLAGS):
+        if actuators.get(name):
+            flags |= 1 << bit
+    return flags
+
+
+def unpack_flags(flags):
+    return {name: bool(flags >> bit & 1) for bit, name in enumerate(FLAGS)}
+
+
+def _hundredths(value):
+    if value is None or value != value:
+        return MISSING
+    return max(-32767, min(32767, int(round(value * 100))))
+
+
+def _value(raw):
+    return None if raw == MISSING else raw / 100.0
+
+
+def log_dir(device_id=DEFAULT_DEVICE):
+    # Device ids come from requests: keep them to one plain directory name
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', str(device_id)).lstrip('.') or DEFAULT_DEVICE
+    return os.path.dirname(data_path('supervision', safe, 'x'))
+
+
+class SupervisionLog:
+    def __init__(self, directory, max_segment_bytes=MAX_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._size = 0
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        self.records = 0
+        self.rotations = 0
+
+    def _open(self, timestamp):
+        name = os.path.join(self.directory, f'{int(timestamp * 1000):013d}.bin')
+        self._file = open(name, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._size = self._file.tell()
+
+    def append(self, timestamp, temperature, humidity, actuators):
+        record = RECORD.pack(timestamp, _hundredths(temperature), _hundredths(humidity), pack_flags(actuators))
+        with self._lock:
+            if self._file is None or self._size + RECORD.size > self.max_segment_bytes:
+                if self._file is not None:
+                    self._file.close()
+                    self.rotations += 1
+                self._open(timestamp)
+            self._file.write(record)
+            self._size += RECORD.size
+            self.records += 1
+            now = time.monotonic()
+            if now - self._flushed_at >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = now
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.endswith('.bin'))
+    return [(int(n[:-4]) / 1000.0, os.path.join(directory, n)) for n in names]
+
+
+def _records(path, start, end):
+    """Records of one segment with start <= timestamp <= end (a copy, the map is closed)."""
+    size = os.path.getsize(path)
+    count = (size - HEADER.size) // RECORD.size  # a torn last record is ignored
+    if count <= 0:
+        return np.empty(0, RECORD_DTYPE)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, record_size = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f'{path} is not a supervision log segment')
+        records = np.frombuffer(mm, RECORD_DTYPE, count=count, offset=HEADER.size)
+        timestamps = records['timestamp']
+        first = np.searchsorted(timestamps, start, side='left')
+        last = np.searchsorted(timestamps, end, side='right')
+        selected = records[first:last].copy()
+        del records, timestamps  # release the buffer before the map closes
+        return selected
+
+
+def read(directory, start=None, end=None, limit=None):
+    """Records between start and end (epoch seconds), oldest first, as a structured array."""
+    start = float('-inf') if start is None else start
+    end = float('inf') if end is None else end
+    segments = _segments(directory)
+    parts = []
+    total = 0
+    for i, (first_ts, path) in enumerate(segments):
+        next_ts = segments[i + 1][0] if i + 1 < len(segments) else float('inf')
+        if first_ts > end or next_ts < start:
+            continue
+        part = _records(path, start, end)
+        parts.append(part)
+        total += len(part)
+        if limit is not None and total >= limit:
+            break
+    records = np.concatenate(parts) if parts else np.empty(0, RECORD_DTYPE)
+    return records[:limit] if limit is not None else records
+
+
+def to_json(records):
+    temperature = records['temperature']
+    humidity = records['humidity']
+    flags = records['flags']
+    return {
+        'count': len(records),
+        'timestamp': records['timestamp'].tolist(),
+        'temperature': [_value(v) for v in temperature.tolist()],
+        'humidity': [_value(v) for v in humidity.tolist()],
+        **{name: ((flags >> bit) & 1).astype(bool).tolist() for bit, name in enumerate(FLAGS)},
+    }
+
+
+def import_csv(path, log, start=None, interval=4.0):
+    """Convert an incubator_log.csv. Its rows carry no time, so they are spaced `interval` seconds
+    apart, ending at the file's modification time unless `start` is given."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if len(row) >= 2 and row[0] == 'SUPERVISION']
+    if start is None:
+        start = os.path.getmtime(path) - interval * max(0, len(rows) - 1)
+    imported = 0
+    for i, row in enumerate(rows):
+        try:
+            record = ast.literal_eval(row[1])
+        except (ValueError, SyntaxError):
+            print(f"\033[93m[WARN] Skipping unreadable row {i + 1}: {row[1][:40]}\033[0m")
+            continue
+        actuators = dict(record, hum=record.get('valve'))
+        log.append(start + i * interval, record.get('temperature'), record.get('humidity'), actuators)
+        imported += 1
+    log.flush()
+    return imported
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_log(device_id=DEFAULT_DEVICE):
+    with _logs_lock:
+        log = _logs.get(device_id)
+        if log is None:
+            log = SupervisionLog(log_dir(device_id))
+            _logs[device_id] = log
+        return log
+
+
+def close_logs():
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.close()
+
+
+def _time(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary supervision log tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='convert an incubator_log.csv')
+    imp.add_argument('csv')
+    imp.add_argument('--device', default=DEFAULT_DEVICE)
+    imp.add_argument('--interval', type=float, default=4.0, help='seconds between rows')
+    imp.add_argument('--start', help='time of the first row (epoch or ISO); default: ends at the file time')
+    dump = sub.add_parser('dump', help='print records in a time range')
+    dump.add_argument('--device', default=DEFAULT_DEVICE)
+    dump.add_argument('--from', dest='start')
+    dump.add_argument('--to', dest='end')
+    dump.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        log = get_log(args.device)
+        count = import_csv(args.csv, log, _time(args.start), args.interval)
+        log.close()
+        print(f"\033[92mImported {count} records into {log.directory}\033[0m")
+    else:
+        records = read(log_dir(args.device), _time(args.start), _time(args.end), args.limit)
+        for ts, t, h, flags, _ in records.tolist():
+            on = ','.join(name for name, active in unpack_flags(flags).items() if active)
+            print(f"{datetime.fromtimestamp(ts).isoformat(timespec='seconds')}  {_value(t)}  {_value(h)}  {on}")
+
+
+if __name__ == '__main__':
+    main()
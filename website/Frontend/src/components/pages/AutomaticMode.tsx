@@ -7,9 +7,16 @@ import { Button } from '@/components/ui/button';
 import { Zap, Settings, CheckCircle, AlertCircle, Play, Pause } from 'lucide-react';
 import { toast } from 'sonner';
 import { useControlMode } from '@/contexts/ControlModeContext';
+import useApi from '../../hooks/use-api.js';
+
+type ScheduledJob = { name: string; interval: number | null; next_run: number };
+
+const minutesUntil = (timestamp: number) => Math.max(0, Math.round((timestamp - Date.now() / 1000) / 60));
 
 const AutomaticMode = () => {
   const { mode, setMode } = useControlMode();
+  const { getSchedule } = useApi();
+  const [jobs, setJobs] = useState<Record<string, ScheduledJob>>({});
   console.log('AutomaticMode page - Current control mode:', mode);
   
   const [autoSettings, setAutoSettings] = useState({
@@ -36,6 +43,25 @@ const AutomaticMode = () => {
     }
   }, []);
 
+  // Next rotation and ventilation runs, as scheduled by the backend from the egg profile
+  useEffect(() => {
+    if (mode !== 'automatic') return;
+    let cancelled = false;
+    const load = () => {
+      getSchedule()
+        .then((list: ScheduledJob[]) => {
+          if (!cancelled) setJobs(Object.fromEntries(list.map((job) => [job.name, job])));
+        })
+        .catch((error: Error) => console.warn('Failed to load schedule:', error));
+    };
+    load();
+    const timer = setInterval(load, 30000);
+    return () => {
+      cancelled = true;
+      clearInterval(timer);
+    };
+  }, [mode]);
+
   const handleModeToggle = (enabled : boolean) => {
     const newMode = enabled ? "automatic" : "manual";
     setMode(newMode as 'manual' | 'automatic');
@@ -82,13 +108,15 @@ const AutomaticMode = () => {
       id: 'rotationControl',
       name: 'Rotation Control',
       description: 'Automatically rotate eggs at configured intervals',
-      status: 'Next rotation in 45 minutes'
+      status: jobs.rotation ? `Next rotation in ${minutesUntil(jobs.rotation.next_run)} minutes` : 'Waiting for schedule'
     },
     {
       id: 'ventilationControl',
       name: 'Ventilation Control',
       description: 'Automatically control fan operation for air circulation',
-      status: 'Fan cycling every 30 seconds'
+      status: jobs.ventilation
+        ? `Fresh-air burst every ${Math.round((jobs.ventilation.interval ?? 0) / 60)} minutes, next in ${minutesUntil(jobs.ventilation.next_run)}`
+        : 'Waiting for schedule'
     }
   ];
 
@@ -18,7 +18,7 @@ import {
   Egg,
 } from "lucide-react";
 import StatusIndicator from "@/components/StatusIndicator";
-import { supabase } from "../../integration/supabase/supabase";
+import useApi from '../../hooks/use-api.js';
 import { useEggType } from "@/contexts/EggTypeContext";
 import { useSettings } from "@/contexts/SettingsContext";
 import { toast } from "sonner";
@@ -27,7 +27,7 @@ const Dashboard = () => {
   const { getCurrentEggType } = useEggType();
 
   const currentEggType = getCurrentEggType();
- 
+  const { subscribeLive, getHistory } = useApi();
 
 
   const [sensorData, setSensorData] = useState({
@@ -44,7 +44,7 @@ const Dashboard = () => {
     heater: false,
   });
 
-  // Mock real-time data generation
+  // Placeholder until the backend's last 24 h arrive
   const [chartData, setChartData] = useState(() => {
     const data = [];
     for (let i = 23; i >= 0; i--) {
@@ -58,31 +58,52 @@ const Dashboard = () => {
   });
 
   useEffect(() => {
-    const fetchData = async () => {
-      const { data, error } = await supabase
-        .from("sensor_data")
-        .select("*")
-        .order("created_at", { ascending: false })
-        .limit(1);
-
-      if (error) {
-        console.error("Error fetching data:", error);
-      } else {
-        console.log("Data fetched:", data);
-      }
-      console.log(data);
-      setSensorData({
-        targetHumidity: sensorData.targetHumidity,
-        targetTemp: sensorData.targetTemp,
-        temperature: data[0].temperature,
-        humidity: data[0].humidity,
-      });
+    const actuatorKeys: Record<string, keyof typeof actuatorStates> = {
+      fan: "fan",
+      hum: "waterValve",
+      motor: "rotationMotor",
+      heater: "heater",
+    };
+
+    // The backend sends the current state on connect, then every new reading
+    const unsubscribe = subscribeLive({
+      onReading: (latest: { temperature: number; humidity: number }) => {
+        setSensorData((prev) => ({
+          ...prev,
+          temperature: latest.temperature,
+          humidity: latest.humidity,
+        }));
+      },
+      onActuator: ({ name, active }: { name: string; active: boolean }) => {
+        const key = actuatorKeys[name];
+        if (key) setActuatorStates((prev) => ({ ...prev, [key]: active }));
+      },
+    });
+    return unsubscribe;
+  }, []);
+
+  // Last 24 h from the backend's local history, one point per hour
+  useEffect(() => {
+    const now = Date.now() / 1000;
+    let cancelled = false;
+    getHistory(now - 86400, now, 24)
+      .then((rows: { timestamp: number; temperature: number; humidity: number }[]) => {
+        if (cancelled || !rows || rows.length === 0) return;
+        const step = Math.max(1, Math.floor(rows.length / 24));
+        setChartData(
+          rows
+            .filter((_, idx) => idx % step === 0)
+            .map((row) => ({
+              time: new Date(row.timestamp * 1000).toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" }),
+              temperature: row.temperature,
+              humidity: row.humidity,
+            }))
+        );
+      })
+      .catch((error) => console.error("Error loading history:", error));
+    return () => {
+      cancelled = true;
     };
-    fetchData();
-    const interval = setInterval(() => {
-      fetchData();
-    }, 5000);
-    return () => clearInterval(interval);
   }, []);
 
   return (
@@ -15,6 +15,58 @@ const useApi = () => {
         return  data ;
     }
 
+    // Live readings and actuator changes pushed by the backend (Server-Sent Events)
+    const subscribeLive = ({ onReading, onActuator, onMode, onError } = {}) => {
+        const source = new EventSource('http://localhost:3000/api/stream');
+        if (onReading) {
+            source.addEventListener('reading', (event) => onReading(JSON.parse(event.data)));
+        }
+        if (onActuator) {
+            source.addEventListener('actuator', (event) => onActuator(JSON.parse(event.data)));
+        }
+        if (onMode) {
+            // Control-mode transitions: queued, waiting, applying, done, failed or superseded
+            source.addEventListener('mode', (event) => onMode(JSON.parse(event.data)));
+        }
+        if (onError) {
+            source.onerror = onError;
+        }
+        return () => source.close();
+    }
+
+    // With `points`, the backend answers from its 1 min / 15 min / 1 h rollups when raw rows would be more
+    const getHistory = async (from, to, points) => {
+        const params = new URLSearchParams();
+        if (from) params.set('from', String(from));
+        if (to) params.set('to', String(to));
+        if (points) params.set('points', String(points));
+        const response = await fetch(`http://localhost:3000/api/history?${params.toString()}`);
+        if (!response.ok) {
+            throw new Error('Failed to load history');
+        }
+        const { data } = await response.json();
+        return data;
+    }
+
+    // Desired vs board-confirmed actuator state; `pending` lists commands still on their way
+    const getActuators = async () => {
+        const response = await fetch('http://localhost:3000/api/actuators');
+        if (!response.ok) {
+            throw new Error('Failed to load actuator state');
+        }
+        return response.json();
+    }
+
+    // Rotation and ventilation jobs of the automatic mode with their next run (epoch seconds)
+    const getSchedule = async () => {
+        const response = await fetch('http://localhost:3000/api/schedule?device=default');
+        if (!response.ok) {
+            throw new Error('Failed to load schedule');
+        }
+        const { jobs } = await response.json();
+        return jobs;
+    }
+
     const sendSettings = async (settings) => {
         try {
             const response = await fetch('http://localhost:3000/api/settings', {
@@ -39,15 +91,15 @@ const useApi = () => {
 
 
     const getCurrentAutoSettings = async (egg) => {
-        const {data , error } = await supabase
-        .from("egg_type")
-        .select('target_temp, target_hum, rotation_interval')
-        .eq('egg_type', egg);
-        if (error)
-            throw new error ('error while reading egg info')
+        // Served from the backend's egg profile cache, which also works offline
+        const response = await fetch(`http://localhost:3000/api/eggProfiles/${encodeURIComponent(egg)}`);
+        if (response.status === 404)
+            return []
+        if (!response.ok)
+            throw new Error('error while reading egg info')
 
-        
-        return data
+        const { target_temp, target_hum, rotation_interval } = await response.json();
+        return [{ target_temp, target_hum, rotation_interval }]
     }
 
     const sendEggType = async (egg) => {
@@ -88,6 +140,9 @@ const useApi = () => {
             if (!response.ok) {
                 throw new Error('Failed to send current eggtype');
             }
+            // 202: the backend applies the mode once the incubator is connected
+            const { transition } = await response.json();
+            return transition
         }
         
         catch (error){
@@ -95,7 +150,7 @@ const useApi = () => {
         }
     }
 
-    return { getAnalytics, sendSettings , getCurrentAutoSettings , sendEggType , SendMode};
+    return { getAnalytics, subscribeLive, getHistory, getActuators, getSchedule, sendSettings , getCurrentAutoSettings , sendEggType , SendMode};
 };
 
 export default useApi;